@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Benchmark complete configuration runs of a synthetic configuration.
+
+A configuration directory with a number of types (each with a number of
+type explorers and a gencode-remote script) and an initial manifest
+defining a number of objects is generated. Every object requires up to
+--fanout randomly chosen objects defined before it.
+
+The configuration is applied with Config.run to a stand-in target: the
+remote_exec used runs the commands locally, optionally delayed by
+--latency seconds per invocation to simulate the round trip to a real
+target. With --local, the local transport is used instead (commands
+are run directly and files are copied).
+
+The results (objects per second, remote invocations, process counts,
+phase timings and peak RSS) are printed as JSON, so that they can be
+compared between revisions.
+
+Usage: python3 benchmarks/config_run.py [-t TYPES] [-o OBJECTS] ...
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, base_dir)
+
+import skonfig  # noqa: E402
+import skonfig.config  # noqa: E402
+import skonfig.settings  # noqa: E402
+import skonfig.timing  # noqa: E402
+
+from skonfig.exec import (local, remote)  # noqa: E402
+
+exec_path = os.path.join(base_dir, "bin", "skonfig")
+target_host = ("localhost", "localhost", "localhost")
+
+REMOTE_EXEC = """#!/bin/sh -e
+# stand-in for ssh: run the command locally
+shift
+%s
+exec /bin/sh -c "$*"
+"""
+
+# kinds of processes which are round trips to the target
+REMOTE_KINDS = ("remote", "transfer", "tar")
+
+
+def write_file(path, content, mode=0o644):
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def create_conf_dir(path, types, objects, fanout, explorers, seed):
+    for t in range(types):
+        type_path = os.path.join(path, "type", "__bench%u" % (t))
+        os.makedirs(os.path.join(type_path, "parameter"))
+        os.makedirs(os.path.join(type_path, "explorer"))
+        write_file(os.path.join(type_path, "parameter", "optional"),
+                   "value\n")
+        for e in range(explorers):
+            write_file(os.path.join(type_path, "explorer", "e%u" % (e)),
+                       "#!/bin/sh -e\necho %u\n" % (e), 0o755)
+        write_file(os.path.join(type_path, "gencode-remote"),
+                   "#!/bin/sh -e\n"
+                   "echo \"echo \\\"$__object_id\\\" >/dev/null\"\n",
+                   0o755)
+
+    rand = random.Random(seed)
+    names = ["__bench%u/obj%u" % (i % types, i) for i in range(objects)]
+    lines = []
+    for (i, name) in enumerate(names):
+        requirements = rand.sample(names[:i], min(fanout, i))
+        lines.append("require=\"%s\" %s --value %u" % (
+            " ".join(requirements), name.replace("/", " "), i))
+    os.makedirs(os.path.join(path, "manifest"))
+    write_file(os.path.join(path, "manifest", "init"),
+               "\n".join(lines) + "\n")
+
+
+def run_once(temp_dir, conf_dir, remote_exec, jobs, dry_run):
+    """Run the configuration once, using the local transport if remote_exec
+    is None."""
+    settings = skonfig.settings.SettingsContainer()
+    settings.conf_dir = [conf_dir]
+
+    host_path = tempfile.mkdtemp(dir=temp_dir)
+    loc = local.Local(target_host, os.path.join(host_path, "local"),
+                      settings, exec_path=exec_path,
+                      initial_manifest=os.path.join(
+                          conf_dir, "manifest", "init"))
+    loc.cache_path = os.path.join(host_path, "cache")
+    if remote_exec is None:
+        rem = remote.LocalRemote(target_host,
+                                 os.path.join(host_path, "remote"), settings,
+                                 stdout_base_path=loc.stdout_base_path,
+                                 stderr_base_path=loc.stderr_base_path,
+                                 session_path=loc.temp_dir)
+    else:
+        rem = remote.Remote(target_host, remote_exec,
+                            os.path.join(host_path, "remote"), settings,
+                            stdout_base_path=loc.stdout_base_path,
+                            stderr_base_path=loc.stderr_base_path,
+                            session_path=loc.temp_dir)
+    config = skonfig.config.Config(loc, rem, dry_run=dry_run, jobs=jobs)
+
+    start_time = time.time()
+    config.run()
+    seconds = time.time() - start_time
+
+    records = loc.recorder.records()
+    processes = skonfig.timing.account(records)["total"]
+    summary = skonfig.timing.summarise(records, seconds)
+    objects = len(summary["objects"])
+    return {
+        "seconds": seconds,
+        "objects": objects,
+        "objects_per_second": objects / seconds,
+        "remote_invocations": sum(
+            processes[kind]["count"]
+            for kind in REMOTE_KINDS if kind in processes),
+        "processes": {
+            kind: counts["count"] for (kind, counts) in processes.items()},
+        "phases": summary["phases"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-t", "--types", type=int, default=4,
+        help="number of types")
+    parser.add_argument(
+        "-o", "--objects", type=int, default=100,
+        help="number of objects")
+    parser.add_argument(
+        "-f", "--fanout", type=int, default=2,
+        help="number of requirements of every object")
+    parser.add_argument(
+        "-e", "--explorers", type=int, default=2,
+        help="number of type explorers of every type")
+    parser.add_argument(
+        "-l", "--latency", type=float, default=0.0,
+        help="seconds every remote invocation is delayed")
+    parser.add_argument(
+        "--local", action="store_true",
+        help="use the local transport (--latency is ignored)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of jobs of the run")
+    parser.add_argument(
+        "-n", "--dry-run", action="store_true",
+        help="do not run the generated code")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=3,
+        help="number of runs")
+    parser.add_argument(
+        "-s", "--seed", type=int, default=0,
+        help="seed for the random requirements")
+    parser.add_argument(
+        "--output", metavar="file",
+        help="write the results to file instead of stdout")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="skonfig-bench.")
+    try:
+        conf_dir = os.path.join(temp_dir, "conf")
+        create_conf_dir(conf_dir, args.types, args.objects, args.fanout,
+                        args.explorers, args.seed)
+        remote_exec = None
+        if not args.local:
+            remote_exec = os.path.join(temp_dir, "remote-exec")
+            write_file(remote_exec, REMOTE_EXEC % (
+                "sleep %s" % (args.latency) if args.latency > 0 else ""),
+                0o755)
+
+        runs = [
+            run_once(temp_dir, conf_dir, remote_exec, args.jobs,
+                     args.dry_run)
+            for i in range(args.repeat)]
+    finally:
+        shutil.rmtree(temp_dir)
+
+    results = {
+        "benchmark": "config_run",
+        "skonfig_version": skonfig.__version__,
+        "python": platform.python_version(),
+        "parameters": {
+            name: getattr(args, name)
+            for name in ("types", "objects", "fanout", "explorers",
+                         "latency", "local", "jobs", "dry_run",
+                         "seed")},
+        "runs": runs,
+        "median": {
+            name: statistics.median(run[name] for run in runs)
+            for name in ("seconds", "objects_per_second",
+                         "remote_invocations")},
+        # ru_maxrss is in KiB on Linux (but in bytes on macOS)
+        "peak_rss": {
+            "controller": resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss,
+            "children": resource.getrusage(
+                resource.RUSAGE_CHILDREN).ru_maxrss,
+            },
+        }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the throughput and latency of the type emulator.
+
+Emulator invocations are run against the type fixtures of the unit tests
+in a number of scenarios:
+
+singleton         the same singleton object declared over and over
+multi_parameter   objects of a type with all kinds of parameters
+redeclare         the same object declared over and over
+require_chain     objects each requiring the one declared before
+order_dependency  objects declared with CDIST_ORDER_DEPENDENCY
+parallel          children declared by the type manifests of a number of
+                  parents running concurrently
+
+By default every invocation is a process (like in a manifest), with
+--inline the emulator is run in this process to measure the emulator
+code only.
+
+The results (invocations per second and p50/p99 latency per scenario)
+are printed as JSON. If a --baseline (a previous --output) is given, the
+exit status is 1 if a scenario's throughput dropped by more than
+--tolerance compared to it.
+
+Usage: python3 benchmarks/emulator_bench.py [-n COUNT] [--baseline FILE]
+"""
+
+import argparse
+import concurrent.futures
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, base_dir)
+
+import skonfig  # noqa: E402
+import skonfig.core  # noqa: E402
+import skonfig.emulator  # noqa: E402
+import skonfig.settings  # noqa: E402
+
+from skonfig.exec import local  # noqa: E402
+
+exec_path = os.path.join(base_dir, "bin", "skonfig")
+conf_dirs = [
+    os.path.join(base_dir, "tests", "fixtures", "conf"),
+    os.path.join(base_dir, "tests", "emulator", "fixtures", "conf"),
+    ]
+target_host = ("localhost", "localhost", "localhost")
+
+
+class Context:
+    """A fresh object tree to run the emulator invocations of a scenario
+    against."""
+    def __init__(self, path):
+        settings = skonfig.settings.SettingsContainer()
+        settings.conf_dir = conf_dirs
+        self.local = local.Local(target_host, path, settings,
+                                 exec_path=exec_path)
+        self.local.create_files_dirs()
+        self.manifest = skonfig.core.Manifest(target_host, self.local)
+
+        script = os.path.join(path, "init")
+        open(script, "w").close()
+        self.env = self._emulator_env(
+            self.manifest.env_initial_manifest(script))
+
+    def _emulator_env(self, env):
+        env["__cdist_object_marker"] = self.local.object_marker_name
+        env.pop("__cdist_log_level", None)
+        return env
+
+    def define(self, argv, env=None):
+        """Declare an object (outside of the measurement) and return it."""
+        emu = skonfig.emulator.Emulator(
+            argv, stdin=io.BytesIO(), env=env or self.env)
+        emu.run()
+        return emu.cdist_object
+
+    def type_manifest_env(self, cdist_object):
+        return self._emulator_env(
+            self.manifest.env_type_manifest(cdist_object))
+
+
+def scenario_singleton(ctx, count):
+    return [(["__test_singleton"], ctx.env)] * count
+
+
+def scenario_multi_parameter(ctx, count):
+    return [
+        (["__arguments_all", "obj%u" % (i),
+          "--req", "r", "--reqmul", "a", "--reqmul", "b", "--reqmul1", "c",
+          "--opt", "o", "--optmul", "d", "--optmul1", "e", "--bool"],
+         ctx.env)
+        for i in range(count)]
+
+
+def scenario_redeclare(ctx, count):
+    return [(["__arguments_optional", "same", "--opt", "value"], ctx.env)
+            ] * count
+
+
+def scenario_require_chain(ctx, count):
+    commands = [(["__file_noop", "link0"], ctx.env)]
+    for i in range(1, count):
+        env = dict(ctx.env)
+        env["require"] = "__file_noop/link%u" % (i - 1)
+        commands.append((["__file_noop", "link%u" % (i)], env))
+    return commands
+
+
+def scenario_order_dependency(ctx, count):
+    env = dict(ctx.env)
+    env["CDIST_ORDER_DEPENDENCY"] = "on"
+    return [(["__file_noop", "ordered%u" % (i)], env) for i in range(count)]
+
+
+def scenario_parallel(ctx, count, parents=4):
+    parent_envs = [
+        ctx.type_manifest_env(ctx.define(["__file_noop", "parent%u" % (p)]))
+        for p in range(parents)]
+    # interleave the parents, every child is shared by all parents
+    return [
+        (["__directory_noop", "child%u" % (i // parents)],
+         parent_envs[i % parents])
+        for i in range(count)]
+
+
+SCENARIOS = [
+    ("singleton", scenario_singleton, False),
+    ("multi_parameter", scenario_multi_parameter, False),
+    ("redeclare", scenario_redeclare, False),
+    ("require_chain", scenario_require_chain, False),
+    ("order_dependency", scenario_order_dependency, False),
+    ("parallel", scenario_parallel, True),
+    ]
+
+
+def percentile(values, percent):
+    """Return the percent percentile of the sorted list values."""
+    return values[min(len(values) - 1,
+                      int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def run_scenario(ctx, commands, jobs, inline):
+    if inline:
+        def invoke(argv, env):
+            start_time = time.time()
+            skonfig.emulator.Emulator(
+                argv, stdin=io.BytesIO(), env=env).run()
+            return time.time() - start_time
+    else:
+        def invoke(argv, env):
+            start_time = time.time()
+            subprocess.check_call(
+                [os.path.join(ctx.local.bin_path, argv[0])] + argv[1:],
+                env=env, stdin=subprocess.DEVNULL)
+            return time.time() - start_time
+
+    start_time = time.time()
+    if jobs > 1:
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            latencies = list(executor.map(lambda c: invoke(*c), commands))
+    else:
+        latencies = [invoke(*c) for c in commands]
+    seconds = time.time() - start_time
+
+    latencies.sort()
+    return {
+        "invocations": len(commands),
+        "seconds": seconds,
+        "invocations_per_second": len(commands) / seconds,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        }
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of the scenarios whose throughput dropped by more than
+    tolerance compared to baseline."""
+    regressions = []
+    for (name, result) in sorted(results["scenarios"].items()):
+        if name not in baseline["scenarios"]:
+            continue
+        expected = baseline["scenarios"][name]["invocations_per_second"]
+        actual = result["invocations_per_second"]
+        if actual < expected * (1 - tolerance):
+            regressions.append("%s: %.1f invocations/s, baseline %.1f" % (
+                name, actual, expected))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-n", "--count", type=int, default=200,
+        help="number of emulator invocations per scenario")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of concurrent invocations of the parallel scenario")
+    parser.add_argument(
+        "--inline", action="store_true",
+        help="run the emulator in this process (scenarios sequentially)")
+    parser.add_argument(
+        "-s", "--scenario", action="append",
+        choices=[name for (name, _, _) in SCENARIOS],
+        help="run only this scenario (can be repeated)")
+    parser.add_argument(
+        "--output", metavar="file",
+        help="write the results to file instead of stdout")
+    parser.add_argument(
+        "--baseline", metavar="file",
+        help="fail if the throughput is worse than in this result file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="fraction the throughput may drop below the baseline")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "emulator",
+        "skonfig_version": skonfig.__version__,
+        "python": platform.python_version(),
+        "parameters": {
+            "count": args.count,
+            "jobs": args.jobs,
+            "inline": args.inline,
+            },
+        "scenarios": {},
+        }
+
+    temp_dir = tempfile.mkdtemp(prefix="skonfig-bench.")
+    try:
+        for (name, scenario, parallel) in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+            ctx = Context(os.path.join(temp_dir, name))
+            commands = scenario(ctx, args.count)
+            jobs = args.jobs if parallel and not args.inline else 1
+            results["scenarios"][name] = run_scenario(
+                ctx, commands, jobs, args.inline)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != results["parameters"]:
+            print("WARNING: baseline was run with different parameters: %s"
+                  % (baseline["parameters"]), file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Stress the emulator with many concurrent processes.
+
+A number of parent objects is defined and then the type manifests of all
+parents are "run" concurrently, i.e. many emulator processes define
+children of the same parents at the same time.  Afterwards the records
+shared between the emulators (global typeorder, the parents' typeorder,
+autorequire and children lists) are checked for lost entries.
+
+Usage: python3 benchmarks/emulator_stress.py [-j JOBS] ...
+"""
+
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, base_dir)
+
+import skonfig.core  # noqa: E402
+import skonfig.emulator  # noqa: E402
+import skonfig.settings  # noqa: E402
+
+from skonfig.exec import local  # noqa: E402
+
+exec_path = os.path.join(base_dir, "bin", "skonfig")
+target_host = ("localhost", "localhost", "localhost")
+
+
+def create_conf_dir(path):
+    type_path = os.path.join(path, "type", "__bench")
+    os.makedirs(os.path.join(type_path, "parameter"))
+    with open(os.path.join(type_path, "parameter", "optional"), "w") as f:
+        f.write("value\n")
+    os.makedirs(os.path.join(path, "manifest"))
+    open(os.path.join(path, "manifest", "init"), "w").close()
+
+
+def run_stress(temp_dir, parents, children, jobs):
+    conf_dir = os.path.join(temp_dir, "conf")
+    create_conf_dir(conf_dir)
+
+    settings = skonfig.settings.SettingsContainer()
+    settings.conf_dir = [conf_dir]
+    loc = local.Local(target_host, os.path.join(temp_dir, "host"), settings,
+                      exec_path=exec_path)
+    loc.create_files_dirs()
+    manifest = skonfig.core.Manifest(target_host, loc)
+
+    env = manifest.env_initial_manifest(
+        os.path.join(conf_dir, "manifest", "init"))
+    env["__cdist_object_marker"] = loc.object_marker_name
+    env.pop("__cdist_log_level", None)
+
+    parent_objects = []
+    for i in range(parents):
+        emu = skonfig.emulator.Emulator(
+            ["__bench", "parent%u" % (i)], stdin=io.BytesIO(), env=env)
+        emu.run()
+        parent_objects.append(emu.cdist_object)
+
+    commands = []
+    for parent in parent_objects:
+        parent_env = manifest.env_type_manifest(parent)
+        parent_env["__cdist_object_marker"] = loc.object_marker_name
+        parent_env.pop("__cdist_log_level", None)
+        for i in range(children):
+            # every child is shared by all parents
+            commands.append((
+                [os.path.join(loc.bin_path, "__bench"),
+                 "child%u" % (i), "--value", "x"],
+                parent_env))
+    # interleave parents
+    commands.sort(key=lambda c: c[0][1])
+
+    running = []
+    start = time.time()
+    for (argv, cmd_env) in commands:
+        while len(running) >= jobs:
+            proc = running.pop(0)
+            if proc.wait():
+                raise RuntimeError("emulator failed: %u" % (proc.returncode))
+        running.append(subprocess.Popen(
+            argv, env=cmd_env, stdin=subprocess.DEVNULL))
+    for proc in running:
+        if proc.wait():
+            raise RuntimeError("emulator failed: %u" % (proc.returncode))
+    elapsed = time.time() - start
+
+    errors = []
+    names = ["__bench/child%u" % (i) for i in range(children)]
+    for parent in parent_objects:
+        for attr in ("children", "typeorder", "autorequire"):
+            if sorted(getattr(parent, attr)) != sorted(names):
+                errors.append("%s: %s has %u entries, expected %u" % (
+                    parent.name, attr, len(getattr(parent, attr)),
+                    len(names)))
+    with open(os.path.join(loc.base_path, "typeorder")) as f:
+        typeorder = f.read().splitlines()
+    expected = parents + parents * children
+    if len(typeorder) != expected:
+        errors.append("typeorder has %u entries, expected %u" % (
+            len(typeorder), expected))
+
+    return (len(commands), elapsed, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of concurrent emulator processes")
+    parser.add_argument(
+        "-p", "--parents", type=int, default=4,
+        help="number of parent objects")
+    parser.add_argument(
+        "-c", "--children", type=int, default=64,
+        help="number of children defined by every parent")
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="skonfig-bench.")
+    try:
+        (count, elapsed, errors) = run_stress(
+            temp_dir, args.parents, args.children, args.jobs)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    print("%u emulator calls with %u jobs in %.3fs (%.1f calls/s)" % (
+        count, args.jobs, elapsed, count / elapsed))
+    for error in errors:
+        print("ERROR: " + error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
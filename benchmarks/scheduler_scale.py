@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure how the object scheduling scales with the number of objects.
+
+For each of a number of sizes an object tree is filled with that many
+objects of types with a no-op type explorer and gencode-remote script
+(but no manifest), so that the objects go through the same steps and
+state reads as in a real run. The explorers are run with a stand-in
+remote_exec running them locally. Every
+object belongs to a group of --group objects. The first object of a group
+autorequires the others (like a type manifest defining children) and
+every object requires up to --fanout randomly chosen objects of the
+groups before.
+
+Config.iterate_until_finished is then run sequentially on the tree and
+the following is measured:
+
+- the time of object_list(), _dependency_graph() and
+  _validate_dependencies() on the full tree
+- the time of iterate_until_finished and the part of it not spent in
+  object_prepare and object_run (the scheduling overhead)
+- the peak RSS (every size is measured in a separate process)
+
+The results are printed as JSON, one point per size, together with the
+scheduling time per object, so that the scaling curve can be compared
+between revisions. A table is printed to stderr. A size taking longer
+than --timeout seconds is recorded as timed out and the larger sizes are
+skipped.
+
+Usage: python3 benchmarks/scheduler_scale.py [--sizes 1000,10000,100000]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, base_dir)
+
+import skonfig  # noqa: E402
+import skonfig.config  # noqa: E402
+import skonfig.core  # noqa: E402
+import skonfig.settings  # noqa: E402
+
+from skonfig.exec import (local, remote)  # noqa: E402
+
+exec_path = os.path.join(base_dir, "bin", "skonfig")
+remote_exec = os.path.join(base_dir, "tests", "fixtures", "remote", "exec")
+target_host = ("localhost", "localhost", "localhost")
+
+
+def timed(func, *args):
+    """Return a tuple (seconds, result) of calling func."""
+    start_time = time.time()
+    result = func(*args)
+    return (time.time() - start_time, result)
+
+
+def create_objects(loc, count, types, fanout, group, seed):
+    cdist_types = [
+        skonfig.core.CdistType(loc.type_path, "__scale%u" % (t))
+        for t in range(types)]
+    objects = []
+    for i in range(count):
+        cdist_object = skonfig.core.CdistObject(
+            cdist_types[i % types], loc.object_path, loc.object_marker_name,
+            "obj%u" % (i))
+        cdist_object.create()
+        objects.append(cdist_object)
+
+    rand = random.Random(seed)
+    for (i, cdist_object) in enumerate(objects):
+        # objects of earlier groups only, the first object of a group
+        # depends on the others of its group
+        earlier = objects[:i - i % group]
+        cdist_object.requirements = [
+            o.name for o in rand.sample(earlier, min(fanout, len(earlier)))]
+        if i % group == 0:
+            cdist_object.autorequire = [
+                o.name for o in objects[i + 1:i + group]]
+
+
+def write_file(path, content, mode=0o755):
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def measure(temp_dir, count, types, fanout, group, seed):
+    conf_dir = os.path.join(temp_dir, "conf")
+    for t in range(types):
+        type_path = os.path.join(conf_dir, "type", "__scale%u" % (t))
+        os.makedirs(os.path.join(type_path, "explorer"))
+        write_file(os.path.join(type_path, "explorer", "x"),
+                   "#!/bin/sh -e\n:\n")
+        write_file(os.path.join(type_path, "gencode-remote"),
+                   "#!/bin/sh -e\n:\n")
+
+    settings = skonfig.settings.SettingsContainer()
+    settings.conf_dir = [conf_dir]
+    loc = local.Local(target_host, os.path.join(temp_dir, "local"),
+                      settings, exec_path=exec_path)
+    loc.create_files_dirs()
+    rem = remote.Remote(target_host, remote_exec,
+                        os.path.join(temp_dir, "remote"), settings,
+                        stdout_base_path=loc.stdout_base_path,
+                        stderr_base_path=loc.stderr_base_path)
+    rem.create_files_dirs()
+    config = skonfig.config.Config(loc, rem)
+
+    (create_seconds, _) = timed(
+        create_objects, loc, count, types, fanout, group, seed)
+
+    (object_list_seconds, _) = timed(lambda: list(config.object_list()))
+    (graph_seconds, graph) = timed(config._dependency_graph)
+    (validate_seconds, _) = timed(config._validate_dependencies, graph)
+
+    # time spent in the object steps and number of iterations
+    counters = {"steps": 0.0, "iterations": 0}
+
+    def count_time(func):
+        def wrapper(*args, **kwargs):
+            start_time = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counters["steps"] += time.time() - start_time
+        return wrapper
+
+    iterate_once = config.iterate_once
+
+    def count_iterations():
+        counters["iterations"] += 1
+        return iterate_once()
+
+    config.object_prepare = count_time(config.object_prepare)
+    config.object_run = count_time(config.object_run)
+    config.iterate_once = count_iterations
+    (iterate_seconds, _) = timed(config.iterate_until_finished)
+
+    return {
+        "objects": count,
+        "create_seconds": create_seconds,
+        "object_list_seconds": object_list_seconds,
+        "dependency_graph_seconds": graph_seconds,
+        "validate_seconds": validate_seconds,
+        "iterate_seconds": iterate_seconds,
+        "step_seconds": counters["steps"],
+        "scheduling_seconds": iterate_seconds - counters["steps"],
+        "iterations": counters["iterations"],
+        "scheduling_us_per_object": (
+            (iterate_seconds - counters["steps"]) / count * 1e6),
+        # ru_maxrss is in KiB on Linux (but in bytes on macOS)
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+
+def measure_in_process(args, count):
+    """Measure count objects in a new process and return the result or
+    None if it took longer than args.timeout seconds."""
+    # created here to be removed even if the process is killed
+    temp_dir = tempfile.mkdtemp(prefix="skonfig-bench.")
+    try:
+        output = subprocess.check_output([
+            sys.executable, os.path.realpath(__file__),
+            "--single", str(count),
+            "--temp-dir", temp_dir,
+            "--types", str(args.types),
+            "--fanout", str(args.fanout),
+            "--group", str(args.group),
+            "--seed", str(args.seed),
+            ], timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    finally:
+        shutil.rmtree(temp_dir)
+    return json.loads(output.decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", default="1000,3000,10000,30000,100000",
+        help="comma separated numbers of objects to measure")
+    parser.add_argument(
+        "-t", "--types", type=int, default=10,
+        help="number of types")
+    parser.add_argument(
+        "-f", "--fanout", type=int, default=2,
+        help="number of requirements of every object")
+    parser.add_argument(
+        "-g", "--group", type=int, default=10,
+        help="size of the groups of objects autorequired by their first")
+    parser.add_argument(
+        "-s", "--seed", type=int, default=0,
+        help="seed for the random requirements")
+    parser.add_argument(
+        "--timeout", type=float, default=600,
+        help="seconds after which a size (and the larger ones) is given up")
+    parser.add_argument(
+        "--output", metavar="file",
+        help="write the results to file instead of stdout")
+    parser.add_argument(
+        "--single", type=int, metavar="count", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--temp-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        result = measure(args.temp_dir, args.single, args.types,
+                         args.fanout, args.group, args.seed)
+        json.dump(result, sys.stdout)
+        return 0
+
+    points = []
+    print("%8s %10s %10s %10s %10s %10s %10s" % (
+        "objects", "list", "graph", "validate", "iterate", "schedule",
+        "rss"), file=sys.stderr)
+    for count in (int(size) for size in args.sizes.split(",")):
+        point = measure_in_process(args, count)
+        if point is None:
+            print("%8u timed out after %us, skipping larger sizes" % (
+                count, args.timeout), file=sys.stderr)
+            points.append({"objects": count, "timeout": args.timeout})
+            break
+        print("%8u %9.3fs %9.3fs %9.3fs %9.3fs %9.3fs %10u" % (
+            point["objects"], point["object_list_seconds"],
+            point["dependency_graph_seconds"], point["validate_seconds"],
+            point["iterate_seconds"], point["scheduling_seconds"],
+            point["peak_rss"]), file=sys.stderr)
+        points.append(point)
+
+    results = {
+        "benchmark": "scheduler_scale",
+        "skonfig_version": skonfig.__version__,
+        "python": platform.python_version(),
+        "parameters": {
+            name: getattr(args, name)
+            for name in ("types", "fanout", "group", "seed")},
+        "points": points,
+        }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
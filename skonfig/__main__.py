@@ -139,7 +139,12 @@ def run_main():
             settings=settings,
             dry_run=arguments.dry_run,
             jobs=jobs,
-            remove_remote_files_dirs=(arguments.verbosity < 2))
+            remove_remote_files_dirs=(arguments.verbosity < 2),
+            refresh_explorers=arguments.refresh_explorers,
+            keep_going=arguments.keep_going,
+            trace_path=arguments.trace,
+            profile_path=arguments.profile,
+            profile_emulator=arguments.profile_emulator)
     except skonfig.Error as e:
         pass
 
@@ -150,10 +155,21 @@ def run_emulator():
     emulator.run()
 
 
+def run_global_explorer_helper():
+    import skonfig.core.explorer
+    try:
+        sys.exit(skonfig.core.explorer.run_global_explorer_helper(sys.argv))
+    except skonfig.Error as e:
+        print("%s: %s" % (os.path.basename(sys.argv[0]), e), file=sys.stderr)
+        sys.exit(1)
+
+
 def run():
     try:
         if os.path.basename(sys.argv[0]).startswith("__"):
             run_emulator()
+        elif os.path.basename(sys.argv[0]) == "skonfig-global-explorer":
+            run_global_explorer_helper()
         else:
             run_main()
     except KeyboardInterrupt:
@@ -67,12 +67,24 @@ def get(color=True):
         type=int,
         help="maximum number of jobs (defaults to host CPU count, maximum: 4)"
     )
+    parser.add_argument(
+        "-k", "--keep-going",
+        dest="keep_going",
+        action="store_true",
+        help="keep going: run the independent objects if an object fails",
+    )
     parser.add_argument(
         "-n",
         dest="dry_run",
         action="store_true",
         help="dry-run, do not execute generated code",
     )
+    parser.add_argument(
+        "-R",
+        dest="refresh_explorers",
+        action="store_true",
+        help="re-run cached global explorers",
+    )
     parser.add_argument(
         "-v",
         dest="verbosity",
@@ -80,6 +92,24 @@ def get(color=True):
         default=0,
         help="-v = VERBOSE, -vv = DEBUG, -vvv = TRACE",
     )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="dir",
+        help="write profiles of the run's processes to dir (cProfile)",
+    )
+    parser.add_argument(
+        "--profile-emulator",
+        dest="profile_emulator",
+        action="store_true",
+        help="also profile the type emulator (with --profile)",
+    )
+    parser.add_argument(
+        "--trace",
+        dest="trace",
+        metavar="file",
+        help="write a trace of the run to file (Trace Event Format)",
+    )
     parser.add_argument("host", nargs='?', help="host to configure")
     arguments = parser.parse_args()
     for argument, value in vars(arguments).items():
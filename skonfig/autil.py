@@ -129,3 +129,40 @@ def tar(source, mode=TGZ):
         else:
             tar.add(source)
     return (tarpath, fcnt)
+
+
+def tar_paths(base_path, paths, mode=TGZ, umask=None):
+    """Create an archive containing the directories paths (relative to
+    base_path) and return its path.
+
+    If umask is given, the archive contains the directories paths and
+    their parents with mode 0777 & ~umask (like mkdir -p with umask), so
+    that they are extracted with this mode.
+    """
+    tarmode = "w:%s" % (mode.tarmode)
+    (fd, tarpath) = tempfile.mkstemp(suffix=mode.file_ext)
+    os.close(fd)
+    with tarfile.open(
+        tarpath,
+        tarmode,
+        dereference=True,
+        format=tarfile.USTAR_FORMAT
+    ) as tar:
+        added_dirs = set()
+        for path in paths:
+            source = os.path.join(base_path, path)
+            if umask is not None:
+                parts = os.path.normpath(path).split(os.sep)
+                for i in range(1, len(parts) + 1):
+                    dir_path = os.path.join(*parts[:i])
+                    if dir_path in added_dirs:
+                        continue
+                    tarinfo = tar.gettarinfo(
+                        os.path.join(base_path, dir_path), arcname=dir_path)
+                    tarinfo.mode = (0o777 & ~umask)
+                    tar.addfile(tarinfo)
+                    added_dirs.add(dir_path)
+            for f in ilistdir(source, recursive=True):
+                tar.add(os.path.join(source, f),
+                        arcname=os.path.join(path, f), recursive=False)
+    return tarpath
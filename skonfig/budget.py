@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import errno
+import os
+import tempfile
+import time
+
+import skonfig.flock
+import skonfig.logging
+
+from skonfig.util import append_lines
+
+
+log = skonfig.logging.getLogger('cdist-budget')
+
+# set in the environment of commands holding a slot of the budget.
+# Commands started by them (e.g. skonfig-global-explorer run by a manifest)
+# are accounted to their parent and must not take another slot, because
+# that could deadlock if all slots were held by waiting parents.
+HELD_ENV = "__skonfig_budget_held"
+
+
+class Budget():
+    """Budget of concurrently running commands shared by all skonfig runs
+    using the same budget path.
+
+    skonfig configures one host per invocation, so the runs sharing a
+    budget are separate skonfig processes (e.g. started by a script
+    configuring many hosts) and the budget path is not private to a single
+    invocation.
+
+    Every run gets an equal share (rounded up) of the budget, so that a
+    run with many objects cannot starve the other runs.  A run's share is
+    tracked in its run_path, the slots of the budget in path.
+    """
+    # seconds for which the number of active runs is cached
+    recount_interval = 1.0
+
+    def __init__(self, path, size, run_path):
+        self.path = path
+        self.size = size
+        self.run_path = run_path
+        self._active_runs = (0.0, 1)
+
+    @property
+    def runs_path(self):
+        return os.path.join(self.path, "runs")
+
+    @property
+    def _wait_path(self):
+        return os.path.join(self.run_path, "budget-wait")
+
+    @staticmethod
+    def _registration_name(name):
+        return "%s:%u:%s" % (os.uname()[1], os.getpid(), name)
+
+    @staticmethod
+    def _is_stale(registration_name):
+        """Return True if registration_name is the registration of a process
+        on this host which does not exist anymore."""
+        try:
+            (node, pid, _) = registration_name.split(":", 2)
+            pid = int(pid)
+        except ValueError:
+            return False
+        if node != os.uname()[1]:
+            return False
+        try:
+            os.kill(pid, 0)
+        except EnvironmentError as e:
+            return e.errno == errno.ESRCH
+        return False
+
+    def register(self, name):
+        """Register a run with the name (unique for the runs of the calling
+        process) as active.
+
+        Return the Flock which is to be passed to unregister() when the run
+        has finished.
+        """
+        os.makedirs(self.runs_path, exist_ok=True)
+        # create and lock the file before it becomes visible, so that it
+        # is not mistaken for a stale registration
+        (fd, temp_path) = tempfile.mkstemp(prefix=".", dir=self.runs_path)
+        os.close(fd)
+        lock = skonfig.flock.Flock(temp_path)
+        lock.flock()
+        lock.path = os.path.join(
+            self.runs_path, self._registration_name(name))
+        os.rename(temp_path, lock.path)
+        return lock
+
+    @staticmethod
+    def unregister(lock):
+        os.remove(lock.path)
+        lock.funlock()
+
+    def active_runs(self):
+        """Return the number of registered runs (at least 1).
+
+        Registrations of runs which did not unregister (i.e. whose lock is
+        not held anymore or whose process does not exist anymore) are
+        removed.
+        """
+        (count_time, count) = self._active_runs
+        if time.time() - count_time < self.recount_interval:
+            return count
+
+        count = 0
+        try:
+            names = os.listdir(self.runs_path)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name.startswith("."):
+                continue
+            lock = skonfig.flock.Flock(os.path.join(self.runs_path, name))
+            # the lock is not checked for registrations of processes which
+            # do not exist anymore, locks may not be reliable (e.g. on
+            # network file systems)
+            if not self._is_stale(name):
+                if not lock.try_flock():
+                    count += 1
+                    continue
+                lock.funlock()
+            log.debug("Removing stale budget registration %s", lock.path)
+            try:
+                os.remove(lock.path)
+            except FileNotFoundError:
+                pass
+
+        count = max(1, count)
+        self._active_runs = (time.time(), count)
+        return count
+
+    def acquire(self):
+        """Acquire a slot of the budget (if the calling process does not
+        hold one already).
+
+        Return a list of Flocks to be passed to release().
+        """
+        if os.environ.get(HELD_ENV):
+            return []
+
+        runs = self.active_runs()
+        share = -(-self.size // runs)
+        (share_lock, share_waited) = skonfig.flock.FlockSemaphore(
+            os.path.join(self.run_path, ".budget-share-%u.lock"),
+            share).acquire()
+        try:
+            (slot_lock, slot_waited) = skonfig.flock.FlockSemaphore(
+                os.path.join(self.path, ".slot-%u.lock"),
+                self.size).acquire()
+        except BaseException:
+            share_lock.funlock()
+            raise
+
+        waited = share_waited + slot_waited
+        if waited:
+            log.debug("Waited %.3fs for a budget slot (share %u of %u)",
+                      waited, share, self.size)
+            append_lines(self._wait_path, ["%.6f" % (waited)])
+        return [slot_lock, share_lock]
+
+    @staticmethod
+    def release(locks):
+        for lock in locks:
+            lock.funlock()
+
+    def wait_stats(self):
+        """Return a tuple (count, seconds) of the number of commands of this
+        run which had to wait for a slot and the total time waited.
+        """
+        try:
+            with open(self._wait_path) as f:
+                waits = [float(line) for line in f]
+        except EnvironmentError:
+            return (0, 0.0)
+        return (len(waits), sum(waits))
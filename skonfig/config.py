@@ -21,6 +21,7 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import json
 import os
 import sys
 import time
@@ -29,13 +30,17 @@ import multiprocessing
 import shutil
 
 import skonfig
+import skonfig.budget
 import skonfig.exec.local
 import skonfig.exec.remote
 import skonfig.logging
+import skonfig.profiling
+import skonfig.timing
 
 from skonfig.exec.util import get_std_fd
-from skonfig.mputil import (mp_pool_run, mp_sig_handler)
-from skonfig.util import (ipaddr, shquot)
+from skonfig.mputil import (mp_pool_run, mp_pool_run_bounded,
+                            mp_sig_handler)
+from skonfig.util import (append_lines, ipaddr, shquot)
 from skonfig.util.remoteutil import inspect_ssh_mux_opts
 
 
@@ -66,9 +71,39 @@ def _graph_dfs_cycle(graph, node, path):
     return False
 
 
+def graph_critical_path_lengths(graph, weight):
+    """Return a dict mapping the nodes of the acyclic graph to the length of
+    the longest path starting at the node, following the edges backwards
+    (i.e. the longest chain of nodes depending on it, including the node
+    itself).
+
+    The length of a node is weight(node).
+    """
+    dependents = {node: [] for node in graph}
+    for (node, requirements) in graph.items():
+        for requirement in requirements:
+            dependents.setdefault(requirement, []).append(node)
+
+    # process a node after all nodes depending on it
+    remaining = {node: len(nodes) for (node, nodes) in dependents.items()}
+    queue = [node for (node, count) in remaining.items() if not count]
+    lengths = {}
+    while queue:
+        node = queue.pop()
+        lengths[node] = weight(node) + max(
+            [lengths[dependent] for dependent in dependents[node]] or [0])
+        for requirement in graph.get(node, ()):
+            remaining[requirement] -= 1
+            if not remaining[requirement]:
+                queue.append(requirement)
+    return lengths
+
+
 class Config:
     def __init__(self, local, remote, dry_run=False, jobs=None,
-                 cleanup_cmds=None, remove_remote_files_dirs=False):
+                 cleanup_cmds=None, remove_remote_files_dirs=False,
+                 refresh_explorers=False, keep_going=False, trace_path=None,
+                 profile_path=None, profile_emulator=False):
 
         self.local = local
         self.remote = remote
@@ -77,12 +112,30 @@ class Config:
         self.jobs = jobs
         self.cleanup_cmds = cleanup_cmds if cleanup_cmds else []
         self.remove_remote_files_dirs = remove_remote_files_dirs
+        # continue with independent objects if an object fails
+        self.keep_going = keep_going
+
+        # write a trace of the run to this path (cf. skonfig.timing)
+        self.trace_path = trace_path
+        self.local.recorder.trace = trace_path is not None
+        self.remote.recorder = self.local.recorder
+        # write profiles of the processes of the run to this directory
+        # (cf. skonfig.profiling)
+        self.profile_path = (
+            os.path.abspath(profile_path) if profile_path else None)
+
+        # object name -> priority (cf. _object_priorities)
+        self.object_priorities = {}
+        self._object_durations = None
 
         self.explorer = skonfig.core.Explorer(
             self.local.target_host, self.local, self.remote, jobs=self.jobs,
-            dry_run=self.dry_run)
+            dry_run=self.dry_run, refresh=refresh_explorers)
         self.manifest = skonfig.core.Manifest(
             self.local.target_host, self.local, dry_run=self.dry_run)
+        if self.profile_path is not None and profile_emulator:
+            self.manifest.env[skonfig.profiling.EMULATOR_PROFILE_DIR_ENV] = (
+                self.profile_path)
         self.code = skonfig.core.Code(
             self.local.target_host, self.local, self.remote,
             dry_run=self.dry_run)
@@ -148,10 +201,34 @@ class Config:
 
         return (remote_exec, remote_cmds_cleanup)
 
+    # default of sshd's MaxSessions
+    default_max_sessions = 10
+
+    @classmethod
+    def _resolve_max_sessions(cls, settings, remote, multiplexed):
+        max_sessions = settings.remote_max_sessions
+        if max_sessions is None:
+            # probing costs a round trip (and usually fails for non-root
+            # users), so it is only done if asked for
+            max_sessions = cls.default_max_sessions if multiplexed else 0
+        elif max_sessions == "auto":
+            max_sessions = remote.probe_max_sessions()
+            if max_sessions is None:
+                max_sessions = cls.default_max_sessions
+        return max_sessions
+
     @staticmethod
-    def resolve_target_addresses(host):
+    def resolve_target_addresses(host, settings=None):
+        cache_path = None
+        ttl = 0
+        if settings is not None and settings.address_cache_ttl:
+            import skonfig.settings
+            cache_path = os.path.join(
+                skonfig.settings.get_cache_dir(), "addresses")
+            ttl = settings.address_cache_ttl
         try:
-            return ipaddr.resolve_target_addresses(host)
+            return ipaddr.resolve_target_addresses(
+                host, cache_path=cache_path, ttl=ttl)
         except:  # noqa
             e = sys.exc_info()[1]
             raise skonfig.Error(
@@ -161,16 +238,19 @@ class Config:
     @classmethod
     def onehost(cls, host, override_init_manifest, settings,
                 dry_run=False, jobs=1,
-                remove_remote_files_dirs=False):
+                remove_remote_files_dirs=False, refresh_explorers=False,
+                keep_going=False, trace_path=None, profile_path=None,
+                profile_emulator=False):
         """Configure ONE system."""
         log = skonfig.logging.getLogger(host)
 
         host_base_path = tempfile.mkdtemp(
             prefix="skonfig.", dir=settings.out_path)
         log.debug("Created temporary working directory: %s", host_base_path)
+        budget_registration = None
 
         try:
-            target_host = cls.resolve_target_addresses(host)
+            target_host = cls.resolve_target_addresses(host, settings)
             log.debug("target_host for host \"%s\": %s", host, target_host)
 
             local = skonfig.exec.local.Local(
@@ -183,60 +263,208 @@ class Config:
             os.environ['__global'] = local.base_path
 
             # set up remote execution
-            (remote_exec, cleanup_cmd) = cls._resolve_remote_cmds(
-                settings, local.temp_dir)
-            log.debug("remote_exec for host \"%s\": %s", host, remote_exec)
-
-            remote = skonfig.exec.remote.Remote(
-                target_host=target_host,
-                remote_exec=remote_exec,
-                base_path=settings.remote_out_path,
-                settings=settings,
-                stdout_base_path=local.stdout_base_path,
-                stderr_base_path=local.stderr_base_path)
+            if settings.remote_transport == "local":
+                cleanup_cmd = None
+                log.debug("local transport for host \"%s\"", host)
+
+                remote = skonfig.exec.remote.LocalRemote(
+                    target_host=target_host,
+                    base_path=settings.remote_out_path,
+                    settings=settings,
+                    stdout_base_path=local.stdout_base_path,
+                    stderr_base_path=local.stderr_base_path,
+                    session_path=local.temp_dir)
+            else:
+                (remote_exec, cleanup_cmd) = cls._resolve_remote_cmds(
+                    settings, local.temp_dir)
+                log.debug("remote_exec for host \"%s\": %s",
+                          host, remote_exec)
+
+                remote = skonfig.exec.remote.Remote(
+                    target_host=target_host,
+                    remote_exec=remote_exec,
+                    base_path=settings.remote_out_path,
+                    settings=settings,
+                    stdout_base_path=local.stdout_base_path,
+                    stderr_base_path=local.stderr_base_path,
+                    session_path=local.temp_dir)
+            remote.max_sessions = cls._resolve_max_sessions(
+                settings, remote, multiplexed=bool(cleanup_cmd))
+            log.debug("max_sessions for host \"%s\": %s",
+                      host, remote.max_sessions)
+
+            if settings.command_budget:
+                budget = skonfig.budget.Budget(
+                    os.path.join(local.cache_path, "budget"),
+                    settings.command_budget, local.temp_dir)
+                budget_registration = budget.register(local.hostdir)
+                local.budget = budget
+                remote.budget = budget
 
             cleanup_cmds = []
             if cleanup_cmd:
                 cleanup_cmds.append(cleanup_cmd)
             c = cls(local, remote, dry_run=dry_run, jobs=jobs,
                     cleanup_cmds=cleanup_cmds,
-                    remove_remote_files_dirs=remove_remote_files_dirs)
+                    remove_remote_files_dirs=remove_remote_files_dirs,
+                    refresh_explorers=refresh_explorers,
+                    keep_going=keep_going, trace_path=trace_path,
+                    profile_path=profile_path,
+                    profile_emulator=profile_emulator)
             c.run()
 
         except skonfig.Error as e:
             log.error(e)
             raise
         finally:
+            if budget_registration is not None:
+                skonfig.budget.Budget.unregister(budget_registration)
             log.debug("Cleaning up %s", host_base_path)
             shutil.rmtree(host_base_path)
 
     def run(self):
         """Do what is most often done: deploy & cleanup"""
+        if self.profile_path is not None:
+            os.makedirs(self.profile_path, exist_ok=True)
+            skonfig.profiling.set_profile_dir(self.profile_path)
+        try:
+            with skonfig.profiling.profiled(self.profile_path, "skonfig"):
+                self._run()
+        finally:
+            if self.trace_path is not None:
+                self.log.verbose("Writing trace to %s", self.trace_path)
+                skonfig.timing.write_trace(
+                    self.local.recorder.records(), self.trace_path,
+                    main_pid=os.getpid())
+            if self.profile_path is not None:
+                skonfig.profiling.set_profile_dir(None)
+                merged_path = skonfig.profiling.merge(self.profile_path)
+                self.log.verbose("Wrote merged profile to %s", merged_path)
+
+    def _run(self):
         start_time = time.time()
 
         self.log.info("Starting %s run",
                       'dry' if self.dry_run else 'configuration')
 
-        self._init_files_dirs()
+        with self._phase("init"):
+            self._init_files_dirs()
 
-        self.explorer.run_global_explorers(self.local.global_explorer_out_path)
         try:
-            self.manifest.run_initial_manifest(self.local.initial_manifest)
-        except skonfig.Error as e:
-            which = "init"
-            stdout_path = os.path.join(self.local.stdout_base_path, which)
-            stderr_path = os.path.join(self.local.stderr_base_path, which)
-            raise skonfig.InitialManifestError(
-                self.local.initial_manifest, stdout_path, stderr_path, e)
-        self.iterate_until_finished()
-        self._remove_files_dirs()
-        self.cleanup()
+            prefetch = self._start_prefetch_type_explorers()
+            with self._phase("global_explorers"):
+                self.explorer.run_global_explorers(
+                    self.local.global_explorer_out_path)
+            if prefetch is not None:
+                prefetch.join()
+                if prefetch.exitcode:
+                    # types will be transferred when needed
+                    self.log.warning("Prefetching type explorers failed")
+            try:
+                with self._phase("initial_manifest"):
+                    self.manifest.run_initial_manifest(
+                        self.local.initial_manifest)
+            except skonfig.Error as e:
+                which = "init"
+                stdout_path = os.path.join(self.local.stdout_base_path, which)
+                stderr_path = os.path.join(self.local.stderr_base_path, which)
+                raise skonfig.InitialManifestError(
+                    self.local.initial_manifest, stdout_path, stderr_path, e)
+            with self._phase("objects"):
+                self.iterate_until_finished()
+        finally:
+            # the state is only needed while the run is in progress
+            self.explorer.remove_state()
+        with self._phase("cleanup"):
+            self._remove_files_dirs()
+            self.cleanup()
+
+        (waits, wait_time) = self.remote.session_wait_stats()
+        if waits:
+            self.log.verbose(
+                "%u remote commands waited %.2f seconds in total for a free "
+                "session (max. %u)", waits, wait_time,
+                self.remote.max_sessions)
+
+        if self.local.budget is not None:
+            (waits, wait_time) = self.local.budget.wait_stats()
+            if waits:
+                self.log.verbose(
+                    "%u commands waited %.2f seconds in total for a slot of "
+                    "the command budget", waits, wait_time)
+
+        self._save_timing(time.time() - start_time)
+        self._save_processes()
 
         self.local.save_cache(start_time)
         self.log.info("Finished %s run in %.2f seconds",
                       'dry' if self.dry_run else 'successful',
                       time.time() - start_time)
 
+    def _phase(self, name):
+        return self.local.recorder.span(name, kind="phase", phase=name)
+
+    def _timed_step(self, cdist_object, name):
+        return self.local.recorder.span(
+            name, kind="object", object=cdist_object.name, step=name)
+
+    def _save_timing(self, total):
+        """Write the timing records of the run to timing.json in the work
+        directory and log the slowest objects."""
+        summary = skonfig.timing.summarise(
+            self.local.recorder.records(), total)
+        with open(self.local.timing_path, "w") as f:
+            json.dump(summary, f, indent=1, sort_keys=True)
+        self.log.verbose("Time per phase: %s", ", ".join(
+            "%s %.2fs" % (name, seconds)
+            for (name, seconds) in summary["phases"].items()))
+        slowest = skonfig.timing.slowest_objects(summary)
+        if slowest:
+            self.log.verbose("Slowest objects: %s", ", ".join(
+                "%s (%.2fs)" % (name, seconds) for (name, seconds) in slowest))
+
+    def _save_processes(self):
+        """Write the counts of the external processes of the run to
+        processes.json in the work directory and log them."""
+        processes = skonfig.timing.account(self.local.recorder.records())
+        with open(self.local.processes_path, "w") as f:
+            json.dump(processes, f, indent=1, sort_keys=True)
+        self.log.verbose("Processes: %s", skonfig.timing.format_counts(
+            processes["total"]))
+        for (name, counts) in sorted(processes["objects"].items()):
+            self.log.debug("Processes of %s: %s", name,
+                           skonfig.timing.format_counts(counts))
+
+    def _prefetch_types(self):
+        mode = self.local.settings.prefetch_type_explorers
+        if mode == "all":
+            return list(skonfig.core.CdistType.list_types(
+                self.local.type_path))
+        elif mode == "cache":
+            type_names = set(skonfig.core.CdistType.list_type_names(
+                self.local.type_path))
+            return [
+                skonfig.core.CdistType(self.local.type_path, type_name)
+                for type_name in self.local.cached_type_names()
+                if type_name in type_names]
+        else:
+            return []
+
+    def _start_prefetch_type_explorers(self):
+        """Start transferring the type explorers of the types likely needed
+        in the background (cf. prefetch_type_explorers setting).
+
+        Returns the process doing the transfer or None.
+        """
+        cdist_types = self._prefetch_types()
+        if not cdist_types:
+            return None
+        process = multiprocessing.Process(
+            target=self.explorer.prefetch_type_explorers,
+            args=(cdist_types,))
+        process.start()
+        return process
+
     def cleanup(self):
         self.log.debug("Running cleanup commands")
         local = self.local
@@ -263,6 +491,44 @@ class Config:
             else:
                 yield cdist_object
 
+    @property
+    def _failed_objects_path(self):
+        return os.path.join(self.local.temp_dir, "failed-objects")
+
+    def failed_objects(self):
+        """Return the names of the objects which failed (in keep going
+        mode)."""
+        try:
+            with open(self._failed_objects_path, "r") as f:
+                return [line.rstrip("\n") for line in f]
+        except FileNotFoundError:
+            return []
+
+    def _pending_object_list(self):
+        """object_list() without the objects which failed."""
+        failed = set(self.failed_objects())
+        for cdist_object in self.object_list():
+            if cdist_object.name not in failed:
+                yield cdist_object
+
+    def _object_step(self, step, cdist_object, *args):
+        """Run step (object_prepare or object_run) for cdist_object.
+
+        In keep going mode, errors are logged and the object is recorded as
+        failed instead of raising the error.
+
+        Return True if the step was successful.
+        """
+        try:
+            getattr(self, step)(cdist_object, *args)
+            return True
+        except skonfig.Error as e:
+            if not self.keep_going:
+                raise
+            self.log.error(e)
+            append_lines(self._failed_objects_path, [cdist_object.name])
+            return False
+
     def iterate_once(self):
         """Iterate over the objects once - helper method for
         iterate_until_finished
@@ -276,7 +542,7 @@ class Config:
         self.log.debug("Iteration in sequential mode")
         objects_changed = False
 
-        for cdist_object in self.object_list():
+        for cdist_object in self._pending_object_list():
             if cdist_object.has_requirements_unfinished(
                     cdist_object.requirements):
                 """We cannot do anything for this poor object"""
@@ -285,8 +551,9 @@ class Config:
             if cdist_object.state == skonfig.core.CdistObject.STATE_UNDEF:
                 """Prepare the virgin object"""
 
-                self.object_prepare(cdist_object)
                 objects_changed = True
+                if not self._object_step("object_prepare", cdist_object):
+                    continue
 
             if cdist_object.has_requirements_unfinished(
                     cdist_object.autorequire):
@@ -296,7 +563,7 @@ class Config:
                 continue
 
             if cdist_object.state == skonfig.core.CdistObject.STATE_PREPARED:
-                self.object_run(cdist_object)
+                self._object_step("object_run", cdist_object)
                 objects_changed = True
 
         return objects_changed
@@ -306,7 +573,7 @@ class Config:
         objects_changed = False
 
         cargo = []
-        for cdist_object in self.object_list():
+        for cdist_object in self._pending_object_list():
             if cdist_object.has_requirements_unfinished(
                     cdist_object.requirements):
                 """We cannot do anything for this poor object"""
@@ -319,10 +586,14 @@ class Config:
                 # objects_changed = True
                 cargo.append(cdist_object)
 
+        # start the objects with the longest chains of dependent objects
+        # first
+        cargo.sort(key=self._object_priority_key)
+
         n = len(cargo)
         if n == 1:
             self.log.debug("Only one object, preparing sequentially")
-            self.object_prepare(cargo[0])
+            self._object_step("object_prepare", cargo[0])
             objects_changed = True
         elif cargo:
             if callable(getattr(multiprocessing, "get_start_method", None)):
@@ -347,20 +618,21 @@ class Config:
                                "parallel types explorers transferring", nt)
                 args = [(ct,) for ct in cargo_types]
                 mp_pool_run(self.explorer.transfer_type_explorers, args,
-                            jobs=self.jobs)
+                            jobs=self.jobs, recorder=self.local.recorder)
                 self.log.trace(("Multiprocessing for parallel transferring "
                                 "types' explorers finished"))
 
             self.log.trace("Starting multiprocessing Pool for %d parallel "
                            "objects preparation", n)
-            args = [(c, False) for c in cargo]
-            mp_pool_run(self.object_prepare, args, jobs=self.jobs)
+            args = [("object_prepare", c, False) for c in cargo]
+            mp_pool_run(self._object_step, args, jobs=self.jobs,
+                        recorder=self.local.recorder)
             self.log.trace(("Multiprocessing for parallel object "
                             "preparation finished"))
             objects_changed = True
 
-        del cargo[:]
-        for cdist_object in self.object_list():
+        ready = []
+        for cdist_object in self._pending_object_list():
             if cdist_object.has_requirements_unfinished(
                     cdist_object.requirements):
                 """We cannot do anything for this poor object"""
@@ -376,46 +648,43 @@ class Config:
 
                 # self.object_run(cdist_object)
                 # objects_changed = True
+                ready.append(cdist_object)
 
-                # put objects in chuncks of distinct types
-                # so that there is no more than one object
-                # of the same type in one chunk because there is a
-                # possibility of object's process locking which
-                # prevents parallel execution at remote
-                # and do this only for nonparallel marked types
-                for chunk in cargo:
-                    for obj in chunk:
-                        if (obj.cdist_type == cdist_object.cdist_type and
-                           cdist_object.cdist_type.is_nonparallel):
-                            break
-                    else:
-                        chunk.append(cdist_object)
-                        break
-                else:
-                    chunk = [cdist_object]
-                    cargo.append(chunk)
-
-        for chunk in cargo:
-            self.log.trace("Running chunk: %s", chunk)
-            n = len(chunk)
-            if n == 1:
-                self.log.debug("Only one object, running sequentially")
-                self.object_run(chunk[0])
-                objects_changed = True
-            elif chunk:
-                if callable(getattr(
-                        multiprocessing, "get_start_method", None)):
-                    # Python >= 3.4
-                    self.log.trace(
-                        "Multiprocessing start method is %s",
-                        multiprocessing.get_start_method())
-                self.log.trace("Starting multiprocessing Pool for %d "
-                               "parallel object run", n)
-                args = [(c,) for c in chunk]
-                mp_pool_run(self.object_run, args, jobs=self.jobs)
-                self.log.trace(("Multiprocessing for parallel object "
-                                "run finished"))
-                objects_changed = True
+        # objects with longer chains of dependent objects are started first
+        ready.sort(key=self._object_priority_key)
+
+        n = len(ready)
+        if n == 1:
+            self.log.debug("Only one object, running sequentially")
+            self._object_step("object_run", ready[0])
+            objects_changed = True
+        elif ready:
+            if callable(getattr(multiprocessing, "get_start_method", None)):
+                # Python >= 3.4
+                self.log.trace(
+                    "Multiprocessing start method is %s",
+                    multiprocessing.get_start_method())
+
+            # limit the number of objects of a type running at the same
+            # time (cf. max_parallel and nonparallel of types) because there
+            # is a possibility of object's process locking which prevents
+            # parallel execution at remote
+            limits = {}
+            for cdist_object in ready:
+                cdist_type = cdist_object.cdist_type
+                if cdist_type.max_parallel is not None:
+                    limits[cdist_type.name] = cdist_type.max_parallel
+            self.log.trace("Type limits for parallel object run: %s", limits)
+
+            self.log.trace("Starting multiprocessing Pool for %d "
+                           "parallel object run", n)
+            mp_pool_run_bounded(
+                self._object_step, [("object_run", c) for c in ready],
+                [c.cdist_type.name for c in ready], limits, jobs=self.jobs,
+                recorder=self.local.recorder)
+            self.log.trace(("Multiprocessing for parallel object "
+                            "run finished"))
+            objects_changed = True
 
         return objects_changed
 
@@ -434,10 +703,8 @@ class Config:
         self.__dict__.update(state)
         self._open_logger()
 
-    def _validate_dependencies(self):
-        """Build dependency graph for unfinished objects and
-        check for cycles.
-        """
+    def _dependency_graph(self):
+        """Build dependency graph for unfinished objects."""
         graph = {}
 
         def _add_requirements(cdist_object, requirements):
@@ -455,8 +722,53 @@ class Config:
 
             _add_requirements(cdist_object, cdist_object.requirements)
             _add_requirements(cdist_object, cdist_object.autorequire)
+        return graph
+
+    def _validate_dependencies(self, graph=None):
+        """Build dependency graph for unfinished objects and
+        check for cycles.
+        """
+        if graph is None:
+            graph = self._dependency_graph()
         return graph_check_cycle(graph)
 
+    def _object_durations_by_name(self):
+        if self._object_durations is None:
+            self._object_durations = self.local.cached_object_durations()
+        return self._object_durations
+
+    def _object_priorities(self, graph):
+        """Return a dict mapping the object names of the (acyclic)
+        dependency graph to the length of the longest chain of objects
+        depending on them.
+
+        The objects are weighted by their duration in the previous run
+        according to the cached timing.json (falling back to the average
+        duration of objects of the same type or of all objects), if known.
+        """
+        durations = self._object_durations_by_name()
+        type_durations = {}
+        for (name, duration) in durations.items():
+            type_name = skonfig.core.CdistObject.split_name(name)[0]
+            type_durations.setdefault(type_name, []).append(duration)
+        for (type_name, values) in type_durations.items():
+            type_durations[type_name] = sum(values) / len(values)
+        if durations:
+            default = sum(durations.values()) / len(durations)
+        else:
+            default = 1.0
+
+        def weight(name):
+            if name in durations:
+                return durations[name]
+            type_name = skonfig.core.CdistObject.split_name(name)[0]
+            return type_durations.get(type_name, default)
+
+        return graph_critical_path_lengths(graph, weight)
+
+    def _object_priority_key(self, cdist_object):
+        return -self.object_priorities.get(cdist_object.name, 0)
+
     def iterate_until_finished(self):
         """Go through all objects and solve them one after another"""
 
@@ -464,11 +776,13 @@ class Config:
 
         while objects_changed:
             # Check for cycles as early as possible.
-            (has_cycle, path) = self._validate_dependencies()
+            graph = self._dependency_graph()
+            (has_cycle, path) = self._validate_dependencies(graph)
             if has_cycle:
                 raise skonfig.UnresolvableRequirementsError(
                     "Cycle detected in object dependencies:\n{}!".format(
                         " -> ".join(path)))
+            self.object_priorities = self._object_priorities(graph)
             objects_changed = self.iterate_once()
 
         # Check whether all objects have been finished
@@ -477,6 +791,14 @@ class Config:
             if not cdist_object.state == cdist_object.STATE_DONE:
                 unfinished_objects.append(cdist_object)
 
+        failed_objects = self.failed_objects()
+        if failed_objects:
+            raise skonfig.Error(
+                "The following objects failed:\n    {}\n"
+                "{} objects were not run because they depend on them.".format(
+                    "\n    ".join(failed_objects),
+                    len(unfinished_objects) - len(failed_objects)))
+
         if unfinished_objects:
             info_string = []
 
@@ -532,9 +854,14 @@ class Config:
         self.log.verbose("Preparing object %s", cdist_object.name)
         self.log.verbose("Running manifest and explorers for %s",
                          cdist_object.name)
-        self.explorer.run_type_explorers(cdist_object, transfer_type_explorers)
+        if transfer_type_explorers:
+            with self._timed_step(cdist_object, "transfer"):
+                self.explorer.transfer_type_explorers(cdist_object.cdist_type)
+        with self._timed_step(cdist_object, "explorers"):
+            self.explorer.run_type_explorers(cdist_object, False)
         try:
-            self.manifest.run_type_manifest(cdist_object)
+            with self._timed_step(cdist_object, "manifest"):
+                self.manifest.run_type_manifest(cdist_object)
             self.log.trace("[ORDER_DEP] Removing order dep files for %s",
                            cdist_object)
             cdist_object.cleanup()
@@ -554,9 +881,12 @@ class Config:
 
             # Generate code
             self.log.debug("Generating code for %s", cdist_object.name)
-            cdist_object.code_local = self.code.run_gencode_local(cdist_object)
-            cdist_object.code_remote = self.code.run_gencode_remote(
-                cdist_object)
+            with self._timed_step(cdist_object, "gencode-local"):
+                cdist_object.code_local = self.code.run_gencode_local(
+                    cdist_object)
+            with self._timed_step(cdist_object, "gencode-remote"):
+                cdist_object.code_remote = self.code.run_gencode_remote(
+                    cdist_object)
             cdist_object.changed = \
                 (cdist_object.code_local or cdist_object.code_remote)
 
@@ -568,13 +898,16 @@ class Config:
                 if cdist_object.code_local:
                     self.log.trace("Executing local code for %s",
                                    cdist_object.name)
-                    self.code.run_code_local(cdist_object)
+                    with self._timed_step(cdist_object, "code-local"):
+                        self.code.run_code_local(cdist_object)
 
                 if cdist_object.code_remote:
                     self.log.trace("Executing remote code for %s",
                                    cdist_object.name)
-                    self.code.transfer_code_remote(cdist_object)
-                    self.code.run_code_remote(cdist_object)
+                    with self._timed_step(cdist_object, "transfer"):
+                        self.code.transfer_code_remote(cdist_object)
+                    with self._timed_step(cdist_object, "code-remote"):
+                        self.code.run_code_remote(cdist_object)
 
             # Mark this object as done
             self.log.trace("Finishing run of %s", cdist_object.name)
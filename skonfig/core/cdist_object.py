@@ -232,6 +232,10 @@ class CdistObject:
             lambda obj: os.path.join(obj.absolute_path, 'autorequire'))
     parameters = fsproperty.DirectoryDictProperty(
             lambda obj: os.path.join(obj.base_path, obj.parameter_path))
+    # digest of the parameters (in context of the type) the object was
+    # defined with, cf. skonfig.emulator
+    parameter_digest = fsproperty.FileStringProperty(
+            lambda obj: os.path.join(obj.absolute_path, 'parameter_digest'))
     explorers = fsproperty.DirectoryDictProperty(
             lambda obj: os.path.join(obj.base_path, obj.explorer_path))
     state = fsproperty.FileStringProperty(
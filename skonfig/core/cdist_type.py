@@ -19,7 +19,11 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import hashlib
+import json
 import os
+import shutil
+import tempfile
 
 import skonfig
 import skonfig.core
@@ -53,6 +57,22 @@ class CdistType:
 
     log = skonfig.logging.getLogger("cdist-type")
 
+    PARAMETER_KINDS = (
+        "required", "required_multiple",
+        "optional", "optional_multiple",
+        "boolean")
+
+    # version of the metadata records, part of the fingerprint of the
+    # compiled type index
+    INDEX_VERSION = 2
+
+    # base_path -> path of the compiled type index (cf. use_index)
+    _index_paths = {}
+
+    # metadata record, read on first use (cf. metadata)
+    __metadata = None
+    __metadata_path = None
+
     def __init__(self, base_path, name):
         self.base_path = base_path
         self.name = name
@@ -66,14 +86,11 @@ class CdistType:
         self.gencode_remote_path = os.path.join(self.name, "gencode-remote")
         self.manifest_path = os.path.join(self.name, "manifest")
 
-        self.__explorers = None
-        self.__required_parameters = None
-        self.__required_multiple_parameters = None
-        self.__optional_parameters = None
-        self.__optional_multiple_parameters = None
-        self.__boolean_parameters = None
-        self.__parameter_defaults = None
-        self.__deprecated_parameters = None
+        # keep the metadata when the same type is initialised again
+        # (cf. __new__)
+        if self.__metadata_path != self.absolute_path:
+            self.__metadata = None
+            self.__metadata_path = self.absolute_path
 
     def __hash__(self):
         return hash(self.name)
@@ -121,182 +138,332 @@ class CdistType:
     def __lt__(self, other):
         return isinstance(other, self.__class__) and self.name < other.name
 
+    # metadata
+
+    @classmethod
+    def use_index(cls, base_path, index_path):
+        """Load type metadata of types in base_path from the compiled
+        type index in index_path instead of reading it from the type
+        directories."""
+        cls._index_paths[base_path] = index_path
+
+    @classmethod
+    def index_fingerprint(cls, base_path):
+        """Return a fingerprint of the types in base_path which changes when
+        a file or directory of a type is changed, added or removed.
+
+        Only the directory entries are stat()ed, no file is read.
+        """
+        digest = hashlib.md5(str(cls.INDEX_VERSION).encode())
+        for name in cls.list_type_names(base_path):
+            path = os.path.realpath(os.path.join(base_path, name))
+            digest.update(("%s\0%s\0" % (name, path)).encode("utf-8"))
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames.sort()
+                for entry in [dirpath] + sorted(
+                        os.path.join(dirpath, f) for f in filenames):
+                    try:
+                        st = os.stat(entry)
+                    except EnvironmentError:
+                        # error ignored
+                        continue
+                    digest.update(("%s\0%u\0%r\0%u\0" % (
+                        os.path.relpath(entry, path), st.st_ino,
+                        st.st_mtime, st.st_size)).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def compile_index(cls, base_path, index_path):
+        """Compile the metadata of all types in base_path into a
+        subdirectory of index_path (one JSON file per type) so that it can
+        be loaded by other processes (e.g. the emulator) using use_index().
+
+        The subdirectory is named by the fingerprint of the types
+        (cf. index_fingerprint()), so an existing index is reused as long as
+        the types have not changed. Indexes of other versions of the types
+        are removed.
+
+        Returns the path of the index.
+        """
+        fingerprint = cls.index_fingerprint(base_path)
+        path = os.path.join(index_path, fingerprint)
+        if not os.path.isdir(path):
+            os.makedirs(index_path, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(dir=index_path, prefix=".")
+            try:
+                for cdist_type in cls.list_types(base_path):
+                    # read from the type directory, not from an old index
+                    cdist_type.__metadata = cdist_type.__read_metadata()
+                    with open(os.path.join(tmp_path, cdist_type.name),
+                              "w") as fd:
+                        json.dump(cdist_type.__metadata, fd, sort_keys=True)
+                try:
+                    os.rename(tmp_path, path)
+                except EnvironmentError:
+                    # compiled concurrently
+                    if not os.path.isdir(path):
+                        raise
+            finally:
+                if os.path.isdir(tmp_path):
+                    shutil.rmtree(tmp_path)
+            for name in os.listdir(index_path):
+                if name != fingerprint and not name.startswith("."):
+                    shutil.rmtree(os.path.join(index_path, name), True)
+        cls.use_index(base_path, path)
+        return path
+
+    @property
+    def metadata(self):
+        """Return the metadata record (a dict) of this type.
+
+        The record is read only once per instance, either from the compiled
+        type index or from the type directory.
+        """
+        if self.__metadata is None:
+            self.__metadata = (
+                self.__load_metadata() or self.__read_metadata())
+        return self.__metadata
+
+    def __load_metadata(self):
+        index_path = self._index_paths.get(self.base_path)
+        if index_path is None:
+            return None
+        try:
+            with open(os.path.join(index_path, self.name), "r") as fd:
+                return json.load(fd)
+        except (EnvironmentError, ValueError):
+            # index entry missing or broken, read from type directory
+            return None
+
+    def __read_metadata(self):
+        parameter_path = os.path.join(self.absolute_path, "parameter")
+
+        return {
+            "singleton": self.__isfile("singleton"),
+            "install": self.__isfile("install"),
+            "nonparallel": self.__isfile("nonparallel"),
+            "max_parallel": _read_file(
+                os.path.join(self.absolute_path, "max_parallel")),
+            "deprecated": _read_file(
+                os.path.join(self.absolute_path, "deprecated")),
+            "explorers": _list_explorers(
+                os.path.join(self.absolute_path, "explorer")),
+            "object_independent_explorers": _read_parameter_list(
+                os.path.join(self.absolute_path, "explorer",
+                             ".object_independent")),
+            "parameters": {
+                kind: _read_parameter_list(os.path.join(parameter_path, kind))
+                for kind in self.PARAMETER_KINDS
+            },
+            "parameter_defaults": _read_parameter_dict(
+                os.path.join(parameter_path, "default"),
+                lambda s: s.rstrip("\n")),
+            "deprecated_parameters": _read_parameter_dict(
+                os.path.join(parameter_path, "deprecated"),
+                lambda s: s.strip()),
+            "scripts": {
+                "manifest": self.__list_scripts("manifest"),
+                "gencode-local": self.__list_scripts("gencode-local"),
+                "gencode-remote": self.__list_scripts("gencode-remote"),
+            },
+        }
+
+    def __isfile(self, name):
+        return os.path.isfile(os.path.join(self.absolute_path, name))
+
+    def __list_scripts(self, which):
+        """Return the list of scripts to execute for which (manifest,
+        gencode-local or gencode-remote) relative to base_path."""
+        path = os.path.join(self.absolute_path, which)
+        relpath = os.path.join(self.path, which)
+        if os.path.isdir(path):
+            if os.path.isfile(os.path.join(path, "init")):
+                return [os.path.join(relpath, "init")]
+            return sorted(
+                os.path.join(relpath, s)
+                for s in os.listdir(path)
+                if os.path.isfile(os.path.join(path, s)))
+        elif os.path.isfile(path):
+            return [relpath]
+        else:
+            return []
+
     @property
     def is_singleton(self):
         """Check whether a type is a singleton."""
-        return os.path.isfile(os.path.join(self.absolute_path, "singleton"))
+        return self.metadata["singleton"]
 
     @property
     def is_install(self):
         """Check whether a type is used for installation
         (if not: for configuration)"""
-        return os.path.isfile(os.path.join(self.absolute_path, "install"))
+        return self.metadata["install"]
 
     @property
     def is_nonparallel(self):
         """Check whether a type is a non parallel, i.e. its objects
         cannot run in parallel."""
-        return os.path.isfile(os.path.join(self.absolute_path, "nonparallel"))
+        return self.metadata["nonparallel"]
+
+    @property
+    def max_parallel(self):
+        """Return the maximum number of objects of this type which may run
+        in parallel or None if it is not limited (nonparallel types: 1)."""
+        if self.is_nonparallel:
+            return 1
+        value = self.metadata["max_parallel"]
+        if value is None:
+            return None
+        try:
+            max_parallel = int(value.strip())
+        except ValueError:
+            max_parallel = 0
+        if max_parallel < 1:
+            raise skonfig.Error(
+                "Invalid max_parallel of type %s: %r (must be a positive "
+                "integer)" % (self.name, value.strip()))
+        return max_parallel
 
     @property
     def deprecated(self):
         """Get type deprecation message. If message is None then type
         is not deprecated."""
-        deprecated_path = os.path.join(self.absolute_path, "deprecated")
-        try:
-            with open(deprecated_path, 'r') as f:
-                return f.read()
-        except FileNotFoundError:
-            return None
+        return self.metadata["deprecated"]
 
     @property
     def explorers(self):
         """Return a list of available explorers"""
-        if not self.__explorers:
-            try:
-                self.__explorers = skonfig.core.listdir(
-                    os.path.join(self.absolute_path, "explorer"))
-            except EnvironmentError:
-                # error ignored
-                self.__explorers = []
-        return self.__explorers
+        return self.metadata["explorers"]
+
+    @property
+    def object_independent_explorers(self):
+        """Return a list of explorers whose output does not depend on the
+        object (listed in explorer/.object_independent)"""
+        return self.metadata["object_independent_explorers"]
+
+    @property
+    def explorer_digest(self):
+        """Return a digest of the contents of the explorer directory
+        (None if the type has no explorers).
+
+        The digest is computed on first use, it is not part of the index.
+        """
+        if "explorer_digest" not in self.metadata:
+            self.metadata["explorer_digest"] = _digest_tree(
+                os.path.join(self.absolute_path, "explorer"))
+        return self.metadata["explorer_digest"]
+
+    @property
+    def manifest_scripts(self):
+        """Return a list of manifest scripts (relative to base_path) in
+        execution order"""
+        return self.metadata["scripts"]["manifest"]
+
+    @property
+    def gencode_local_scripts(self):
+        """Return a list of gencode-local scripts (relative to base_path) in
+        execution order"""
+        return self.metadata["scripts"]["gencode-local"]
+
+    @property
+    def gencode_remote_scripts(self):
+        """Return a list of gencode-remote scripts (relative to base_path) in
+        execution order"""
+        return self.metadata["scripts"]["gencode-remote"]
 
     @property
     def required_parameters(self):
         """Return a list of required parameters"""
-        if not self.__required_parameters:
-            parameters = []
-            try:
-                with open(os.path.join(self.absolute_path,
-                                       "parameter",
-                                       "required")) as fd:
-                    for line in fd:
-                        line = line.strip()
-                        if line:
-                            parameters.append(line)
-            except EnvironmentError:
-                # error ignored
-                pass
-            finally:
-                self.__required_parameters = parameters
-        return self.__required_parameters
+        return self.metadata["parameters"]["required"]
 
     @property
     def required_multiple_parameters(self):
         """Return a list of required multiple parameters"""
-        if not self.__required_multiple_parameters:
-            parameters = []
-            try:
-                with open(os.path.join(self.absolute_path,
-                                       "parameter",
-                                       "required_multiple")) as fd:
-                    for line in fd:
-                        line = line.strip()
-                        if line:
-                            parameters.append(line)
-            except EnvironmentError:
-                # error ignored
-                pass
-            finally:
-                self.__required_multiple_parameters = parameters
-        return self.__required_multiple_parameters
+        return self.metadata["parameters"]["required_multiple"]
 
     @property
     def optional_parameters(self):
         """Return a list of optional parameters"""
-        if not self.__optional_parameters:
-            parameters = []
-            try:
-                with open(os.path.join(self.absolute_path,
-                                       "parameter",
-                                       "optional")) as fd:
-                    for line in fd:
-                        line = line.strip()
-                        if line:
-                            parameters.append(line)
-            except EnvironmentError:
-                # error ignored
-                pass
-            finally:
-                self.__optional_parameters = parameters
-        return self.__optional_parameters
+        return self.metadata["parameters"]["optional"]
 
     @property
     def optional_multiple_parameters(self):
         """Return a list of optional multiple parameters"""
-        if not self.__optional_multiple_parameters:
-            parameters = []
-            try:
-                with open(os.path.join(self.absolute_path,
-                                       "parameter",
-                                       "optional_multiple")) as fd:
-                    for line in fd:
-                        line = line.strip()
-                        if line:
-                            parameters.append(line)
-            except EnvironmentError:
-                # error ignored
-                pass
-            finally:
-                self.__optional_multiple_parameters = parameters
-        return self.__optional_multiple_parameters
+        return self.metadata["parameters"]["optional_multiple"]
 
     @property
     def boolean_parameters(self):
         """Return a list of boolean parameters"""
-        if not self.__boolean_parameters:
-            parameters = []
-            try:
-                with open(os.path.join(self.absolute_path,
-                                       "parameter",
-                                       "boolean")) as fd:
-                    for line in fd:
-                        line = line.strip()
-                        if line:
-                            parameters.append(line)
-            except EnvironmentError:
-                # error ignored
-                pass
-            finally:
-                self.__boolean_parameters = parameters
-        return self.__boolean_parameters
+        return self.metadata["parameters"]["boolean"]
 
     @property
     def parameter_defaults(self):
-        if not self.__parameter_defaults:
-            defaults = {}
-            try:
-                defaults_dir = os.path.join(self.absolute_path,
-                                            "parameter",
-                                            "default")
-                for name in skonfig.core.listdir(defaults_dir):
-                    try:
-                        with open(os.path.join(defaults_dir, name)) as fd:
-                            defaults[name] = fd.read().rstrip("\n")
-                    except EnvironmentError:
-                        pass  # Swallow errors raised by open() or read()
-            except EnvironmentError:
-                pass  # Swallow error raised by os.listdir()
-            finally:
-                self.__parameter_defaults = defaults
-        return self.__parameter_defaults
+        return self.metadata["parameter_defaults"]
 
     @property
     def deprecated_parameters(self):
-        if not self.__deprecated_parameters:
-            deprecated = {}
+        return self.metadata["deprecated_parameters"]
+
+
+def _read_file(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _list_explorers(path):
+    try:
+        return skonfig.core.listdir(path)
+    except EnvironmentError:
+        # error ignored
+        return []
+
+
+def _digest_tree(path):
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.md5()
+    for (dirpath, dirnames, filenames) in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            file_path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+            digest.update(b"\0")
             try:
-                deprecated_dir = os.path.join(self.absolute_path,
-                                              "parameter",
-                                              "deprecated")
-                for name in skonfig.core.listdir(deprecated_dir):
-                    try:
-                        with open(os.path.join(deprecated_dir, name)) as fd:
-                            deprecated[name] = fd.read().strip()
-                    except EnvironmentError:
-                        pass  # Swallow errors raised by open() or read()
+                with open(file_path, "rb") as fd:
+                    digest.update(fd.read())
             except EnvironmentError:
-                pass  # Swallow error raised by os.listdir()
-            finally:
-                self.__deprecated_parameters = deprecated
-        return self.__deprecated_parameters
+                # error ignored
+                pass
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _read_parameter_list(path):
+    parameters = []
+    try:
+        with open(path) as fd:
+            for line in fd:
+                line = line.strip()
+                if line:
+                    parameters.append(line)
+    except EnvironmentError:
+        # error ignored
+        pass
+    return parameters
+
+
+def _read_parameter_dict(path, transform):
+    values = {}
+    try:
+        for name in skonfig.core.listdir(path):
+            try:
+                with open(os.path.join(path, name)) as fd:
+                    values[name] = transform(fd.read())
+            except EnvironmentError:
+                pass  # Swallow errors raised by open() or read()
+    except EnvironmentError:
+        pass  # Swallow error raised by os.listdir()
+    return values
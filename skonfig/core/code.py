@@ -118,22 +118,11 @@ class Code:
 
     def _run_gencode(self, cdist_object, which):
         cdist_type = cdist_object.cdist_type
-        gencode_attr = getattr(cdist_type, 'gencode_{}_path'.format(which))
-        script = os.path.join(self.local.type_path, gencode_attr)
-        if os.path.isdir(script):
-            init = os.path.join(script, "init")
-            if os.path.isfile(init):
-                scripts = [init]
-            else:
-                scripts = []
-                for s in os.listdir(script):
-                    s = os.path.join(script, s)
-                    if os.path.isfile(s):
-                        scripts.append(s)
-                scripts.sort()
-        elif os.path.isfile(script):
-            scripts = [script]
-        else:
+        scripts = [
+            os.path.join(self.local.type_path, script)
+            for script in getattr(
+                cdist_type, 'gencode_{}_scripts'.format(which))]
+        if not scripts:
             return
         env = os.environ.copy()
         env.update(self.env_local)
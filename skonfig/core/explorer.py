@@ -20,12 +20,18 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import concurrent.futures
 import glob
 import logging
 import multiprocessing
 import os
+import pickle
+import shutil
+import sys
+import time
 
 import skonfig
+import skonfig.flock
 import skonfig.logging
 
 from skonfig.mputil import mp_pool_run
@@ -66,7 +72,13 @@ type explorer is:
 
 class Explorer:
     """Executes explorers."""
-    def __init__(self, target_host, local, remote, jobs=None, dry_run=False):
+
+    # name of the file in the working directory the explorer is saved to for
+    # global explorers run on demand
+    STATE_NAME = ".global-explorer-state"
+
+    def __init__(self, target_host, local, remote, jobs=None, dry_run=False,
+                 refresh=False):
         self.target_host = target_host
 
         self._open_logger()
@@ -90,9 +102,17 @@ class Explorer:
         if dry_run:
             self.env['__cdist_dry_run'] = '1'
 
-        self._type_explorers_transferred = []
+        # registry of the type explorers transferred in this run, shared
+        # with the worker processes (cf. transfer_type_explorers)
+        self._type_explorers_transferred = os.path.join(
+            self.local.temp_dir, "type-explorers-transferred")
         self.jobs = jobs
 
+        # cached global explorers: name -> TTL (None: no expiry)
+        self.refresh = refresh
+        self._global_explorer_ttls = self._parse_global_explorer_ttls(
+            self.local.settings.cached_global_explorers or [])
+
     def _open_logger(self):
         self.log = skonfig.logging.getLogger(self.target_host[0])
 
@@ -105,20 +125,42 @@ class Explorer:
     def run_global_explorers(self, out_path):
         """Run global explorers and save output to files in the given
         out_path directory.
+
+        If the eager_global_explorers setting is set, only the explorers
+        listed there are run.  The other explorers are run on first access
+        (cf. global_explorer_output).
         """
         self.log.verbose("Running global explorers")
         self.transfer_global_explorers()
+        global_explorers = self.list_global_explorer_names()
+        eager = self.local.settings.eager_global_explorers
+        if eager is not None:
+            self.log.debug("Deferring global explorers not in: %s",
+                           " ".join(eager))
+            global_explorers = [e for e in global_explorers if e in eager]
+            self.save_state()
+        cached = [
+            e for e in global_explorers
+            if self._use_cached_global_explorer(e, out_path)]
+        if cached:
+            self.log.info("Using cached output of global explorers: %s",
+                          " ".join(cached))
+            global_explorers = [
+                e for e in global_explorers if e not in cached]
         if self.jobs is None:
-            self._run_global_explorers_seq(out_path)
+            self._run_global_explorers_seq(global_explorers, out_path)
         else:
-            self._run_global_explorers_parallel(out_path)
+            self._run_global_explorers_parallel(global_explorers, out_path)
 
     def _run_global_explorer(self, explorer, out_path):
         try:
             path = os.path.join(out_path, explorer)
             output = self.run_global_explorer(explorer)
-            with open(path, 'w') as fd:
+            # write atomically, the output may be read concurrently
+            tmp_path = os.path.join(out_path, ".%s.tmp" % (explorer))
+            with open(tmp_path, 'w') as fd:
                 fd.write(output)
+            os.rename(tmp_path, path)
         except skonfig.Error as e:
             local_path = os.path.join(
                 self.local.global_explorer_path, explorer)
@@ -126,12 +168,12 @@ class Explorer:
             raise skonfig.GlobalExplorerError(
                 explorer, local_path, stderr_path, e)
 
-    def _run_global_explorers_seq(self, out_path):
+    def _run_global_explorers_seq(self, global_explorers, out_path):
         self.log.debug("Running global explorers sequentially")
-        for explorer in self.list_global_explorer_names():
+        for explorer in global_explorers:
             self._run_global_explorer(explorer, out_path)
 
-    def _run_global_explorers_parallel(self, out_path):
+    def _run_global_explorers_parallel(self, global_explorers, out_path):
         self.log.debug(
             "Running global explorers in %s parallel jobs", self.jobs)
         if callable(getattr(multiprocessing, "get_start_method", None)):
@@ -140,14 +182,103 @@ class Explorer:
                 "Multiprocessing start method is %s",
                 multiprocessing.get_start_method())
 
-        global_explorers = self.list_global_explorer_names()
         if global_explorers:
             self.log.trace(
                 "Starting multiprocessing Pool for global explorers run")
             args = [(e, out_path) for e in global_explorers]
-            mp_pool_run(self._run_global_explorer, args, jobs=self.jobs)
+            mp_pool_run(self._run_global_explorer, args, jobs=self.jobs,
+                        recorder=self.local.recorder)
             self.log.trace("Multiprocessing run for global explorers finished")
 
+    def global_explorer_output(self, explorer, out_path):
+        """Return the output of the given global explorer.
+
+        The explorer is run (and its output saved in out_path) if it has
+        not been run yet.  Concurrent first accesses run the explorer only
+        once.
+        """
+        path = os.path.join(out_path, explorer)
+        if not os.path.exists(path):
+            if explorer not in self.list_global_explorer_names():
+                raise skonfig.Error(
+                    "Global explorer %s does not exist" % (explorer))
+            lock_path = os.path.join(
+                self.local.lock_path, "global-explorer-%s.lock" % (explorer))
+            with skonfig.flock.Flock(lock_path):
+                if os.path.exists(path):
+                    pass
+                elif self._use_cached_global_explorer(explorer, out_path):
+                    self.log.info("Using cached output of global explorer: "
+                                  "%s", explorer)
+                else:
+                    self.log.verbose("Running global explorer %s", explorer)
+                    self._run_global_explorer(explorer, out_path)
+        with open(path, 'r') as fd:
+            return fd.read()
+
+    @staticmethod
+    def _parse_global_explorer_ttls(entries):
+        ttls = {}
+        for entry in entries:
+            (name, sep, ttl) = entry.partition(":")
+            if not sep:
+                ttls[name] = None
+                continue
+            try:
+                ttls[name] = int(ttl)
+            except ValueError:
+                raise skonfig.Error(
+                    "Invalid TTL for cached global explorer %s: %s" % (
+                        name, ttl))
+        return ttls
+
+    def _use_cached_global_explorer(self, explorer, out_path):
+        """Copy the output of the given global explorer of the previous run
+        to out_path if it may be reused.
+
+        Returns True if the cached output was used.
+        """
+        if self.refresh or explorer not in self._global_explorer_ttls:
+            return False
+        cached_path = os.path.join(
+            self.local.previous_cache_path, "explorer", explorer)
+        try:
+            age = time.time() - os.stat(cached_path).st_mtime
+        except EnvironmentError:
+            return False
+        ttl = self._global_explorer_ttls[explorer]
+        if ttl is not None and age > ttl:
+            self.log.debug("Cached output of global explorer %s expired",
+                           explorer)
+            return False
+        # keep mtime, so that the TTL is counted from the actual run, and
+        # write atomically, the output may be read concurrently
+        tmp_path = os.path.join(out_path, ".%s.tmp" % (explorer))
+        shutil.copy2(cached_path, tmp_path)
+        os.rename(tmp_path, os.path.join(out_path, explorer))
+        return True
+
+    @property
+    def state_path(self):
+        return os.path.join(self.local.base_path, self.STATE_NAME)
+
+    def save_state(self):
+        """Save this explorer so that global explorers can be run on demand
+        by the skonfig-global-explorer helper command."""
+        with open(self.state_path, 'wb') as fd:
+            pickle.dump(self, fd)
+
+    @classmethod
+    def load_state(cls, base_path):
+        with open(os.path.join(base_path, cls.STATE_NAME), 'rb') as fd:
+            return pickle.load(fd)
+
+    def remove_state(self):
+        try:
+            os.remove(self.state_path)
+        except EnvironmentError:
+            pass
+
     # logger is not pickable, so remove it when we pickle
     def __getstate__(self):
         state = self.__dict__.copy()
@@ -199,20 +330,41 @@ class Explorer:
                        cdist_object.name)
         self.transfer_object_parameters(cdist_object)
         cdist_type = cdist_object.cdist_type
-        for explorer in self.list_type_explorer_names(cdist_type):
+        explorers = sorted(self.list_type_explorer_names(cdist_type))
+
+        def run(explorer):
             self.log.trace("Running type explorer '%s' for object '%s'",
                            explorer, cdist_object.name)
             try:
-                output = self.run_type_explorer(explorer, cdist_object)
-                cdist_object.explorers[explorer] = output
+                if explorer in cdist_type.object_independent_explorers:
+                    return (self._run_object_independent_type_explorer(
+                        explorer, cdist_object), None)
+                return (self.run_type_explorer(explorer, cdist_object), None)
             except skonfig.Error as e:
+                return (None, e)
+
+        jobs = min(self.local.settings.type_explorer_jobs, len(explorers))
+        if jobs > 1:
+            self.log.trace("Running %u type explorers of %s with %u jobs",
+                           len(explorers), cdist_object.name, jobs)
+            with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+                results = list(executor.map(run, explorers))
+        else:
+            # lazy, so that a failing explorer stops the sequence
+            results = map(run, explorers)
+
+        # store outputs and report errors in explorer name order, no matter
+        # in which order the explorers finished
+        for (explorer, (output, error)) in zip(explorers, results):
+            if error is not None:
                 path = os.path.join(self.local.type_path,
                                     cdist_type.explorer_path,
                                     explorer)
                 stderr_path = os.path.join(self.local.stderr_base_path,
                                            "remote")
                 raise skonfig.ObjectExplorerError(
-                    cdist_object, explorer, path, stderr_path, e)
+                    cdist_object, explorer, path, stderr_path, error)
+            cdist_object.explorers[explorer] = output
 
     def run_type_explorer(self, explorer, cdist_object):
         """Run the given type explorer for the given object and
@@ -232,19 +384,97 @@ class Explorer:
                               explorer)
         return self.remote.run_script(script, env=env, return_output=True)
 
+    def _run_object_independent_type_explorer(self, explorer, cdist_object):
+        """Run the given object independent type explorer once per run (for
+        the first object) and return its output.
+
+        The output is shared with the worker processes through the run's
+        temp directory.
+        """
+        cdist_type = cdist_object.cdist_type
+        out_path = os.path.join(
+            self.local.temp_dir, "type-explorer-output", cdist_type.name)
+        os.makedirs(out_path, exist_ok=True)
+        path = os.path.join(out_path, explorer)
+        if not os.path.exists(path):
+            lock_path = os.path.join(out_path, ".%s.lock" % (explorer))
+            with skonfig.flock.Flock(lock_path):
+                if not os.path.exists(path):
+                    output = self.run_type_explorer(explorer, cdist_object)
+                    tmp_path = os.path.join(out_path, ".%s.tmp" % (explorer))
+                    with open(tmp_path, 'w') as fd:
+                        fd.write(output)
+                    os.rename(tmp_path, path)
+                    return output
+        self.log.trace("Reusing output of type explorer '%s' for object "
+                       "'%s'", explorer, cdist_object.name)
+        with open(path, 'r') as fd:
+            return fd.read()
+
+    def _type_explorers_marker(self, cdist_type):
+        # A marker file is created for each type whose explorers have been
+        # transferred, so that worker processes (cf. mp_pool_run) know
+        # about each others' transfers.
+        os.makedirs(self._type_explorers_transferred, exist_ok=True)
+        return os.path.join(
+            self._type_explorers_transferred,
+            "%s-%s" % (cdist_type.name, cdist_type.explorer_digest))
+
+    def prefetch_type_explorers(self, cdist_types):
+        """Transfer the type explorers of all the given types to the target
+        in a single archive.
+
+        Types whose explorers have already been transferred are skipped.
+        If archiving is disabled the explorers are transferred type by type.
+        """
+        pending = sorted(
+            cdist_type for cdist_type in set(cdist_types)
+            if cdist_type.explorers and not os.path.exists(
+                self._type_explorers_marker(cdist_type)))
+        if not pending:
+            return
+        self.log.verbose("Prefetching type explorers of %u types",
+                         len(pending))
+
+        if self.remote.archiving_mode is None:
+            for cdist_type in pending:
+                self.transfer_type_explorers(cdist_type)
+            return
+
+        import skonfig.autil
+
+        # the directories get the same modes as by transfer_type_explorers()
+        tarpath = skonfig.autil.tar_paths(
+            self.local.type_path,
+            [cdist_type.explorer_path for cdist_type in pending],
+            self.remote.archiving_mode, umask=0o077)
+        self.remote.mkdir(self.remote.type_path, umask=0o077)
+        self.remote.transfer_archive(tarpath, self.remote.type_path)
+
+        for cdist_type in pending:
+            open(self._type_explorers_marker(cdist_type), "w").close()
+
     def transfer_type_explorers(self, cdist_type):
         """Transfer the type explorers for the given type to the target."""
-        if cdist_type.explorers:
-            if cdist_type.name in self._type_explorers_transferred:
+        if not cdist_type.explorers:
+            return
+
+        marker = self._type_explorers_marker(cdist_type)
+        lock_path = os.path.join(
+            self._type_explorers_transferred, ".%s.lock" % (cdist_type.name))
+
+        with skonfig.flock.Flock(lock_path):
+            if os.path.exists(marker):
                 self.log.trace("Skipping retransfer of type explorers for: %s",
                                cdist_type)
-            else:
-                source = os.path.join(self.local.type_path,
-                                      cdist_type.explorer_path)
-                destination = os.path.join(self.remote.type_path,
-                                           cdist_type.explorer_path)
-                self.remote.transfer(source, destination, umask=0o077)
-                self._type_explorers_transferred.append(cdist_type.name)
+                return
+
+            source = os.path.join(self.local.type_path,
+                                  cdist_type.explorer_path)
+            destination = os.path.join(self.remote.type_path,
+                                       cdist_type.explorer_path)
+            self.remote.transfer(source, destination, umask=0o077)
+            open(marker, "w").close()
 
     def transfer_object_parameters(self, cdist_object):
         """Transfer the parameters for the given object to the target."""
@@ -254,3 +484,42 @@ class Explorer:
             destination = os.path.join(self.remote.object_path,
                                        cdist_object.parameter_path)
             self.remote.transfer(source, destination)
+
+
+def run_global_explorer_helper(argv):
+    """skonfig-global-explorer explorer...
+
+    Print the output of the given global explorers, running them on the
+    target first if necessary.
+    """
+    if len(argv) < 2:
+        print("usage: %s explorer..." % (os.path.basename(argv[0])),
+              file=sys.stderr)
+        return 2
+
+    try:
+        base_path = os.environ['__global']
+    except KeyError as e:
+        raise skonfig.Error("Missing required environment variable: %s" % (
+            e.args[0]))
+
+    try:
+        explorer = Explorer.load_state(base_path)
+        out_path = explorer.local.global_explorer_out_path
+    except EnvironmentError:
+        # all global explorers have been run eagerly
+        explorer = None
+        out_path = os.path.join(base_path, "explorer")
+
+    for name in argv[1:]:
+        if explorer is not None:
+            output = explorer.global_explorer_output(name, out_path)
+        else:
+            try:
+                with open(os.path.join(out_path, name), 'r') as fd:
+                    output = fd.read()
+            except EnvironmentError:
+                raise skonfig.Error(
+                    "Global explorer %s does not exist" % (name))
+        sys.stdout.write(output)
+    return 0
@@ -51,6 +51,8 @@ common:
         __cdist_type_base_path: absolute path to the directory where types are
                                 defined for use in emulator (local.type_path)
         __files: absolute path to the files/ directory
+        __cdist_lock_path: absolute path to the directory for lock files
+                           (local.lock_path)
         __target_host_tags: empty string (backwards compatibility with cdist)
 
 initial manifest is:
@@ -121,6 +123,10 @@ class Manifest:
             '__target_hostname': self.target_host[1],
             '__target_fqdn': self.target_host[2],
             '__files': self.local.files_path,
+            # records of the run (cf. skonfig.timing.Recorder)
+            '__cdist_timing_records': self.local.recorder.path,
+            # directory for the lock files of the run
+            '__cdist_lock_path': self.local.lock_path,
             '__target_host_tags': '',  # backwards compatibility with cdist
             '__cdist_log_level':
                 skonfig.logging.log_level_env_var_val(self.log),
@@ -196,22 +202,10 @@ class Manifest:
         return env
 
     def run_type_manifest(self, cdist_object):
-        type_manifest = os.path.join(self.local.type_path,
-                                     cdist_object.cdist_type.manifest_path)
-        if os.path.isdir(type_manifest):
-            type_init_manifest = os.path.join(type_manifest, "init")
-            if os.path.isfile(type_init_manifest):
-                type_manifests = [type_init_manifest]
-            else:
-                type_manifests = []
-                for m in os.listdir(type_manifest):
-                    m = os.path.join(type_manifest, m)
-                    if os.path.isfile(m):
-                        type_manifests.append(m)
-                type_manifests.sort()
-        elif os.path.isfile(type_manifest):
-            type_manifests = [type_manifest]
-        else:
+        type_manifests = [
+            os.path.join(self.local.type_path, type_manifest)
+            for type_manifest in cdist_object.cdist_type.manifest_scripts]
+        if not type_manifests:
             return
         message_prefix = cdist_object.name
         which = 'manifest'
@@ -20,7 +20,7 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
-import argparse
+import json
 import os
 import re
 import sys
@@ -29,6 +29,9 @@ import skonfig
 import skonfig.core
 import skonfig.flock
 import skonfig.logging
+import skonfig.profiling
+import skonfig.timing
+import skonfig.util
 
 
 # FileNotFoundError is added in 3.3.
@@ -60,6 +63,16 @@ class DefaultList(list):
             return cls(initial.split('\n'))
 
 
+class Arguments:
+    """Parsed command line arguments (like argparse.Namespace)."""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(
+            "%s=%r" % item for item in sorted(self.__dict__.items())))
+
+
 class Emulator:
     def __init__(self, argv, stdin=sys.stdin.buffer, env=os.environ):
         self.argv = argv
@@ -80,10 +93,14 @@ class Emulator:
             self.object_source = self.env['__cdist_manifest']
             self.type_base_path = self.env['__cdist_type_base_path']
             self.object_marker = self.env['__cdist_object_marker']
+            self.lock_path = self.env['__cdist_lock_path']
 
         except KeyError as e:
             raise MissingRequiredEnvironmentVariableError(e.args[0])
 
+        self.recorder = skonfig.timing.Recorder(
+            self.env.get('__cdist_timing_records'))
+
         self.object_base_path = os.path.join(self.global_path, "object")
         self.typeorder_path = os.path.join(self.global_path, "typeorder")
 
@@ -93,6 +110,8 @@ class Emulator:
             self.global_path, skonfig.core.Manifest.ORDER_DEP_STATE_NAME)
 
         self.type_name = os.path.basename(argv[0])
+        skonfig.core.CdistType.use_index(
+            self.type_base_path, os.path.join(self.global_path, "typeindex"))
         self.cdist_type = skonfig.core.CdistType(
             self.type_base_path, self.type_name)
 
@@ -100,11 +119,29 @@ class Emulator:
 
     def run(self):
         """Emulate type commands (i.e. __file and co)"""
-
+        if '__object_name' in self.env:
+            # run by a type manifest
+            tags = {
+                'phase': 'objects',
+                'object': self.env['__object_name'],
+                'step': 'manifest',
+                }
+        else:
+            tags = {'phase': 'initial_manifest'}
+        with self.recorder.process_span(
+                self.type_name, "emulator", self.argv, **tags), \
+                skonfig.profiling.profiled(self.env.get(
+                    skonfig.profiling.EMULATOR_PROFILE_DIR_ENV), "emulator"):
+            self._run()
+
+    def _run(self):
         self.commandline()
         self.init_object()
 
-        # locking for parallel execution
+        # The lock serialises emulators defining the same object.
+        # Records shared with other objects (typeorder, parent's lists) are
+        # only ever appended to (cf. skonfig.util.append_lines) and thus
+        # need no lock.
         with skonfig.flock.Flock(self.flock_path):
             self.setup_object()
             self.save_stdin()
@@ -140,6 +177,15 @@ class Emulator:
     def commandline(self):
         """Parse command line"""
 
+        self.args = self._parse_args_fast(self.argv[1:])
+        if self.args is None:
+            # And finally parse/verify parameter
+            self.args = self._argument_parser().parse_args(self.argv[1:])
+        self.log.trace('Args: %s', self.args)
+
+    def _argument_parser(self):
+        import argparse
+
         parser = argparse.ArgumentParser(add_help=False,
                                          argument_default=argparse.SUPPRESS)
 
@@ -172,9 +218,103 @@ class Emulator:
         if not self.cdist_type.is_singleton:
             parser.add_argument("object_id", nargs=1)
 
-        # And finally parse/verify parameter
-        self.args = parser.parse_args(self.argv[1:])
-        self.log.trace('Args: %s', self.args)
+        return parser
+
+    def _parser_spec(self):
+        """Return the options accepted by this type as a tuple
+        ({option: (dest, action)}, {dest: default}, [required dest]),
+        i.e. what _argument_parser() would configure argparse with.
+
+        The spec is derived from the type's metadata record (which is loaded
+        from the compiled type index), so no parameter files are read.
+        """
+        cdist_type = self.cdist_type
+        kinds = (
+            (cdist_type.required_parameters, 'store', True),
+            (cdist_type.required_multiple_parameters, 'append', True),
+            (cdist_type.optional_parameters, 'store', False),
+            (cdist_type.optional_multiple_parameters, 'append', False),
+            (cdist_type.boolean_parameters, 'store_const', False),
+            )
+
+        options = {}
+        defaults = {}
+        required = []
+        for (parameters, action, is_required) in kinds:
+            for parameter in parameters:
+                options["--" + parameter] = (parameter, action)
+                if is_required:
+                    required.append(parameter)
+                elif action == 'store':
+                    defaults[parameter] = \
+                        cdist_type.parameter_defaults.get(parameter, None)
+                elif action == 'append':
+                    defaults[parameter] = DefaultList.create(
+                        cdist_type.parameter_defaults.get(parameter, None))
+        if len(options) != sum(len(k[0]) for k in kinds):
+            # duplicate parameter names, let argparse complain
+            return None
+        return (options, defaults, required)
+
+    def _parse_args_fast(self, args):
+        """Parse the command line without argparse.
+
+        Only the unambiguous common cases (--option value, --option=value,
+        --boolean and the object_id) are handled here.  Return None if
+        anything else is encountered (including invalid command lines), in
+        which case argparse should be used to get the exact same results and
+        error messages.
+        """
+        spec = self._parser_spec()
+        if spec is None:
+            return None
+        (options, values, required) = spec
+
+        positionals = []
+        args = iter(args)
+        for arg in args:
+            if not arg.startswith("-"):
+                positionals.append(arg)
+                continue
+
+            (option, has_value, value) = arg.partition("=")
+            if option not in options:
+                # e.g. abbreviations, "--" or a negative number
+                return None
+            (dest, action) = options[option]
+
+            if action == 'store_const':
+                if has_value:
+                    return None
+                values[dest] = ''
+                continue
+
+            if not has_value:
+                value = next(args, None)
+                if value is None or value.startswith("-"):
+                    return None
+
+            if action == 'store':
+                values[dest] = value
+            else:
+                # like argparse, drop a DefaultList default on first use
+                current = values.get(dest)
+                if current is None or isinstance(current, DefaultList):
+                    current = []
+                values[dest] = current + [value]
+
+        if not all(dest in values for dest in required):
+            return None
+
+        if self.cdist_type.is_singleton:
+            if positionals:
+                return None
+        elif len(positionals) == 1:
+            values["object_id"] = positionals
+        else:
+            return None
+
+        return Arguments(**values)
 
     def init_object(self):
         # Initialize object - and ensure it is not in args
@@ -192,7 +332,7 @@ class Emulator:
                      self.object_id + '_' +
                      self.object_marker + '.lock')
         lockfname = lockfname.replace(os.sep, '_')
-        self.flock_path = os.path.join(self.object_base_path, lockfname)
+        self.flock_path = os.path.join(self.lock_path, lockfname)
 
     def _object_params_in_context(self):
         """Get cdist_object parameters dict adopted by context.
@@ -205,18 +345,49 @@ class Emulator:
         is a value of required/optional parameter or if it is one value of
         multiple values parameter.
         """
-        params = {}
         if self.cdist_object.exists:
-            for param in self.cdist_object.parameters:
-                value = ('' if param in self.cdist_type.boolean_parameters
-                         else self.cdist_object.parameters[param])
-                if ((param in self.cdist_type.required_multiple_parameters or
-                     param in self.cdist_type.optional_multiple_parameters) and
-                        not isinstance(value, list)):
-                    value = [value]
-                params[param] = value
+            return self._params_in_context(self.cdist_object.parameters)
+        return {}
+
+    def _params_in_context(self, parameters):
+        params = {}
+        for param in parameters:
+            value = ('' if param in self.cdist_type.boolean_parameters
+                     else parameters[param])
+            if ((param in self.cdist_type.required_multiple_parameters or
+                 param in self.cdist_type.optional_multiple_parameters) and
+                    not isinstance(value, list)):
+                value = [value]
+            params[param] = value
         return params
 
+    @staticmethod
+    def _params_as_stored(parameters):
+        """Return parameters as they will be read back from the object's
+        parameter directory after being stored there (cf.
+        skonfig.util.fsproperty.DirectoryDict)."""
+        params = {}
+        for (param, value) in parameters.items():
+            if isinstance(value, str):
+                if value and value[-1] != '\n':
+                    value += '\n'
+            else:
+                value = ''.join(str(v) + '\n' for v in value)
+            lines = value.splitlines()
+            if not lines:
+                params[param] = ''
+            elif len(lines) == 1:
+                params[param] = lines[0]
+            else:
+                params[param] = lines
+        return params
+
+    @staticmethod
+    def _parameter_digest(params):
+        """Return a digest of params which can be compared instead of the
+        parameter dicts."""
+        return skonfig.util.str_hash(json.dumps(params, sort_keys=True))
+
     def setup_object(self):
         # CDIST_ORDER_DEPENDENCY state
         order_dep_on = self._order_dep_on()
@@ -233,16 +404,22 @@ class Emulator:
                 self.parameters[key] = value
 
         if self.cdist_object.exists and 'CDIST_OVERRIDE' not in self.env:
-            obj_params = self._object_params_in_context()
-            if obj_params != self.parameters:
-                errmsg = ("Object {} already exists with conflicting "
-                          "parameters:\n{}: {}\n{}: {}").format(
-                              self.cdist_object.name,
-                              " ".join(self.cdist_object.source),
-                              obj_params,
-                              self.object_source,
-                              self.parameters)
-                raise skonfig.Error(errmsg)
+            # compare digests first and only load the object's parameters if
+            # they differ (or there is no digest) to produce the error
+            # message
+            digest = self.cdist_object.parameter_digest
+            if not digest or \
+                    digest != self._parameter_digest(self.parameters):
+                obj_params = self._object_params_in_context()
+                if obj_params != self.parameters:
+                    errmsg = ("Object {} already exists with conflicting "
+                              "parameters:\n{}: {}\n{}: {}").format(
+                                  self.cdist_object.name,
+                                  " ".join(self.cdist_object.source),
+                                  obj_params,
+                                  self.object_source,
+                                  self.parameters)
+                    raise skonfig.Error(errmsg)
         else:
             if self.cdist_object.exists:
                 self.log.debug('Object %s override forced with CDIST_OVERRIDE',
@@ -251,12 +428,15 @@ class Emulator:
             else:
                 self.cdist_object.create()
             self.cdist_object.parameters = self.parameters
+            self.cdist_object.parameter_digest = self._parameter_digest(
+                self._params_in_context(
+                    self._params_as_stored(self.parameters)))
         # Do the following recording even if object exists, but with
         # different requirements.
 
         # record the created object in typeorder file
-        with open(self.typeorder_path, 'a') as typeorderfile:
-            print(self.cdist_object.name, file=typeorderfile)
+        skonfig.util.append_lines(
+            self.typeorder_path, (self.cdist_object.name,))
         # record the created object in parent object typeorder file
         __object_name = self.env.get('__object_name', None)
         depname = self.cdist_object.name
@@ -345,8 +525,7 @@ class Emulator:
             pass
 
     def _add_typeorder_dep(self, name):
-        with open(self.typeorder_dep_path, 'a') as f:
-            print(name, file=f)
+        skonfig.util.append_lines(self.typeorder_dep_path, (name,))
 
     def _read_typeorder_dep(self):
         try:
@@ -22,6 +22,7 @@
 #
 
 import datetime
+import json
 import os
 import re
 import shutil
@@ -31,9 +32,11 @@ import tempfile
 import time
 
 import skonfig
+import skonfig.budget
 import skonfig.core
 import skonfig.logging
 import skonfig.message
+import skonfig.timing
 
 import skonfig.exec.util as util
 
@@ -95,10 +98,15 @@ class Local:
 
         self.base_path = os.path.abspath(os.path.join(base_root_path, "work"))
         self.temp_dir = os.path.abspath(os.path.join(base_root_path, "tmp"))
+        # lock files are kept in the temp_dir, so that they are removed at
+        # the end of the run and not saved in the cache
+        self.lock_path = os.path.join(self.temp_dir, "lock")
 
         self.exec_path = exec_path
         self.custom_initial_manifest = initial_manifest
         self.settings = settings
+        # a skonfig.budget.Budget shared with other runs, if any
+        self.budget = None
 
         from skonfig.settings import get_cache_dir
         self.cache_path = get_cache_dir()
@@ -116,6 +124,7 @@ class Local:
         os.umask(0o077)
         self.mkdir(self.base_path)
         self.mkdir(self.temp_dir)
+        self.mkdir(self.lock_path)
 
         # Depending on out_path
         self.bin_path = os.path.join(self.base_path, "bin")
@@ -124,8 +133,13 @@ class Local:
                                                      "explorer")
         self.object_path = os.path.join(self.base_path, "object")
         self.messages_path = os.path.join(self.base_path, "messages")
+        self.type_index_path = os.path.join(self.base_path, "typeindex")
         self.stdout_base_path = os.path.join(self.base_path, "stdout")
         self.stderr_base_path = os.path.join(self.base_path, "stderr")
+        self.timing_path = os.path.join(self.base_path, "timing.json")
+        self.processes_path = os.path.join(self.base_path, "processes.json")
+        self.recorder = skonfig.timing.Recorder(
+            os.path.join(self.temp_dir, "timing-records"))
 
         # Depending on conf_path
         self.files_path = os.path.join(self.conf_path, "files")
@@ -167,6 +181,7 @@ class Local:
             pass
 
         self._link_types_for_emulator()
+        self._compile_type_index()
 
         # create object marker file
         with open(self.object_marker_file, "w") as f:
@@ -215,15 +230,22 @@ class Local:
                 message_prefix, self.messages_path, temp_dir=self.temp_dir)
             env.update(message.env)
 
+        budget_locks = None
         self.log.trace("Local run: %s", shquot.join(command))
         try:
-            if return_output:
-                result = subprocess.check_output(
-                    command, env=env, stderr=stderr).decode()
-            else:
-                subprocess.check_call(
-                    command, env=env, stdout=stdout, stderr=stderr)
-                result = None
+            if self.budget is not None:
+                budget_locks = self.budget.acquire()
+                env[skonfig.budget.HELD_ENV] = "1"
+
+            with self.recorder.process_span(
+                    os.path.basename(command[-1]), "local", command):
+                if return_output:
+                    result = subprocess.check_output(
+                        command, env=env, stderr=stderr).decode()
+                else:
+                    subprocess.check_call(
+                        command, env=env, stdout=stdout, stderr=stderr)
+                    result = None
 
             util.log_std_fd(self.log, command, stderr, 'Local stderr')
             util.log_std_fd(self.log, command, stdout, 'Local stdout')
@@ -234,6 +256,8 @@ class Local:
         except OSError as e:
             raise skonfig.Error("%s: %d" % (" ".join(command), e.errno))
         finally:
+            if budget_locks is not None:
+                self.budget.release(budget_locks)
             if message_prefix:
                 message.merge_messages()
             if close_stdout_afterwards:
@@ -284,6 +308,49 @@ class Local:
             cache_subpath = dt.strftime(cache_subpath)
         return cache_subpath.lstrip(os.sep) or self.hostdir
 
+    @property
+    def previous_cache_path(self):
+        """The cache directory of the previous run (it is not known if the
+        cache path depends on the time or PID)."""
+        return os.path.join(self.cache_path, self._cache_subpath(
+            time.time(), self.settings.cache_path_pattern))
+
+    def cached_type_names(self):
+        """Return the names of the types used in the previous run according
+        to the cache (an empty list if it is not known)."""
+        typeorder_path = os.path.join(self.previous_cache_path, "typeorder")
+        type_names = set()
+        try:
+            with open(typeorder_path, "r") as fd:
+                for line in fd:
+                    if line.strip():
+                        type_names.add(
+                            skonfig.core.CdistObject.split_name(
+                                line.strip())[0])
+        except EnvironmentError:
+            # no previous run (or cache path depends on time/pid)
+            pass
+        return sorted(type_names)
+
+    def cached_object_durations(self):
+        """Return a dict mapping the object names to the number of seconds
+        spent in their steps in the previous run according to the cached
+        timing.json (an empty dict if it is not known)."""
+        path = os.path.join(self.previous_cache_path,
+                            os.path.basename(self.timing_path))
+        try:
+            with open(path, "r") as fd:
+                objects = json.load(fd)["objects"]
+            return {
+                name: float(steps["total"])
+                for (name, steps) in objects.items()}
+        except EnvironmentError:
+            # no previous run (or cache path depends on time/pid)
+            return {}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # timing.json of an incompatible version
+            return {}
+
     def save_cache(self, start_time=time.time()):
         self.log.trace("cache subpath pattern: %s",
                        self.settings.cache_path_pattern)
@@ -300,9 +367,10 @@ class Local:
                 srcentry = os.path.join(self.base_path, direntry)
                 destentry = os.path.join(destination, direntry)
                 try:
-                    if os.path.isdir(destentry):
+                    if os.path.isdir(destentry) \
+                            and not os.path.islink(destentry):
                         shutil.rmtree(destentry)
-                    elif os.path.exists(destentry):
+                    elif os.path.lexists(destentry):
                         os.remove(destentry)
                 except (PermissionError, OSError) as e:
                     raise skonfig.Error(
@@ -351,9 +419,29 @@ class Local:
             # we have no types
             raise NoTypesError(self.conf_dirs)
 
+    def _compile_type_index(self):
+        """Compile type metadata for use in this process and the emulator.
+
+        The index is kept in the cache directory and only compiled again
+        when the types have changed, type_index_path links to it.
+        """
+        self.log.trace("Compiling type index: %s", self.type_index_path)
+        try:
+            index_path = skonfig.core.CdistType.compile_index(
+                self.type_path, os.path.join(self.cache_path, ".typeindex"))
+            os.symlink(index_path, self.type_index_path)
+        except EnvironmentError as e:
+            raise skonfig.Error(
+                "Compiling type index to {} failed: {}".format(
+                    self.type_index_path, e))
+
     def _link_types_for_emulator(self):
         """Link emulator to types"""
         src = os.path.abspath(self.exec_path)
+
+        # helper command to access (lazy) global explorers,
+        # cf. skonfig.core.explorer.run_global_explorer_helper
+        os.symlink(src, os.path.join(self.bin_path, "skonfig-global-explorer"))
         for cdist_type in skonfig.core.CdistType.list_types(self.type_path):
             dst = os.path.join(self.bin_path, cdist_type.name)
             self.log.trace("Linking emulator: %s to %s", src, dst)
@@ -22,14 +22,18 @@
 
 import glob
 import os
+import shutil
 import stat
 import subprocess
+import tarfile
 
 import skonfig
+import skonfig.flock
 import skonfig.logging
+import skonfig.timing
 
 from skonfig.exec import util
-from skonfig.util import (ilistdir, ipaddr, shquot)
+from skonfig.util import (append_lines, ilistdir, ipaddr, shquot)
 
 
 def _wrap_addr(addr):
@@ -54,6 +58,10 @@ class Remote:
 
     All interaction with the target should be done through this class.
     Directly accessing the target from Python code is a bug!
+
+    If session_path is given and max_sessions is set, at most max_sessions
+    commands are run on the target concurrently (by all processes sharing
+    the session_path).
     """
     def __init__(self,
                  target_host,
@@ -61,7 +69,8 @@ class Remote:
                  base_path,
                  settings,
                  stdout_base_path=None,
-                 stderr_base_path=None):
+                 stderr_base_path=None,
+                 session_path=None):
         self.target_host = target_host
         self._exec = shquot.split(remote_exec)
 
@@ -72,6 +81,14 @@ class Remote:
         self.stdout_base_path = stdout_base_path
         self.stderr_base_path = stderr_base_path
 
+        self.session_path = session_path
+        self.max_sessions = None
+        # a skonfig.budget.Budget shared with other runs, if any
+        self.budget = None
+        # a skonfig.timing.Recorder to record the commands (not recording
+        # by default)
+        self.recorder = skonfig.timing.Recorder(None)
+
         self.conf_path = os.path.join(self.base_path, "conf")
         self.object_path = os.path.join(self.base_path, "object")
 
@@ -110,6 +127,49 @@ class Remote:
     def remove_files_dirs(self):
         self.rmdir(self.base_path)
 
+    def probe_max_sessions(self):
+        """Return the MaxSessions option of the target's sshd or None if it
+        cannot be determined.
+        """
+        output = self.run(
+            "PATH=\"${PATH}:/usr/sbin:/sbin\" sshd -T 2>/dev/null"
+            " | awk '$1 == \"maxsessions\" { print $2 }' || :",
+            return_output=True)
+        try:
+            return int(output.strip())
+        except ValueError:
+            return None
+
+    @property
+    def _session_wait_path(self):
+        return os.path.join(self.session_path, "session-wait")
+
+    def _acquire_session(self, command):
+        if self.session_path is None or not self.max_sessions:
+            return None
+        semaphore = skonfig.flock.FlockSemaphore(
+            os.path.join(self.session_path, ".session-%u.lock"),
+            self.max_sessions)
+        (session, waited) = semaphore.acquire()
+        if waited:
+            self.log.trace("Waited %.3fs for a free session for: %s",
+                           waited, shquot.join(command))
+            append_lines(self._session_wait_path, ["%.6f" % (waited)])
+        return session
+
+    def session_wait_stats(self):
+        """Return a tuple (count, seconds) of the number of remote commands
+        which had to wait for a free session and the total time waited.
+        """
+        if self.session_path is None:
+            return (0, 0.0)
+        try:
+            with open(self._session_wait_path) as f:
+                waits = [float(line) for line in f]
+        except EnvironmentError:
+            return (0, 0.0)
+        return (len(waits), sum(waits))
+
     def rmfile(self, path):
         """Remove file on the target."""
         self.log.trace("Remote rm: %s", path)
@@ -143,7 +203,8 @@ class Remote:
             shquot.quote(os.path.dirname(path)),
             opts,
             shquot.quote("./" + os.path.basename(path)))
-        self.run(command)
+        self._run_command(
+            self._exec + [self.target_host[0], command], kind="tar")
 
     def _transfer_file(self, source, destination, umask=None):
         remote_cmd = "cat >%s" % (shquot.quote(destination))
@@ -154,7 +215,8 @@ class Remote:
 
         command = self._exec + [self.target_host[0], remote_cmd]
         with open(source, "r") as f:
-            self._run_command(command, stdin=f)
+            self._run_command(command, stdin=f, kind="transfer",
+                              bytes=os.fstat(f.fileno()).st_size)
 
     def transfer(self, source, destination, jobs=None, umask=None):
         """Transfer a file or directory to the target."""
@@ -178,25 +240,7 @@ class Remote:
                 else:
                     self.log.trace("Archiving mode, tarpath: %s, file count: "
                                    "%s", tarpath, fcnt)
-                    # get archive name
-                    tarname = os.path.basename(tarpath)
-                    self.log.trace("Archiving mode tarname: %s", tarname)
-                    # archive path at the remote
-                    desttarpath = os.path.join(destination, tarname)
-                    self.log.trace("Archiving mode desttarpath: %s",
-                                   desttarpath)
-                    # transfer archive to the target
-                    self.log.trace("Archiving mode: transferring")
-                    self._transfer_file(tarpath, desttarpath)
-                    # extract archive on the target
-                    self.log.trace("Archiving mode: extracting")
-                    self.extract_archive(desttarpath, self.archiving_mode)
-                    # remove remote archive
-                    self.log.trace("Archiving mode: removing remote archive")
-                    self.rmfile(desttarpath)
-                    # remove local archive
-                    self.log.trace("Archiving mode: removing local archive")
-                    os.remove(tarpath)
+                    self.transfer_archive(tarpath, destination)
                     used_archiving = True
             if not used_archiving:
                 self._transfer_dir(source, destination, umask=umask)
@@ -205,6 +249,31 @@ class Remote:
         else:
             self._transfer_file(source, destination, umask=umask)
 
+    def transfer_archive(self, tarpath, destination):
+        """Transfer the (local) archive tarpath to the target and extract it
+        into the existing directory destination.
+
+        The local archive is removed afterwards.
+        """
+        # get archive name
+        tarname = os.path.basename(tarpath)
+        self.log.trace("Archiving mode tarname: %s", tarname)
+        # archive path at the remote
+        desttarpath = os.path.join(destination, tarname)
+        self.log.trace("Archiving mode desttarpath: %s", desttarpath)
+        # transfer archive to the target
+        self.log.trace("Archiving mode: transferring")
+        self._transfer_file(tarpath, desttarpath)
+        # extract archive on the target
+        self.log.trace("Archiving mode: extracting")
+        self.extract_archive(desttarpath, self.archiving_mode)
+        # remove remote archive
+        self.log.trace("Archiving mode: removing remote archive")
+        self.rmfile(desttarpath)
+        # remove local archive
+        self.log.trace("Archiving mode: removing local archive")
+        os.remove(tarpath)
+
     def _transfer_dir(self, source, destination, umask=None):
         for path in ilistdir(source, recursive=False):
             src_path = os.path.join(source, path)
@@ -274,10 +343,26 @@ class Remote:
         return self._run_command(cmd, env=env, return_output=return_output,
                                  stdin=stdin, stdout=stdout, stderr=stderr)
 
+    def _command_environ(self, env):
+        """Return the environment of the process running a command (env is
+        the environment of the command on the target, it is passed in the
+        command by run())."""
+        # export target_host, target_hostname, target_fqdn
+        # for use in __remote_{exec,copy} scripts
+        os_environ = os.environ.copy()
+        os_environ['__target_host'] = self.target_host[0]
+        os_environ['__target_hostname'] = self.target_host[1]
+        os_environ['__target_fqdn'] = self.target_host[2]
+        return os_environ
+
     def _run_command(self, command, env=None, return_output=False,
-                     stdin=None, stdout=None, stderr=None):
+                     stdin=None, stdout=None, stderr=None, kind="remote",
+                     **tags):
         """Run the given command with the given environment.
         Return the output as a string.
+
+        The command is recorded as process of kind with the additional
+        tags (cf. skonfig.timing.Recorder.process_span()).
         """
         assert isinstance(command, (list, tuple)), (
                 "list or tuple argument expected, got: {}".format(command))
@@ -292,23 +377,26 @@ class Remote:
             stderr = util.get_std_fd(self.stderr_base_path, 'remote')
             close_stderr_afterwards = True
 
-        # export target_host, target_hostname, target_fqdn
-        # for use in __remote_{exec,copy} scripts
-        os_environ = os.environ.copy()
-        os_environ['__target_host'] = self.target_host[0]
-        os_environ['__target_hostname'] = self.target_host[1]
-        os_environ['__target_fqdn'] = self.target_host[2]
+        os_environ = self._command_environ(env)
 
+        (session, budget_locks) = (None, None)
         self.log.trace("Remote run: %s", shquot.join(command))
         try:
-            if return_output:
-                output = subprocess.check_output(
-                     command, env=os_environ,
-                     stderr=stderr, stdin=stdin).decode()
-            else:
-                subprocess.check_call(command, env=os_environ, stdin=stdin,
-                                      stdout=stdout, stderr=stderr)
-                output = None
+            session = self._acquire_session(command)
+            if self.budget is not None:
+                budget_locks = self.budget.acquire()
+
+            with self.recorder.process_span(
+                    command[-1][:60], kind, command, **tags):
+                if return_output:
+                    output = subprocess.check_output(
+                         command, env=os_environ,
+                         stderr=stderr, stdin=stdin).decode()
+                else:
+                    subprocess.check_call(
+                        command, env=os_environ, stdin=stdin,
+                        stdout=stdout, stderr=stderr)
+                    output = None
 
             util.log_std_fd(self.log, command, stderr, 'Remote stderr')
             util.log_std_fd(self.log, command, stdout, 'Remote stdout')
@@ -326,6 +414,10 @@ class Remote:
         except UnicodeDecodeError:
             raise DecodeError(command)
         finally:
+            if budget_locks is not None:
+                self.budget.release(budget_locks)
+            if session is not None:
+                session.funlock()
             if close_stdout_afterwards:
                 stdout.close()
             if close_stderr_afterwards:
@@ -333,3 +425,195 @@ class Remote:
                     os.close(stderr)
                 else:
                     stderr.close()
+
+
+class LocalRemote(Remote):
+    """Execute the commands of Remote on this host.
+
+    For targets which are the host skonfig runs on, commands are run
+    directly (without remote_exec and the quoting of the command and its
+    environment) and files are copied instead of transferred.
+    The commands have the same semantics as if run through a remote_exec
+    running them with /bin/sh on this host.
+    """
+    # umask of the commands and files on the target: skonfig itself runs
+    # with umask 077, over remote_exec the login umask of the target applies
+    umask = 0o022
+    # equivalent of remote_exec (the target host argument is dropped)
+    local_exec = (
+        "/bin/sh -c 'shift; umask %04o; exec /bin/sh -c \"$*\"' --" % (umask))
+    local_exec_script = (
+        "#!/bin/sh -e\n"
+        "# run the command on this host like remote_exec on the target\n"
+        "shift\n"
+        "umask %04o\n"
+        "exec /bin/sh -c \"$*\"\n") % (umask)
+
+    def __init__(self,
+                 target_host,
+                 base_path,
+                 settings,
+                 stdout_base_path=None,
+                 stderr_base_path=None,
+                 session_path=None):
+        super().__init__(
+            target_host, self.local_exec, base_path, settings,
+            stdout_base_path=stdout_base_path,
+            stderr_base_path=stderr_base_path,
+            session_path=session_path)
+
+    def _init_env(self):
+        # scripts use $__remote_exec unquoted, so it must not contain
+        # quoted arguments: use a script in the session_path, if any
+        if self.session_path is not None:
+            path = os.path.join(self.session_path, "local-exec")
+            with open(path, "w") as f:
+                f.write(self.local_exec_script)
+            os.chmod(path, 0o755)
+            self._exec = [path]
+        super()._init_env()
+
+    def probe_max_sessions(self):
+        """There is no sshd between skonfig and the target."""
+        return None
+
+    def _native(self, func, *args):
+        try:
+            return func(*args)
+        except EnvironmentError as e:
+            raise skonfig.Error(str(e))
+
+    def rmfile(self, path):
+        """Remove file on the target."""
+        self.log.trace("Local rm: %s", path)
+        if os.path.lexists(path):
+            self._native(os.remove, path)
+
+    def rmdir(self, path):
+        """Remove directory on the target."""
+        self.log.trace("Local rmdir: %s", path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            self._native(shutil.rmtree, path)
+        elif os.path.lexists(path):
+            self._native(os.remove, path)
+
+    def mkdir(self, path, umask=None):
+        """Create directory on the target."""
+        self.log.trace("Local mkdir: %s", path)
+        mode = 0o777 & ~(self.umask if umask is None else umask)
+
+        # like mkdir -p, the missing parents are created with mode, too
+        missing = []
+        head = path
+        while head and not os.path.isdir(head):
+            missing.append(head)
+            head = os.path.dirname(head)
+        for missing_path in reversed(missing):
+            self._native(os.makedirs, missing_path, mode, True)
+            # os.makedirs() applies skonfig's umask
+            self._native(os.chmod, missing_path, mode)
+
+        if umask is not None:
+            self._native(os.chmod, path, mode)
+
+    def _copy_file(self, source, destination, mode=None):
+        if mode is None and not os.path.exists(destination):
+            # like cat > destination on the target
+            mode = 0o666 & ~self.umask
+        with open(source, "rb") as fsrc, open(destination, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+        if mode is not None:
+            os.chmod(destination, mode)
+
+    def _transfer_file(self, source, destination, umask=None):
+        # files are copied, not hard linked, so that changing the files on
+        # the target does not change the source files
+        self.log.trace("Local copy: %s -> %s", source, destination)
+        mode = None
+        if umask is not None:
+            mode = (stat.S_IMODE(os.stat(source).st_mode) & ~umask)
+        self._native(self._copy_file, source, destination, mode)
+
+    def _copy_tree(self, source, destination):
+        for path in ilistdir(source, recursive=False):
+            src_path = os.path.join(source, path)
+            dst_path = os.path.join(destination, path)
+            if os.path.isdir(src_path):
+                if not os.path.isdir(dst_path):
+                    os.mkdir(dst_path)
+                self._copy_tree(src_path, dst_path)
+                shutil.copystat(src_path, dst_path)
+            else:
+                shutil.copy2(src_path, dst_path)
+
+    def transfer(self, source, destination, jobs=None, umask=None):
+        """Transfer a file or directory to the target."""
+        if os.path.isdir(source) and self.archiving_mode is not None:
+            # instead of archiving the directory, copy it like the archive
+            # is extracted (keeping the modes of the files)
+            self.log.trace("Local copy: %s -> %s", source, destination)
+            self.mkdir(destination, umask=umask)
+            self._native(self._copy_tree, source, destination)
+        else:
+            super().transfer(source, destination, jobs=jobs, umask=umask)
+
+    def _extract_file(self, tarpath, destination):
+        with tarfile.open(tarpath, "r:*") as tar:
+            if hasattr(tarfile, "fully_trusted_filter"):
+                # the archives are created by skonfig, extract them as tar
+                # does
+                tar.extractall(destination, filter="fully_trusted")
+            else:
+                tar.extractall(destination)
+
+    def transfer_archive(self, tarpath, destination):
+        """Extract the archive tarpath into the existing directory
+        destination.
+
+        The archive is removed afterwards.
+        """
+        self.log.trace("Local extract archive: %s -> %s",
+                       tarpath, destination)
+        try:
+            self._native(self._extract_file, tarpath, destination)
+        except tarfile.TarError as e:
+            raise skonfig.Error("%s: %s" % (tarpath, e))
+        os.remove(tarpath)
+
+    def run_script(self, script, env=None, return_output=False, stdout=None,
+                   stderr=None):
+        """Run the given script with the given environment on the target.
+        Return the output as a string.
+        """
+        command = [
+            "/bin/sh", "-c", "umask %04o; exec \"$0\" \"$@\"" % (self.umask),
+            self.settings.remote_shell, "-e", script]
+
+        return self._run_command(command, env=env,
+                                 return_output=return_output,
+                                 stdout=stdout, stderr=stderr)
+
+    def run(self, command, env=None, return_output=False,
+            stdin=None, stdout=None, stderr=None):
+        """Run the given command with the given environment on the target.
+        Return the output as a string.
+
+        If command is a list, each item of the list will be quoted if needed.
+        If you need some part not to be quoted (e.g. the component is a glob),
+        pass command as a str instead.
+        """
+        if isinstance(command, (list, tuple)):
+            command = shquot.join(command)
+
+        command = "umask %04o; %s" % (self.umask, command)
+        return self._run_command(["/bin/sh", "-c", command], env=env,
+                                 return_output=return_output,
+                                 stdin=stdin, stdout=stdout, stderr=stderr)
+
+    def _command_environ(self, env):
+        os_environ = super()._command_environ(env)
+        if env:
+            os_environ.update(
+                (name, value if value else "")
+                for (name, value) in env.items())
+        return os_environ
@@ -21,25 +21,29 @@
 
 import fcntl
 import os
+import threading
+import time
 
 import skonfig.logging
 
 
-# FileNotFoundError is added in 3.3.
-if not hasattr(__builtins__, 'FileNotFoundError'):
-    FileNotFoundError = (OSError, IOError)
-
-
 log = skonfig.logging.getLogger('cdist-flock')
 
 
 class Flock():
+    """Exclusive lock on the file at path.
+
+    The lock file is kept after the lock has been released; removing it
+    would allow a process still waiting for the lock on the removed file
+    and a process locking a newly created one to hold the lock at the same
+    time.
+    """
     def __init__(self, path):
         self.path = path
         self.lockfd = None
 
     def flock(self):
-        self.lockfd = open(self.path, 'w+')
+        self.lockfd = open(self.path, 'a')
         try:
             fcntl.flock(self.lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
             log.debug('Acquired lock on %s', self.path)
@@ -48,14 +52,25 @@ class Flock():
             fcntl.flock(self.lockfd, fcntl.LOCK_EX)
             log.debug('Acquired lock on %s', self.path)
 
+    def try_flock(self):
+        """Try to acquire the lock without waiting.
+
+        Return True if the lock has been acquired.
+        """
+        self.lockfd = open(self.path, 'a')
+        try:
+            fcntl.flock(self.lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lockfd.close()
+            self.lockfd = None
+            return False
+        log.debug('Acquired lock on %s', self.path)
+        return True
+
     def funlock(self):
         fcntl.flock(self.lockfd, fcntl.LOCK_UN)
         self.lockfd.close()
         self.lockfd = None
-        try:
-            os.remove(self.path)
-        except FileNotFoundError:
-            pass
         log.debug('Released lock on %s', self.path)
 
     def __enter__(self):
@@ -65,3 +80,39 @@ class Flock():
     def __exit__(self, *args):
         self.funlock()
         return False
+
+
+class FlockSemaphore():
+    """Counting semaphore shared between processes and threads.
+
+    The semaphore consists of count lock files (path_pattern formatted with
+    the slot number). A slot is taken by locking one of these files.
+    """
+    max_delay = 0.05
+
+    def __init__(self, path_pattern, count):
+        self.paths = [path_pattern % (i) for i in range(count)]
+
+    def acquire(self):
+        """Acquire a slot.
+
+        Return a tuple (lock, waited) of the Flock to be released with
+        funlock() and the number of seconds waited for a free slot.
+        """
+        # start at different slots in different processes and threads, so
+        # that usually the first slot tried is free
+        offset = hash((os.getpid(), threading.get_ident()))
+        start_time = time.time()
+        delay = None
+        while True:
+            for i in range(len(self.paths)):
+                lock = Flock(self.paths[(offset + i) % len(self.paths)])
+                if lock.try_flock():
+                    if delay is None:
+                        return (lock, 0.0)
+                    return (lock, time.time() - start_time)
+            if delay is None:
+                log.debug('Waiting for a free slot of %s', self.paths[0])
+                delay = 0.001
+            time.sleep(delay)
+            delay = min(2 * delay, self.max_delay)
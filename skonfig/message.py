@@ -20,26 +20,33 @@
 #
 
 import os
-import shutil
 import tempfile
 
+import skonfig.flock
+
 
 class Message:
-    """Support messaging between types"""
+    """Support messaging between types
+
+    The global messages file is an append-only log: merging messages
+    appends the new lines with a single write. A script is passed a
+    read-only snapshot of the messages merged before it was started as
+    $__messages_in. The snapshots are shared by the scripts started while
+    the log has the same size, so that the log is only copied after it has
+    grown instead of for every script.
+    """
+    snapshot_mode = 0o444
+
     def __init__(self, prefix, messages, temp_dir=None):
         self.prefix = prefix
         self.global_messages = messages
+        self.temp_dir = temp_dir
 
-        (in_fd, self.messages_in) = tempfile.mkstemp(
-            dir=temp_dir, suffix='.message_in')
+        self.messages_in = self._snapshot()
         (out_fd, self.messages_out) = tempfile.mkstemp(
             dir=temp_dir, suffix='.message_out')
-
-        os.close(in_fd)
         os.close(out_fd)
 
-        self._copy_messages()
-
     @property
     def env(self):
         return {
@@ -47,23 +54,57 @@ class Message:
             "__messages_out": self.messages_out,
             }
 
-    def _copy_messages(self):
-        """Copy global contents into our copy"""
-        shutil.copyfile(self.global_messages, self.messages_in)
+    @property
+    def lock_path(self):
+        # in the temp_dir, so that the lock file is removed with it
+        (head, tail) = os.path.split(self.global_messages)
+        return os.path.join(self.temp_dir or head, ".%s.lock" % (tail))
+
+    def _snapshot(self):
+        """Return the path of a read-only copy of the messages merged so
+        far."""
+        size = os.path.getsize(self.global_messages)
+        (head, tail) = os.path.split(self.global_messages)
+        path = os.path.join(self.temp_dir or head, ".%s.%u" % (tail, size))
+        if os.path.exists(path):
+            return path
+
+        # the first size bytes of the log do not change anymore, concurrent
+        # snapshots of the same size are equal
+        (in_fd, tmp_path) = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.message_in')
+        try:
+            with os.fdopen(in_fd, "wb") as messages_in, \
+                    open(self.global_messages, "rb") as global_messages:
+                messages_in.write(global_messages.read(size))
+            os.chmod(tmp_path, self.snapshot_mode)
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
 
     def _cleanup(self):
         """remove temporary files"""
-        if os.path.exists(self.messages_in):
-            os.remove(self.messages_in)
         if os.path.exists(self.messages_out):
             os.remove(self.messages_out)
 
     def _merge_messages(self):
         """merge newly written lines into global file"""
-        with open(self.messages_out) as messages_out, \
-             open(self.global_messages, 'a') as global_messages:
-            for line in messages_out:
-                global_messages.write("%s:%s" % (self.prefix, line))
+        prefix = (self.prefix + ":").encode()
+        with open(self.messages_out, "rb") as messages_out:
+            data = b"".join(prefix + line for line in messages_out)
+        if not data:
+            return
+
+        # the lock serialises merges of parallel scripts
+        with skonfig.flock.Flock(self.lock_path):
+            fd = os.open(self.global_messages, os.O_WRONLY | os.O_APPEND)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
 
     def merge_messages(self):
         self._merge_messages()
@@ -19,12 +19,15 @@
 #
 
 import concurrent.futures as cf
+import functools
 import itertools
 import multiprocessing
 import os
 import signal
+import sys
 
 import skonfig.logging
+import skonfig.profiling
 
 log = skonfig.logging.getLogger("cdist-mputil")
 
@@ -38,13 +41,93 @@ def _mp_run_method(self, fname, *args, **kwargs):
     return getattr(self, fname)(*args, **kwargs)
 
 
-def mp_pool_run(func, args=None, kwds=None, *, jobs=None):
+def _mp_run_traced(recorder, name, func, *args, **kwargs):
+    with recorder.span(name, kind="task"):
+        return func(*args, **kwargs)
+
+
+# True while a worker process runs a job
+_mp_job_running = False
+
+
+def _mp_terminate_job(signum, frame):
+    """SIGTERM handler of the worker processes.
+
+    A running job is stopped with an exception, so that subprocess kills
+    the child process it is waiting for (e.g. ssh or a script) and the
+    job's finally blocks release its sessions and budget slots.
+    Idle workers ignore the signal: a worker killed while waiting for a job
+    may hold the lock of the executor's call queue.
+    """
+    global _mp_job_running
+    if _mp_job_running:
+        _mp_job_running = False
+        raise SystemExit(128 + signum)
+
+
+def _mp_init_worker():
+    signal.signal(signal.SIGTERM, _mp_terminate_job)
+
+
+def _mp_executor(jobs):
+    if sys.version_info >= (3, 7):
+        return cf.ProcessPoolExecutor(jobs, initializer=_mp_init_worker)
+    # without initializer, the handler is set by the first job
+    return cf.ProcessPoolExecutor(jobs)
+
+
+def _mp_run_terminable(func, *args, **kwargs):
+    global _mp_job_running
+    _mp_init_worker()
+    _mp_job_running = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _mp_job_running = False
+
+
+def _mp_run_profiled(directory, func, *args, **kwargs):
+    # pools started by the worker are profiled, too
+    skonfig.profiling.set_profile_dir(directory)
+    with skonfig.profiling.profiled(directory, "worker"):
+        return func(*args, **kwargs)
+
+
+def _mp_wrap(func, recorder, name):
+    """Wrap func to profile it if the run is profiled (cf.
+    skonfig.profiling), to record a span for every instance if recorder
+    (a skonfig.timing.Recorder) is tracing and to stop it on SIGTERM (cf.
+    _mp_fail_fast())."""
+    directory = skonfig.profiling.profile_dir()
+    if directory is not None:
+        func = functools.partial(_mp_run_profiled, directory, func)
+    if recorder is not None and recorder.trace:
+        func = functools.partial(_mp_run_traced, recorder, name, func)
+    return functools.partial(_mp_run_terminable, func)
+
+
+# seconds jobs still running when another job has failed are given to
+# finish
+GRACE_PERIOD = 5
+
+
+def mp_pool_run(func, args=None, kwds=None, *, jobs=None,
+                grace_period=GRACE_PERIOD, recorder=None):
     """Run func using concurrent.futures.ProcessPoolExecutor with jobs jobs
     and supplied iterables of args and kwds with one entry for each
     parallel func instance.
 
+    If an instance fails, the instances not started yet are cancelled and
+    the running ones are terminated after grace_period seconds, then the
+    error is raised.
+
+    If recorder is tracing, the instances are recorded as spans (kind
+    "task") of the worker processes. If the run is profiled, the workers
+    are profiled (cf. skonfig.profiling).
+
     Return list of results.
     """
+    name = getattr(func, "__name__", "task")
     if args and kwds:
         fargs = zip(args, kwds)
     elif args:
@@ -61,15 +144,116 @@ def mp_pool_run(func, args=None, kwds=None, *, jobs=None):
 
         func = _mp_run_method
         fargs = (((fself, fname) + a, k) for (a, k) in fargs)
+    func = _mp_wrap(func, recorder, name)
 
-    with cf.ProcessPoolExecutor(jobs) as executor:
+    with _mp_executor(jobs) as executor:
         try:
-            return [
-                f.result()
-                for f in cf.as_completed(
-                    [executor.submit(func, *a, **k)
-                     for a, k in fargs])
-                ]
+            futures = [executor.submit(func, *a, **k) for a, k in fargs]
+            results = []
+            for f in cf.as_completed(futures):
+                if f.exception() is not None:
+                    _mp_fail_fast(executor, futures, grace_period)
+                results.append(f.result())
+            return results
+        except KeyboardInterrupt:
+            mp_sig_handler(signal.SIGINT, None)
+            raise
+
+
+def _mp_fail_fast(executor, futures, grace_period):
+    """Abort the remaining work of executor after a failure: cancel the
+    futures which have not been started yet and give the running ones
+    grace_period seconds to finish before their worker processes are
+    sent SIGTERM.
+
+    On SIGTERM, a worker stops its job and kills the job's child process
+    (cf. _mp_terminate_job()). Workers which are still running after
+    another grace_period seconds are killed.
+    """
+    for f in futures:
+        f.cancel()
+    running = [f for f in futures if not f.done()]
+    if not running:
+        return
+    log.debug("Waiting up to %us for %u running jobs after failure",
+              grace_period, len(running))
+    (_, not_done) = cf.wait(running, timeout=grace_period)
+    if not_done:
+        log.debug("Terminating %u running jobs after failure",
+                  len(not_done))
+        # ProcessPoolExecutor has no public interface to stop running
+        # jobs, signal its worker processes. _processes (pid -> Process) is
+        # private, but present in all versions of concurrent.futures; if it
+        # is missing, the running jobs are waited for.
+        processes = list((getattr(executor, "_processes", None) or {})
+                         .values())
+        for process in processes:
+            process.terminate()
+        (_, not_done) = cf.wait(not_done, timeout=grace_period)
+        if not_done:
+            for process in processes:
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except EnvironmentError:
+                    # already exited
+                    pass
+
+
+def mp_pool_run_bounded(func, args, groups, limits, *, jobs=None,
+                        grace_period=GRACE_PERIOD, recorder=None):
+    """Run func like mp_pool_run() with jobs jobs and one parallel func
+    instance for each entry of args, but with at most limits[group]
+    instances of the same group (groups[i] is the group of args[i]) running
+    at the same time. Groups not in limits are not limited.
+
+    The instances are started in the order of args, but an instance whose
+    group is at its limit is skipped until an instance of the group has
+    finished, i.e. it does not hold up instances of other groups.
+    Instances are not started anymore after a failure and are traced and
+    profiled like in mp_pool_run().
+
+    Return list of results.
+    """
+    name = getattr(func, "__name__", "task")
+    if hasattr(func, "__self__"):
+        # Special case that wraps bound methods for pickling on Python < 3.3
+        fargs = [
+            (func.__self__, func.__func__.__name__) + tuple(a) for a in args]
+        func = _mp_run_method
+    else:
+        fargs = [tuple(a) for a in args]
+    func = _mp_wrap(func, recorder, name)
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    pending = list(range(len(fargs)))
+    running = {}
+    group_counts = {}
+    results = []
+
+    with _mp_executor(jobs) as executor:
+        try:
+            while pending or running:
+                for i in list(pending):
+                    if len(running) >= jobs:
+                        break
+                    group = groups[i]
+                    limit = limits.get(group)
+                    if limit is not None \
+                            and group_counts.get(group, 0) >= limit:
+                        continue
+                    pending.remove(i)
+                    group_counts[group] = group_counts.get(group, 0) + 1
+                    running[executor.submit(func, *fargs[i])] = group
+
+                (done, _) = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for f in done:
+                    group_counts[running.pop(f)] -= 1
+                    if f.exception() is not None:
+                        _mp_fail_fast(executor, list(running), grace_period)
+                    results.append(f.result())
+            return results
         except KeyboardInterrupt:
             mp_sig_handler(signal.SIGINT, None)
             raise
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import contextlib
+import cProfile
+import glob
+import os
+import pstats
+
+
+# directory to write the profiles of the type emulators to, passed in the
+# environment of the manifests if emulators are to be profiled
+EMULATOR_PROFILE_DIR_ENV = "__cdist_profile_emulator_dir"
+
+MERGED_NAME = "merged.prof"
+
+# (pid, kind) -> cProfile.Profile
+_profiles = {}
+# directory to write the profiles of the main and the worker processes to,
+# kept in this process only and passed to the workers with their tasks
+_directory = None
+
+
+def profile_dir():
+    """Return the directory profiles of this run are written to or None if
+    the run is not profiled."""
+    return _directory
+
+
+def set_profile_dir(directory):
+    """Set the directory profiles of this run are written to, None to stop
+    profiling."""
+    global _directory
+    _directory = directory
+
+
+def _profile(kind):
+    pid = os.getpid()
+    for key in list(_profiles):
+        if key[0] != pid:
+            # inherited from the parent process (fork)
+            _profiles.pop(key).disable()
+    if (pid, kind) not in _profiles:
+        _profiles[(pid, kind)] = cProfile.Profile()
+    return _profiles[(pid, kind)]
+
+
+@contextlib.contextmanager
+def profiled(directory, kind):
+    """Context manager profiling its body if directory is not None.
+
+    The profile of a process is accumulated over all bodies of the same
+    kind and written to <kind>-<pid>.prof in directory after each body.
+    """
+    if directory is None:
+        yield
+        return
+    profile = _profile(kind)
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(
+            os.path.join(directory, "%s-%u.prof" % (kind, os.getpid())))
+
+
+def merge(directory):
+    """Merge the profiles of all processes in directory into merged.prof
+    in directory.
+
+    Return the path of the merged profile or None if there are no
+    profiles.
+    """
+    paths = sorted(
+        path for path in glob.glob(os.path.join(directory, "*.prof"))
+        if os.path.basename(path) != MERGED_NAME)
+    if not paths:
+        return None
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+    merged_path = os.path.join(directory, MERGED_NAME)
+    stats.dump_stats(merged_path)
+    return merged_path
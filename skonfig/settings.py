@@ -117,6 +117,24 @@ class choice_setting(any_setting):
         return value
 
 
+class name_list_setting(any_setting):
+    def transform_store(self, value):
+        value = super().transform_store(value)
+
+        if value is None:
+            return value
+
+        if isinstance(value, str):
+            # names separated by whitespace or commas
+            value = value.replace(",", " ").split()
+        elif isinstance(value, (list, tuple)):
+            value = list(value)
+        else:
+            raise ValueError("invalid value for name list option")
+
+        return value
+
+
 class file_setting(string_setting):
     def transform_store(self, value):
         value = super().transform_store(value)
@@ -161,6 +179,14 @@ class archiving_setting(any_setting):
         return value
 
 
+class prefetch_setting(choice_setting):
+    _choices = ("none", "cache", "all")
+
+
+class transport_setting(choice_setting):
+    _choices = ("ssh", "local")
+
+
 class coloured_output_setting(choice_setting):
     _choices = ("auto", "always", "never")
 
@@ -228,6 +254,33 @@ class jobs_setting(any_setting):
         return value
 
 
+class count_setting(any_setting):
+    def transform_store(self, value):
+        value = super().transform_store(value)
+
+        if value is None:
+            return value
+
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError("value must be an int")
+        elif value < 0:
+            raise ValueError("value must not be negative")
+
+        return value
+
+
+class max_sessions_setting(count_setting):
+    def transform_store(self, value):
+        if value == "auto":
+            return value
+        try:
+            return super().transform_store(value)
+        except ValueError as e:
+            raise ValueError("value must be \"auto\" or an int") from e
+
+
 class search_path_setting(any_setting):
     def __init__(self, *, default=[], doc=None, nullable=False):
         super().__init__(default=default, doc=doc, nullable=nullable)
@@ -248,6 +301,14 @@ class search_path_setting(any_setting):
 
 
 class SettingsContainer:
+    address_cache_ttl = count_setting(
+        nullable=False,
+        default=0,
+        doc="""\
+        Specify the number of seconds for which the resolved addresses
+        (host name and FQDN) of a target are cached.
+        If 0 then the addresses are resolved on every run.
+        """)
     archiving_mode = archiving_setting(
         nullable=True,
         default="tar",
@@ -264,6 +325,16 @@ class SettingsContainer:
         Valid formatter options include:
         ... TODO
         """)
+    cached_global_explorers = name_list_setting(
+        nullable=True,
+        doc="""\
+        List of global explorers (separated by whitespace or commas) whose
+        output of the previous run (according to the cache) is reused
+        instead of running them again.
+        An entry can be given as name:ttl to only reuse output which is at
+        most ttl seconds old.  Otherwise the output is reused until a run
+        with -R.
+        """)
     colored_output = coloured_output_setting(
         nullable=False,
         default="never",
@@ -275,6 +346,16 @@ class SettingsContainer:
         If the value is "auto", colors are enabled if stdout is a TTY unless
         the NO_COLOR (https://no-color.org/) environment variable is defined.
         """)
+    command_budget = count_setting(
+        nullable=False,
+        default=0,
+        doc="""\
+        Specify the maximum number of remote commands and local scripts run
+        concurrently by all skonfig processes of this user (e.g. when
+        configuring many hosts at once).
+        Every running skonfig process gets an equal share of the budget.
+        If 0 then the budget is not limited.
+        """)
     conf_dir = search_path_setting(
         nullable=True,
         doc="""\
@@ -287,6 +368,16 @@ class SettingsContainer:
         in which it is defined will be used.  Consider using a unique prefix
         for your own roles if this can be an issue.
         """)
+    eager_global_explorers = name_list_setting(
+        nullable=True,
+        doc="""\
+        List of global explorers (separated by whitespace or commas) to run
+        before the initial manifest.  If set, all other global explorers
+        are only run when their output is first requested using the
+        skonfig-global-explorer command.
+        If not set, all global explorers are run before the initial
+        manifest.
+        """)
     init_manifest = file_setting(
         nullable=True,
         doc="""\
@@ -313,6 +404,16 @@ class SettingsContainer:
         doc="""\
         Working directory for skonfig on this machine.
         """)
+    prefetch_type_explorers = prefetch_setting(
+        nullable=False,
+        default="none",
+        doc="""\
+        Transfer the explorers of the types likely needed to the target in a
+        single archive while the global explorers run.
+        Recognized values are: "none" (transfer type explorers when they are
+        first needed), "cache" (the types used by the previous run according
+        to the cache), and "all" (all types).
+        """)
     remote_exec = string_setting(
         nullable=True,
         doc="""\
@@ -320,6 +421,16 @@ class SettingsContainer:
 
         By default ssh(1) is used.
         """)
+    remote_max_sessions = max_sessions_setting(
+        nullable=True,
+        doc="""\
+        Specify the maximum number of concurrent remote commands per target.
+        If "auto" then the MaxSessions option of the target's sshd is used
+        (determined by running "sshd -T" on the target, 10 if that fails).
+        If 0 then the number of concurrent remote commands is not limited.
+        If not set, 10 (the default of sshd) is used if skonfig sets up SSH
+        connection multiplexing (i.e. remote_exec is not set), otherwise 0.
+        """)
     remote_out_path = string_setting(
         nullable=False,
         default="/var/lib/skonfig",
@@ -332,6 +443,25 @@ class SettingsContainer:
         doc="""\
         Shell command to use on the remote host for execution of scripts.
         """)
+    remote_transport = transport_setting(
+        nullable=False,
+        default="ssh",
+        doc="""\
+        Specify how commands are run and files are transferred on the
+        target.
+        Recognized values are: "ssh" (using remote_exec) and "local" (the
+        target is this host, commands are run directly and files are
+        copied without remote_exec).
+        """)
+    type_explorer_jobs = jobs_setting(
+        nullable=False,
+        default=1,
+        doc="""\
+        Specify the maximum number of type explorers run concurrently for
+        one object.
+        If -1 then the number of CPUs in this system (maximum: 4) is used.
+        If 1 then the type explorers of an object are run one after another.
+        """)
     verbosity = loglevel_setting(
         nullable=False,
         default="INFO",
@@ -356,17 +486,30 @@ class SettingsContainer:
 
     __config_file_settings_map = {
         # config file option = {setting=name of setting, getf=get func to use}
+        "address_cache_ttl": {"setting": "address_cache_ttl", "getf": "get"},
         "archiving": {"setting": "archiving_mode", "getf": "get"},
         "cache_path_pattern": {"setting": "cache_path_pattern", "getf": "get"},
+        "cached_global_explorers": {
+            "setting": "cached_global_explorers", "getf": "get"},
         "colored_output": {"setting": "colored_output", "getf": "get"},
+        "command_budget": {"setting": "command_budget", "getf": "get"},
         "conf_dir": {"setting": "conf_dir", "getf": "get"},
+        "eager_global_explorers": {
+            "setting": "eager_global_explorers", "getf": "get"},
         "init_manifest": {"setting": "init_manifest", "getf": "get"},
         "jobs": {"setting": "jobs", "getf": "getint"},
         "local_shell": {"setting": "local_shell", "getf": "get"},
         "out_path": {"setting": "out_path", "getf": "get"},
+        "prefetch_type_explorers": {
+            "setting": "prefetch_type_explorers", "getf": "get"},
         "remote_exec": {"setting": "remote_exec", "getf": "get"},
+        "remote_max_sessions": {
+            "setting": "remote_max_sessions", "getf": "get"},
         "remote_out_path": {"setting": "remote_out_path", "getf": "get"},
         "remote_shell": {"setting": "remote_shell", "getf": "get"},
+        "remote_transport": {"setting": "remote_transport", "getf": "get"},
+        "type_explorer_jobs": {
+            "setting": "type_explorer_jobs", "getf": "getint"},
         "verbosity": {"setting": "verbosity", "getf": "get"},
         }
 
@@ -420,8 +563,15 @@ class SettingsContainer:
         'SKONFIG_LOCAL_SHELL': 'local_shell',
         'SKONFIG_REMOTE_SHELL': 'remote_shell',
         'SKONFIG_REMOTE_EXEC': 'remote_exec',
+        'SKONFIG_REMOTE_MAX_SESSIONS': 'remote_max_sessions',
+        'SKONFIG_REMOTE_TRANSPORT': 'remote_transport',
         'SKONFIG_COLORED_OUTPUT': 'colored_output',
+        'SKONFIG_ADDRESS_CACHE_TTL': 'address_cache_ttl',
         'SKONFIG_ARCHIVING': 'archiving_mode',
+        'SKONFIG_COMMAND_BUDGET': 'command_budget',
+        'SKONFIG_PREFETCH_TYPE_EXPLORERS': 'prefetch_type_explorers',
+        'SKONFIG_EAGER_GLOBAL_EXPLORERS': 'eager_global_explorers',
+        'SKONFIG_CACHED_GLOBAL_EXPLORERS': 'cached_global_explorers',
         '__cdist_log_level': 'verbosity',
         }
 
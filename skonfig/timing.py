@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from skonfig.util import (append_lines, shquot)
+
+
+# kinds of the records of external processes (cf. Recorder.process_span())
+PROCESS_KINDS = ("local", "remote", "transfer", "tar", "emulator")
+
+
+class Recorder:
+    """Record timed spans of a run.
+
+    The records are appended to the file at path (one JSON object per line)
+    so that all processes of a run can record into the same file.
+
+    Records are tagged with the phase, object and step of the enclosing
+    spans (the context) of the process. Spans of pool tasks are only
+    recorded if trace is True.
+
+    If path is None, nothing is recorded.
+    """
+    context_tags = ("phase", "object", "step")
+
+    def __init__(self, path, trace=False):
+        self.path = path
+        self.trace = trace
+        self.context = {}
+
+    # the context is specific to a process, only the phase is inherited by
+    # worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["context"] = {
+            k: v for (k, v) in self.context.items() if k == "phase"}
+        return state
+
+    @contextlib.contextmanager
+    def span(self, name, **tags):
+        """Context manager recording the time spent in its body."""
+        saved_context = self.context.copy()
+        for tag in self.context_tags:
+            if tag in tags:
+                self.context[tag] = tags[tag]
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start_time, time.time() - start_time, **tags)
+            self.context = saved_context
+
+    def trace_span(self, name, **tags):
+        """Like span() but only recorded if tracing."""
+        if self.trace:
+            return self.span(name, **tags)
+        return _null_context()
+
+    def process_span(self, name, kind, command, **tags):
+        """Like span() for running an external process of kind (one of
+        PROCESS_KINDS). The command (a list) is only recorded if tracing.
+        """
+        if self.trace:
+            tags["command"] = shquot.join(command)
+        return self.span(name, kind=kind, **tags)
+
+    def add(self, name, start_time, duration, **tags):
+        if self.path is None:
+            return
+        record = dict(self.context)
+        record.update(tags)
+        record.update({
+            "name": name,
+            "start": start_time,
+            "duration": duration,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            })
+        append_lines(self.path, [json.dumps(record, sort_keys=True)])
+
+    def records(self):
+        """Return the list of records."""
+        try:
+            with open(self.path, "r") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+
+@contextlib.contextmanager
+def _null_context():
+    yield
+
+
+def summarise(records, total):
+    """Summarise the records of a run (phase records with kind "phase",
+    object step records with kind "object") into a dict for timing.json.
+    """
+    phases = {}
+    steps = {}
+    objects = {}
+    for record in records:
+        if record.get("kind") == "phase":
+            phases[record["name"]] = (
+                phases.get(record["name"], 0.0) + record["duration"])
+        elif record.get("kind") == "object":
+            steps[record["name"]] = (
+                steps.get(record["name"], 0.0) + record["duration"])
+            object_steps = objects.setdefault(record["object"], {})
+            object_steps[record["name"]] = (
+                object_steps.get(record["name"], 0.0) + record["duration"])
+
+    for object_steps in objects.values():
+        object_steps["total"] = sum(object_steps.values())
+
+    return {
+        "total": total,
+        "phases": phases,
+        "steps": steps,
+        "objects": objects,
+        }
+
+
+def slowest_objects(summary, count=5):
+    """Return a list of (object name, seconds) of the count slowest objects
+    of a summary (cf. summarise())."""
+    return sorted(
+        ((name, steps["total"])
+         for (name, steps) in summary["objects"].items()),
+        key=lambda item: (-item[1], item[0]))[:count]
+
+
+def account(records):
+    """Count the external processes of a run in the records into a dict
+    for processes.json.
+
+    For every kind of process the count, the seconds spent in them and
+    the bytes transferred are summed up for the whole run ("total"), per
+    phase and per object.
+    """
+    total = {}
+    phases = {}
+    objects = {}
+
+    def add(counts, record):
+        kind_counts = counts.setdefault(
+            record["kind"], {"count": 0, "seconds": 0.0, "bytes": 0})
+        kind_counts["count"] += 1
+        kind_counts["seconds"] += record["duration"]
+        kind_counts["bytes"] += record.get("bytes", 0)
+
+    for record in records:
+        if record.get("kind") not in PROCESS_KINDS:
+            continue
+        add(total, record)
+        add(phases.setdefault(record.get("phase", "other"), {}), record)
+        if "object" in record:
+            add(objects.setdefault(record["object"], {}), record)
+
+    return {
+        "total": total,
+        "phases": phases,
+        "objects": objects,
+        }
+
+
+def format_counts(counts):
+    """Format the process counts of one entry of account() for logging."""
+    parts = []
+    for kind in PROCESS_KINDS:
+        if kind not in counts:
+            continue
+        kind_counts = counts[kind]
+        part = "%s %u (%.2fs" % (
+            kind, kind_counts["count"], kind_counts["seconds"])
+        if kind_counts["bytes"]:
+            part += ", %u bytes" % (kind_counts["bytes"])
+        parts.append(part + ")")
+    return ", ".join(parts)
+
+
+def write_trace(records, path, main_pid=None):
+    """Write the records as a trace in the Trace Event Format (which can be
+    loaded in chrome://tracing or Perfetto) to path."""
+    events = []
+    for pid in sorted(set(record["pid"] for record in records)):
+        events.append({
+            "name": "process_name",
+            "ph": "M",
+            "pid": pid,
+            "args": {"name": "skonfig" if pid == main_pid else "worker"},
+            })
+    for record in records:
+        args = {
+            k: v for (k, v) in record.items()
+            if k not in ("name", "start", "duration", "pid", "tid", "kind")}
+        events.append({
+            "name": record["name"],
+            "cat": record.get("kind", ""),
+            "ph": "X",
+            "ts": int(record["start"] * 1000000),
+            "dur": int(record["duration"] * 1000000),
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": args,
+            })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -31,6 +31,24 @@ def str_hash(s):
         raise Error("Param should be string")
 
 
+def append_lines(path, lines):
+    """Append lines to the file at path (creating it if necessary).
+
+    All lines are written with a single write(2) to a file opened with
+    O_APPEND so that appends of concurrent processes do not interleave or
+    get lost.
+    """
+    data = "".join(str(line) + "\n" for line in lines).encode("utf-8")
+    if not data:
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
 def ilistdir(path, recursive=False):
     """Return a directory listing of path as an interator.
 
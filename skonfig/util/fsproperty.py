@@ -21,6 +21,7 @@
 import os
 
 import skonfig
+import skonfig.util
 
 try:
     from collections.abc import (MutableMapping, MutableSequence)
@@ -98,6 +99,18 @@ class FileList(MutableSequence):
         lines.insert(index, value)
         self.__write(lines)
 
+    def append(self, value):
+        # appending does not rewrite the file, so that concurrent appends
+        # (e.g. of parallel emulators) do not get lost
+        self.extend((value,))
+
+    def extend(self, values):
+        try:
+            skonfig.util.append_lines(self.path, values)
+        except EnvironmentError as e:
+            # should never happen
+            raise skonfig.Error(str(e))
+
     def sort(self):
         lines = sorted(self)
         self.__write(lines)
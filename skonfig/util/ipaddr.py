@@ -18,15 +18,79 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import concurrent.futures
+import json
+import os
 import socket
+import tempfile
+import time
 
 import skonfig.logging
 
+from skonfig.util import str_hash
 
-def resolve_target_addresses(host):
-    host_name = resolve_target_host_name(host)
-    host_fqdn = resolve_target_fqdn(host)
-    return (host, host_name, host_fqdn)
+
+# results of resolve_target_addresses() of this process
+_resolved = {}
+
+
+def resolve_target_addresses(host, cache_path=None, ttl=0):
+    """Return a tuple (host, host_name, host_fqdn).
+
+    The results are memoized for the lifetime of the process. If cache_path
+    is given and ttl > 0, results are cached in cache_path for ttl seconds.
+    """
+    if host in _resolved:
+        return _resolved[host]
+
+    addresses = None
+    if cache_path is not None and ttl > 0:
+        addresses = _load_cached_addresses(host, cache_path, ttl)
+    if addresses is None:
+        # the lookups are independent, don't wait for one to finish before
+        # starting the other
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            host_name = executor.submit(resolve_target_host_name, host)
+            host_fqdn = executor.submit(resolve_target_fqdn, host)
+            addresses = (host, host_name.result(), host_fqdn.result())
+        if cache_path is not None and ttl > 0:
+            _save_cached_addresses(addresses, cache_path)
+
+    _resolved[host] = addresses
+    return addresses
+
+
+def _cached_addresses_path(host, cache_path):
+    return os.path.join(cache_path, str_hash(host))
+
+
+def _load_cached_addresses(host, cache_path, ttl):
+    path = _cached_addresses_path(host, cache_path)
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path) as f:
+            addresses = tuple(json.load(f))
+    except (EnvironmentError, ValueError):
+        return None
+    if len(addresses) != 3 or addresses[0] != host:
+        return None
+    log = skonfig.logging.getLogger(host)
+    log.debug("using cached addresses for host \"%s\": %s", host, addresses)
+    return addresses
+
+
+def _save_cached_addresses(addresses, cache_path):
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        (fd, temp_path) = tempfile.mkstemp(prefix=".", dir=cache_path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(addresses, f)
+        os.rename(temp_path, _cached_addresses_path(addresses[0], cache_path))
+    except EnvironmentError as e:
+        log = skonfig.logging.getLogger(addresses[0])
+        log.warning("Cannot cache addresses of host \"%s\": %s",
+                    addresses[0], e)
 
 
 def resolve_target_host_name(host):
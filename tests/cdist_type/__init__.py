@@ -18,8 +18,11 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import json
 import os
+import shutil
 
+import skonfig
 import tests as test
 
 from skonfig import core
@@ -123,6 +126,23 @@ class TypeTestCase(test.SkonfigTestCase):
         cdist_type = core.CdistType(base_path, '__not_nonparallel')
         self.assertFalse(cdist_type.is_nonparallel)
 
+    def test_max_parallel(self):
+        cdist_type = core.CdistType(fixtures, '__max_parallel')
+        self.assertEqual(cdist_type.max_parallel, 3)
+
+    def test_max_parallel_nonparallel(self):
+        cdist_type = core.CdistType(fixtures, '__nonparallel')
+        self.assertEqual(cdist_type.max_parallel, 1)
+
+    def test_max_parallel_unlimited(self):
+        cdist_type = core.CdistType(fixtures, '__not_nonparallel')
+        self.assertIsNone(cdist_type.max_parallel)
+
+    def test_max_parallel_invalid(self):
+        cdist_type = core.CdistType(fixtures, '__max_parallel_invalid')
+        with self.assertRaises(skonfig.Error):
+            cdist_type.max_parallel
+
     def test_deprecated(self):
         base_path = fixtures
         cdist_type = core.CdistType(base_path, '__deprecated')
@@ -153,6 +173,16 @@ class TypeTestCase(test.SkonfigTestCase):
         cdist_type = core.CdistType(base_path, '__without_explorers')
         self.assertEqual(cdist_type.explorers, [])
 
+    def test_explorer_digest(self):
+        base_path = fixtures
+        cdist_type = core.CdistType(base_path, '__with_explorers')
+        cdist_type._CdistType__metadata = None
+        # computed on first use only
+        self.assertNotIn('explorer_digest', cdist_type.metadata)
+        self.assertTrue(cdist_type.explorer_digest)
+        cdist_type = core.CdistType(base_path, '__without_explorers')
+        self.assertIsNone(cdist_type.explorer_digest)
+
     def test_with_required_parameters(self):
         base_path = fixtures
         cdist_type = core.CdistType(base_path, '__with_required_parameters')
@@ -215,3 +245,77 @@ class TypeTestCase(test.SkonfigTestCase):
         self.assertEqual(cdist_type.deprecated_parameters['eggs'],
                          'Deprecated')
         self.assertEqual(cdist_type.deprecated_parameters['spam'], '')
+
+    def test_script_files(self):
+        base_path = fixtures
+        cdist_type = core.CdistType(base_path, '__with_script_files')
+        self.assertEqual(cdist_type.manifest_scripts,
+                         [os.path.join('__with_script_files', 'manifest')])
+        self.assertEqual(cdist_type.gencode_local_scripts,
+                         [os.path.join('__with_script_files',
+                                       'gencode-local')])
+        self.assertEqual(cdist_type.gencode_remote_scripts, [])
+
+    def test_script_dirs(self):
+        base_path = fixtures
+        cdist_type = core.CdistType(base_path, '__with_script_dirs')
+        self.assertEqual(cdist_type.manifest_scripts,
+                         [os.path.join('__with_script_dirs', 'manifest',
+                                       'init')])
+        self.assertEqual(cdist_type.gencode_local_scripts, [])
+        self.assertEqual(cdist_type.gencode_remote_scripts, [
+            os.path.join('__with_script_dirs', 'gencode-remote', '10-first'),
+            os.path.join('__with_script_dirs', 'gencode-remote', '20-second'),
+            ])
+
+    def test_compile_index(self):
+        temp_dir = self.mkdtemp()
+        base_path = op.join(temp_dir, 'type')
+        shutil.copytree(op.join(fixtures, 'list_types'), base_path)
+        index_path = op.join(temp_dir, 'typeindex')
+        try:
+            path = core.CdistType.compile_index(base_path, index_path)
+            self.assertEqual(sorted(os.listdir(path)),
+                             ['__first', '__second', '__third'])
+
+            # unchanged types: the index is reused
+            with test.patch.object(core.CdistType, 'list_types') as m:
+                self.assertEqual(
+                    core.CdistType.compile_index(base_path, index_path), path)
+            m.assert_not_called()
+
+            # changed types: the index is compiled again
+            open(op.join(base_path, '__first', 'singleton'), 'w').close()
+            new_path = core.CdistType.compile_index(base_path, index_path)
+            self.assertNotEqual(new_path, path)
+            self.assertEqual(os.listdir(index_path), [op.basename(new_path)])
+            with open(op.join(new_path, '__first')) as fd:
+                self.assertTrue(json.load(fd)['singleton'])
+        finally:
+            core.CdistType._index_paths.pop(base_path, None)
+            shutil.rmtree(temp_dir)
+
+    def test_metadata_from_index(self):
+        base_path = fixtures
+        index_path = self.mkdtemp()
+        try:
+            with open(op.join(index_path, '__not_singleton'), 'w') as fd:
+                json.dump(dict(
+                    core.CdistType(base_path, '__not_singleton').metadata,
+                    singleton=True), fd)
+            core.CdistType.use_index(base_path, index_path)
+
+            # index entry is used instead of the type directory
+            cdist_type = core.CdistType(base_path, '__not_singleton')
+            cdist_type._CdistType__metadata = None
+            self.assertTrue(cdist_type.is_singleton)
+
+            # no index entry, falls back to the type directory
+            cdist_type = core.CdistType(base_path, '__singleton')
+            cdist_type._CdistType__metadata = None
+            self.assertTrue(cdist_type.is_singleton)
+        finally:
+            core.CdistType._index_paths.pop(base_path, None)
+            core.CdistType(base_path, '__not_singleton') \
+                ._CdistType__metadata = None
+            shutil.rmtree(index_path)
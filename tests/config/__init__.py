@@ -20,11 +20,14 @@
 # along with skonfig. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import json
 import os
+import pstats
 import shutil
 
 import skonfig
 import skonfig.config
+import skonfig.profiling
 import skonfig.core.cdist_type
 import skonfig.core.cdist_object
 import skonfig.util
@@ -116,6 +119,34 @@ class ConfigRunTestCase(test.SkonfigTestCase):
 
         shutil.rmtree(self.temp_dir)
 
+    def dry_run_config(self, initial_manifest=None, local_transport=False,
+                       **kwargs):
+        """Return a Config for a dry run of the initial manifest (the
+        dryrun_manifest fixture by default) with the cache in the temp
+        directory and self.remote (or a LocalRemote if local_transport is
+        True) as the remote. kwargs are passed on to Config.
+        """
+        if initial_manifest is None:
+            initial_manifest = os.path.join(
+                fixtures, "manifest", "dryrun_manifest")
+        local = skonfig.exec.local.Local(
+            self.target_host,
+            self.host_base_path,
+            self.settings,
+            initial_manifest=initial_manifest,
+            exec_path=test.skonfig_exec_path)
+        local.cache_path = os.path.join(self.temp_dir, "cache")
+        if local_transport:
+            remote = skonfig.exec.remote.LocalRemote(
+                self.target_host,
+                self.remote_dir,
+                self.settings,
+                stdout_base_path=local.stdout_base_path,
+                stderr_base_path=local.stderr_base_path)
+        else:
+            remote = self.remote
+        return skonfig.config.Config(local, remote, dry_run=True, **kwargs)
+
     def assertRaisesObjectError(self, original_error, callable_obj):
         """Test if a raised skonfig.ObjectError was caused by the given
         original_error.
@@ -208,6 +239,171 @@ class ConfigRunTestCase(test.SkonfigTestCase):
         dryrun_config.run()
         # if we are here, dry runs work like expected
 
+    def test_timing(self):
+        """Test the timing records of a run"""
+        config = self.dry_run_config()
+        config.run()
+        local = config.local
+
+        with open(os.path.join(local.cache_path, self.target_host[0],
+                               "timing.json")) as f:
+            timing = json.load(f)
+        self.assertEqual(sorted(timing["phases"]), [
+            "cleanup", "global_explorers", "init", "initial_manifest",
+            "objects"])
+        self.assertEqual(list(timing["objects"]), ["__dryrun_test/testit"])
+        self.assertEqual(sorted(timing["objects"]["__dryrun_test/testit"]), [
+            "explorers", "gencode-local", "gencode-remote", "manifest",
+            "total", "transfer"])
+        # the next run weights the objects by their durations in this run
+        self.assertEqual(
+            local.cached_object_durations(),
+            {"__dryrun_test/testit":
+             timing["objects"]["__dryrun_test/testit"]["total"]})
+        self.assertLessEqual(sum(timing["phases"].values()), timing["total"])
+
+    def test_explorer_state_removed_on_error(self):
+        """Test that the explorer state is removed if the run fails"""
+        manifest = os.path.join(self.temp_dir, "manifest")
+        with open(manifest, "w") as f:
+            f.write("exit 1\n")
+        self.settings.eager_global_explorers = []
+
+        config = self.dry_run_config(manifest)
+        with self.assertRaises(skonfig.InitialManifestError):
+            config.run()
+        self.assertFalse(os.path.exists(config.explorer.state_path))
+
+    def test_processes(self):
+        """Test the accounting of the processes of a run"""
+        config = self.dry_run_config()
+        config.run()
+
+        with open(os.path.join(config.local.cache_path, self.target_host[0],
+                               "processes.json")) as f:
+            processes = json.load(f)
+        total = processes["total"]
+        # initial manifest and gencode-{local,remote}
+        self.assertEqual(total["local"]["count"], 3)
+        self.assertEqual(total["emulator"]["count"], 1)
+        self.assertGreater(total["remote"]["count"], 0)
+        self.assertEqual(
+            processes["phases"]["initial_manifest"]["emulator"]["count"], 1)
+        self.assertEqual(
+            processes["phases"]["objects"]["local"]["count"], 2)
+        self.assertEqual(
+            processes["objects"]["__dryrun_test/testit"]["local"]["count"],
+            2)
+        self.assertEqual(
+            sum(counts["remote"]["count"]
+                for counts in processes["phases"].values()
+                if "remote" in counts),
+            total["remote"]["count"])
+
+    def test_local_transport(self):
+        """Test a run using the local transport"""
+        config = self.dry_run_config(local_transport=True)
+        config.run()
+        local = config.local
+
+        with open(os.path.join(local.cache_path, self.target_host[0],
+                               "processes.json")) as f:
+            processes = json.load(f)
+        # files are copied, not transferred by processes
+        self.assertNotIn("transfer", processes["total"])
+        self.assertNotIn("tar", processes["total"])
+        self.assertEqual(processes["total"]["local"]["count"], 3)
+        self.assertTrue(os.path.isdir(os.path.join(
+            local.cache_path, self.target_host[0], "object",
+            "__dryrun_test")))
+
+    def test_trace(self):
+        """Test writing a trace of a run"""
+        trace_path = os.path.join(self.temp_dir, "trace.json")
+
+        config = self.dry_run_config(jobs=2, trace_path=trace_path)
+        config.run()
+
+        with open(trace_path) as f:
+            events = json.load(f)["traceEvents"]
+        spans = [e for e in events if e["ph"] == "X"]
+        categories = set(e["cat"] for e in spans)
+        for category in ("phase", "object", "local", "remote"):
+            self.assertIn(category, categories)
+        gencode_runs = [
+            e for e in spans
+            if e["cat"] == "local"
+            and e["args"].get("step") == "gencode-remote"]
+        self.assertEqual(len(gencode_runs), 1)
+        self.assertEqual(gencode_runs[0]["args"]["object"],
+                         "__dryrun_test/testit")
+        main_pids = [
+            e["pid"] for e in events
+            if e["ph"] == "M" and e["args"]["name"] == "skonfig"]
+        self.assertEqual(main_pids, [os.getpid()])
+
+    def test_profile(self):
+        """Test profiling a run"""
+        profile_path = os.path.join(self.temp_dir, "profile")
+
+        config = self.dry_run_config(
+            profile_path=profile_path, profile_emulator=True)
+        config.run()
+
+        names = os.listdir(profile_path)
+        self.assertIn("skonfig-%u.prof" % (os.getpid()), names)
+        self.assertEqual(
+            len([n for n in names if n.startswith("emulator-")]), 1)
+        stats = pstats.Stats(os.path.join(profile_path, "merged.prof"))
+        self.assertIn("_run", set(
+            function for (_, _, function) in stats.stats))
+        self.assertIsNone(skonfig.profiling.profile_dir())
+        self.assertFalse(any(
+            path == profile_path for path in os.environ.values()))
+
+    def test_prefetch_type_explorers(self):
+        """Test a run with all type explorers prefetched"""
+        # a type with explorers
+        prefetch_conf_dir = os.path.join(self.temp_dir, "conf")
+        explorer_path = os.path.join(
+            prefetch_conf_dir, "type", "__prefetch_test", "explorer")
+        os.makedirs(explorer_path)
+        with open(os.path.join(explorer_path, "name"), "w") as f:
+            f.write("echo name\n")
+        initial_manifest = os.path.join(self.temp_dir, "manifest")
+        with open(initial_manifest, "w") as f:
+            f.write("__prefetch_test a\n__prefetch_test b\n")
+
+        self.settings.conf_dir = [conf_dir, prefetch_conf_dir]
+        self.settings.prefetch_type_explorers = "all"
+        config = self.dry_run_config(initial_manifest)
+
+        remote_explorer_path = os.path.join(
+            self.remote.type_path, "__prefetch_test", "explorer", "name")
+        object_prepare = config.object_prepare
+        prefetched = []
+
+        def check_prefetched(cdist_object, *args, **kwargs):
+            prefetched.append(os.path.exists(remote_explorer_path))
+            return object_prepare(cdist_object, *args, **kwargs)
+
+        transfer = self.remote.transfer
+        transferred = []
+
+        def record_transfer(source, *args, **kwargs):
+            transferred.append(source)
+            return transfer(source, *args, **kwargs)
+
+        config.object_prepare = check_prefetched
+        self.remote.transfer = record_transfer
+        config.run()
+
+        # the explorers are on the target before the objects run and they
+        # are not transferred again by the objects
+        self.assertEqual(prefetched, [True, True])
+        self.assertFalse(
+            [source for source in transferred if "__prefetch_test" in source])
+
     def test_deps_resolver(self):
         """Test to show dependency resolver warning message."""
         local = skonfig.exec.local.Local(
@@ -287,6 +483,97 @@ class ConfigRunTestCase(test.SkonfigTestCase):
         self.assertTrue(has_cycle)
         self.assertGreater(path.count(path[-1]), 1)
 
+    def test_graph_critical_path_lengths(self):
+        # a -> b -> c
+        #           /\
+        #      d ---+
+        graph = {
+            'a': ['b'],
+            'b': ['c'],
+            'c': [],
+            'd': ['c'],
+            }
+        weights = {'b': 5}
+        lengths = skonfig.config.graph_critical_path_lengths(
+            graph, lambda node: weights.get(node, 1))
+        self.assertEqual(lengths, {'a': 1, 'b': 6, 'c': 7, 'd': 1})
+
+    def test_object_priorities(self):
+        graph = {
+            '__first/man': ['__second/on-the'],
+            '__second/on-the': [],
+            '__third/moon': [],
+            '__third/sun': [],
+            }
+        # no previous run, all objects have the same weight
+        self.config._object_durations = {}
+        self.assertEqual(self.config._object_priorities(graph), {
+            '__first/man': 1.0,
+            '__second/on-the': 2.0,
+            '__third/moon': 1.0,
+            '__third/sun': 1.0,
+            })
+
+        # unknown objects are weighted by the average duration of their
+        # type or of all objects
+        self.config._object_durations = {
+            '__first/man': 1.0,
+            '__second/on-the': 2.0,
+            '__third/moon': 12.0,
+            }
+        self.assertEqual(self.config._object_priorities(graph), {
+            '__first/man': 1.0,
+            '__second/on-the': 3.0,
+            '__third/moon': 12.0,
+            '__third/sun': 12.0,
+            })
+
+    def test_resolve_max_sessions(self):
+        probed = []
+
+        def probe_max_sessions():
+            probed.append(True)
+            return 4
+
+        self.remote.probe_max_sessions = probe_max_sessions
+        resolve = skonfig.config.Config._resolve_max_sessions
+        self.assertEqual(resolve(self.settings, self.remote, True), 10)
+        self.assertEqual(resolve(self.settings, self.remote, False), 0)
+        self.assertFalse(probed)
+
+        self.settings.remote_max_sessions = "auto"
+        self.assertEqual(resolve(self.settings, self.remote, True), 4)
+        self.assertTrue(probed)
+        self.settings.remote_max_sessions = 2
+        self.assertEqual(resolve(self.settings, self.remote, True), 2)
+
+    def test_keep_going(self):
+        first = self.object_index['__first/man']
+        second = self.object_index['__second/on-the']
+        third = self.object_index['__third/moon']
+        first.requirements = [second.name]
+
+        object_prepare = self.config.object_prepare
+
+        def failing_object_prepare(cdist_object, *args):
+            if cdist_object.name == second.name:
+                raise skonfig.Error("failed")
+            return object_prepare(cdist_object, *args)
+
+        self.config.object_prepare = failing_object_prepare
+        with self.assertRaises(skonfig.Error):
+            self.config.iterate_until_finished()
+        self.assertNotEqual(third.state, third.STATE_DONE)
+
+        self.config.keep_going = True
+        with self.assertRaises(skonfig.Error) as cm:
+            self.config.iterate_until_finished()
+        self.assertIn(second.name, str(cm.exception))
+        self.assertEqual(self.config.failed_objects(), [second.name])
+        # the independent object is run, the dependent one is not
+        self.assertEqual(third.state, third.STATE_DONE)
+        self.assertEqual(first.state, first.STATE_UNDEF)
+
 
 # Currently the resolving code will simply detect that this object does
 # not exist. It should probably check if the type is a singleton as well
@@ -25,6 +25,7 @@ import logging
 import os
 import random
 import shutil
+import subprocess
 
 import skonfig
 import skonfig.settings
@@ -100,6 +101,16 @@ class EmulatorTestCase(test.SkonfigTestCase):
         emu.run()
         # if we get here all is fine
 
+    def test_lock_path(self):
+        argv = ['__cdist_test_type', 'test_lock_path']
+        emu = emulator.Emulator(argv, env=self.env)
+        emu.run()
+        self.assertEqual(os.path.dirname(emu.flock_path),
+                         self.local.lock_path)
+        self.assertFalse([
+            name for name in os.listdir(self.local.object_path)
+            if name.endswith(".lock")])
+
     def test_requirement_pattern(self):
         argv = ['__cdist_test_type', '/tmp/foobar']
         self.env['require'] = '__file_noop/etc/*'
@@ -199,6 +210,63 @@ class EmulatorTestCase(test.SkonfigTestCase):
         # if we get here all is fine
 
 
+class ConcurrentEmulatorTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+        (handle, self.script) = self.mkstemp(dir=self.temp_dir)
+        os.close(handle)
+        base_path = self.temp_dir
+        hostdir = skonfig.util.str_hash(self.target_host[0])
+        host_base_path = os.path.join(base_path, hostdir)
+
+        self.settings = skonfig.settings.SettingsContainer()
+        self.settings.conf_dir = conf_dirs
+
+        self.local = local.Local(
+            self.target_host,
+            host_base_path,
+            self.settings,
+            exec_path=test.skonfig_exec_path)
+        self.local.create_files_dirs()
+
+        self.manifest = core.Manifest(self.target_host, self.local)
+        self.env = self.manifest.env_initial_manifest(self.script)
+        self.env['__cdist_object_marker'] = self.local.object_marker_name
+        if '__cdist_log_level' in self.env:
+            del self.env['__cdist_log_level']
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_concurrent_children(self):
+        # the type manifest of parent defines many objects concurrently
+        parent = emulator.Emulator(['__file_noop', 'parent'], env=self.env)
+        parent.run()
+        env = self.manifest.env_type_manifest(parent.cdist_object)
+        env['__cdist_object_marker'] = self.local.object_marker_name
+        env.pop('__cdist_log_level', None)
+
+        children = ['child%u' % (i) for i in range(32)]
+        procs = [
+            subprocess.Popen(
+                [os.path.join(self.local.bin_path, '__directory_noop'),
+                 child],
+                env=env, stdin=subprocess.DEVNULL)
+            for child in children]
+        for proc in procs:
+            self.assertEqual(proc.wait(), 0)
+
+        names = ['__directory_noop/' + child for child in children]
+        parent_object = parent.cdist_object
+        self.assertCountEqual(parent_object.children, names)
+        self.assertCountEqual(parent_object.typeorder, names)
+        self.assertCountEqual(parent_object.autorequire, names)
+        with open(os.path.join(self.local.base_path, 'typeorder')) as f:
+            self.assertCountEqual(
+                f.read().splitlines(), ['__file_noop/parent'] + names)
+
+
 class EmulatorConflictingRequirementsTestCase(test.SkonfigTestCase):
 
     def setUp(self):
@@ -559,6 +627,162 @@ class ArgumentsTestCase(test.SkonfigTestCase):
         }
         self.assertEqual(obj_params, obj_params_expected)
 
+    @test.patch.dict("os.environ")
+    def test_parameter_digest(self):
+        type_name = '__arguments_all'
+        object_id = 'some-id'
+        argv = [type_name, object_id, '--opt', 'opt', '--req', 'req',
+                '--bool', '--optmul', 'val1', '--optmul', 'val2',
+                '--reqmul', 'val3', '--reqmul', 'val4',
+                '--optmul1', 'val5', '--reqmul1', 'val6']
+        os.environ.update(self.env)
+        emu = emulator.Emulator(argv)
+        emu.run()
+
+        digest = emu.cdist_object.parameter_digest
+        self.assertTrue(digest)
+        self.assertEqual(
+            digest,
+            emu._parameter_digest(emu._object_params_in_context()))
+
+        # re-declaring the object with the same parameters is fine
+        emu = emulator.Emulator(argv)
+        emu.run()
+
+        # but with different parameters it is not
+        argv[-1] = 'val7'
+        emu = emulator.Emulator(argv)
+        self.assertRaises(skonfig.Error, emu.run)
+
+    @test.patch.dict("os.environ")
+    def test_parameter_digest_missing(self):
+        type_name = '__arguments_optional'
+        object_id = 'some-id'
+        argv = [type_name, object_id, '--optional1', 'value']
+        os.environ.update(self.env)
+        emu = emulator.Emulator(argv)
+        emu.run()
+
+        # objects without a digest are compared parameter by parameter
+        emu.cdist_object.parameter_digest = ''
+        emu = emulator.Emulator(argv)
+        emu.run()
+        emu = emulator.Emulator(argv[:-1] + ['other'])
+        self.assertRaises(skonfig.Error, emu.run)
+
+    def test_params_as_stored(self):
+        params = {
+            'empty': '',
+            'single': 'a',
+            'newline': 'a\n',
+            'lines': 'a\nb\n',
+            'multiple': ['a', 'b'],
+            'multiple_single': ['a'],
+            'multiple_empty': [],
+        }
+        expected = {
+            'empty': '',
+            'single': 'a',
+            'newline': 'a',
+            'lines': ['a', 'b'],
+            'multiple': ['a', 'b'],
+            'multiple_single': 'a',
+            'multiple_empty': '',
+        }
+        self.assertEqual(emulator.Emulator._params_as_stored(params),
+                         expected)
+
+
+class FastArgumentsTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+        base_path = self.temp_dir
+        hostdir = skonfig.util.str_hash(self.target_host[0])
+        host_base_path = os.path.join(base_path, hostdir)
+        (handle, self.script) = self.mkstemp(dir=self.temp_dir)
+        os.close(handle)
+
+        self.settings = skonfig.settings.SettingsContainer()
+        self.settings.conf_dir = conf_dirs
+
+        self.local = local.Local(
+            self.target_host,
+            host_base_path,
+            self.settings,
+            exec_path=test.skonfig_exec_path)
+
+        self.local.create_files_dirs()
+
+        self.manifest = core.Manifest(self.target_host, self.local)
+        self.env = self.manifest.env_initial_manifest(self.script)
+        self.env['__cdist_object_marker'] = self.local.object_marker_name
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assertParsedLikeArgparse(self, argv):
+        emu = emulator.Emulator(argv, env=self.env)
+        fast_args = emu._parse_args_fast(argv[1:])
+        self.assertIsNotNone(fast_args, argv)
+        args = emu._argument_parser().parse_args(argv[1:])
+        self.assertEqual(vars(args), vars(fast_args))
+        for (name, value) in vars(args).items():
+            self.assertIs(type(value), type(vars(fast_args)[name]), name)
+
+    def assertFallback(self, argv):
+        emu = emulator.Emulator(argv, env=self.env)
+        self.assertIsNone(emu._parse_args_fast(argv[1:]), argv)
+
+    def test_like_argparse(self):
+        for argv in (
+                ['__arguments_all', 'id', '--req', 'r', '--reqmul', 'a',
+                 '--reqmul1', 'b'],
+                ['__arguments_all', '--req=r', 'id', '--reqmul', 'a',
+                 '--reqmul', '', '--reqmul1=-b', '--bool', '--bool',
+                 '--opt', 'o', '--opt', 'p', '--optmul', 'c'],
+                ['__argument_defaults', 'some-id'],
+                ['__argument_defaults', 'some-id', '--optional2', 'v'],
+                ['__arguments_multiple_defaults', ''],
+                ['__arguments_multiple_defaults', 'id', '--optmul', 'c',
+                 '--optmul', 'd', '--opt='],
+                ['__arguments_with_dashes', 'id', '--with-dash', 'v w'],
+                ['__test_singleton'],
+                ):
+            self.assertParsedLikeArgparse(argv)
+
+    def test_fallback(self):
+        for argv in (
+                # missing required parameters
+                ['__arguments_all', 'id', '--req', 'r'],
+                # missing or too many object ids
+                ['__arguments_optional', '--optional1', 'v'],
+                ['__arguments_optional', 'a', 'b'],
+                ['__test_singleton', 'id'],
+                # abbreviations and unknown options
+                ['__arguments_optional', 'id', '--opt', 'v'],
+                ['__arguments_optional', 'id', '-o', 'v'],
+                ['__arguments_optional', '--', 'id'],
+                # option values looking like options
+                ['__arguments_optional', 'id', '--optional1', '-1'],
+                ['__arguments_optional', 'id', '--optional1'],
+                ['__arguments_boolean', 'id', '--boolean1=yes'],
+                ):
+            self.assertFallback(argv)
+
+    def test_invalid_command_line(self):
+        argv = ['__arguments_all', 'id', '--req', 'r']
+        emu = emulator.Emulator(argv, env=self.env)
+        with test.patch("sys.stderr", new_callable=io.StringIO):
+            self.assertRaises(SystemExit, emu.commandline)
+
+    def test_default_list(self):
+        argv = ['__arguments_multiple_defaults', 'id']
+        emu = emulator.Emulator(argv, env=self.env)
+        emu.commandline()
+        self.assertIsInstance(emu.args.optmul, emulator.DefaultList)
+        self.assertEqual(emu.args.optmul, ['a', 'b'])
+
 
 class StdinTestCase(test.SkonfigTestCase):
 
@@ -600,6 +824,7 @@ class StdinTestCase(test.SkonfigTestCase):
         os.environ['__cdist_manifest'] = "/cdist-test/path/that/does/not/exist"
         os.environ['__cdist_object_marker'] = self.local.object_marker_name
         os.environ['__cdist_type_base_path'] = self.local.type_path
+        os.environ['__cdist_lock_path'] = self.local.lock_path
         os.environ['__global'] = self.local.base_path
         os.environ['__target_host'] = self.target_host[0]
         os.environ['__target_hostname'] = self.target_host[1]
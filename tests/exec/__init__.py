@@ -20,6 +20,8 @@
 #
 
 from .local import *
+from .session import *
+from .transport import *
 
 
 if __name__ == "__main__":
@@ -22,6 +22,7 @@
 
 import os
 import getpass
+import json
 import shutil
 import string
 import random
@@ -184,6 +185,21 @@ class LocalTestCase(test.SkonfigTestCase):
         self.assertEqual(self.local.run_script(script, return_output=True),
                          "foobar\n")
 
+    def test_run_budget_fail(self):
+        self.local.create_files_dirs()
+
+        class FailingBudget:
+            def acquire(self):
+                raise skonfig.Error("budget")
+
+        self.local.budget = FailingBudget()
+        with self.assertRaises(skonfig.Error):
+            self.local.run([bin_true], message_prefix="test")
+        # the messages of the run are cleaned up
+        self.assertFalse([
+            name for name in os.listdir(self.local.temp_dir)
+            if name.endswith(".message_out")])
+
     def test_mkdir(self):
         temp_dir = self.mkdtemp(dir=self.temp_dir)
         os.rmdir(temp_dir)
@@ -235,6 +251,41 @@ class LocalTestCase(test.SkonfigTestCase):
         for fmt, expected, actual in cases:
             self.assertEqual(expected, actual)
 
+    def test_cached_type_names(self):
+        self.local.cache_path = os.path.join(self.temp_dir, "cache")
+        self.assertEqual(self.local.cached_type_names(), [])
+
+        host_cache_path = os.path.join(
+            self.local.cache_path, self.local.target_host[0])
+        os.makedirs(host_cache_path)
+        with open(os.path.join(host_cache_path, "typeorder"), "w") as f:
+            f.write("__file/etc/motd\n__singleton\n__file/etc/issue\n")
+        self.assertEqual(self.local.cached_type_names(),
+                         ["__file", "__singleton"])
+
+    def test_cached_object_durations(self):
+        self.local.cache_path = os.path.join(self.temp_dir, "cache")
+        self.assertEqual(self.local.cached_object_durations(), {})
+
+        host_cache_path = os.path.join(
+            self.local.cache_path, self.local.target_host[0])
+        os.makedirs(host_cache_path)
+        timing_path = os.path.join(host_cache_path, "timing.json")
+        with open(timing_path, "w") as f:
+            json.dump({"objects": {
+                "__file/etc/motd": {
+                    "explorers": 0.5, "manifest": 1.5, "total": 2.0},
+                "__singleton": {"code-remote": 3.0, "total": 3.0},
+                }}, f)
+        self.assertEqual(self.local.cached_object_durations(), {
+            "__file/etc/motd": 2.0,
+            "__singleton": 3.0,
+            })
+
+        with open(timing_path, "w") as f:
+            f.write("invalid")
+        self.assertEqual(self.local.cached_object_durations(), {})
+
 
 if __name__ == "__main__":
     import unittest
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import subprocess
+import threading
+
+import skonfig.budget
+import skonfig.flock
+import skonfig.settings
+import tests as test
+
+from skonfig.exec import remote
+
+
+class FlockSemaphoreTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_acquire(self):
+        semaphore = skonfig.flock.FlockSemaphore(
+            os.path.join(self.temp_dir, ".slot-%u.lock"), 2)
+        (first, waited) = semaphore.acquire()
+        self.assertEqual(waited, 0.0)
+        (second, waited) = semaphore.acquire()
+        self.assertEqual(waited, 0.0)
+        self.assertNotEqual(first.path, second.path)
+
+        # both slots are taken, a third acquire must wait until one is
+        # released
+        threading.Timer(0.2, first.funlock).start()
+        (third, waited) = semaphore.acquire()
+        self.assertGreater(waited, 0.0)
+        self.assertEqual(third.path, first.path)
+        second.funlock()
+        third.funlock()
+
+
+class BudgetTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+        self.budget_path = os.path.join(self.temp_dir, "budget")
+        self.budgets = {}
+        self.registrations = []
+        for name in ("a", "b"):
+            run_path = os.path.join(self.temp_dir, name)
+            os.makedirs(run_path)
+            self.budgets[name] = skonfig.budget.Budget(
+                self.budget_path, 4, run_path)
+            self.registrations.append(self.budgets[name].register(name))
+
+    def tearDown(self):
+        for registration in self.registrations:
+            skonfig.budget.Budget.unregister(registration)
+        shutil.rmtree(self.temp_dir)
+
+    def test_active_runs(self):
+        budget = self.budgets["a"]
+        # a registration without lock is stale
+        stale_path = os.path.join(budget.runs_path, "c")
+        open(stale_path, "w").close()
+        self.assertEqual(budget.active_runs(), 2)
+        self.assertFalse(os.path.exists(stale_path))
+
+        skonfig.budget.Budget.unregister(self.registrations.pop())
+        budget.recount_interval = 0
+        self.assertEqual(budget.active_runs(), 1)
+        self.assertEqual(os.listdir(budget.runs_path),
+                         [os.path.basename(self.registrations[0].path)])
+
+    def test_active_runs_dead_process(self):
+        budget = self.budgets["a"]
+        budget.recount_interval = 0
+        process = subprocess.Popen(["true"])
+        process.wait()
+        # the registration of a process which does not exist anymore is
+        # stale, even if its lock is held
+        registration = skonfig.flock.Flock(os.path.join(
+            budget.runs_path,
+            "%s:%u:c" % (os.uname()[1], process.pid)))
+        registration.flock()
+        try:
+            self.assertEqual(budget.active_runs(), 2)
+            self.assertFalse(os.path.exists(registration.path))
+        finally:
+            registration.funlock()
+
+    def test_share(self):
+        budget_a = self.budgets["a"]
+        budget_b = self.budgets["b"]
+        # with two active runs, every run gets two of the four slots
+        held_a = [budget_a.acquire(), budget_a.acquire()]
+        held_b = [budget_b.acquire()]
+        self.assertEqual(budget_a.wait_stats(), (0, 0.0))
+        self.assertEqual(budget_b.wait_stats(), (0, 0.0))
+
+        # a slot of the budget is still free, but run a has used its share
+        threading.Timer(0.2, budget_a.release, (held_a.pop(),)).start()
+        held_a.append(budget_a.acquire())
+        self.assertEqual(budget_a.wait_stats()[0], 1)
+        self.assertEqual(budget_b.wait_stats(), (0, 0.0))
+
+        for locks in held_a + held_b:
+            skonfig.budget.Budget.release(locks)
+
+    def test_held(self):
+        os.environ[skonfig.budget.HELD_ENV] = "1"
+        try:
+            self.assertEqual(self.budgets["a"].acquire(), [])
+        finally:
+            del os.environ[skonfig.budget.HELD_ENV]
+
+
+class RemoteSessionTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+        self.session_path = os.path.join(self.temp_dir, "sessions")
+        os.makedirs(self.session_path)
+        std_path = os.path.join(self.temp_dir, "std")
+        os.makedirs(std_path)
+        self.remote = remote.Remote(
+            self.target_host,
+            self.remote_exec,
+            os.path.join(self.temp_dir, "remote"),
+            skonfig.settings.SettingsContainer(),
+            stdout_base_path=std_path,
+            stderr_base_path=std_path,
+            session_path=self.session_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_concurrently(self, count):
+        log_path = os.path.join(self.temp_dir, "log")
+        command = "echo start >>{0}; sleep 0.3; echo end >>{0}".format(
+            log_path)
+        threads = [
+            threading.Thread(target=self.remote.run, args=(command,))
+            for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # determine the maximum number of commands run at the same time
+        (running, max_running) = (0, 0)
+        with open(log_path) as f:
+            for line in f:
+                running += 1 if line.strip() == "start" else -1
+                max_running = max(running, max_running)
+        return max_running
+
+    def test_max_sessions(self):
+        self.remote.max_sessions = 2
+        self.assertEqual(self.run_concurrently(6), 2)
+        (waits, wait_time) = self.remote.session_wait_stats()
+        self.assertGreater(waits, 0)
+        self.assertGreater(wait_time, 0.0)
+
+    def test_unlimited_sessions(self):
+        self.remote.max_sessions = 0
+        self.assertEqual(self.run_concurrently(4), 4)
+        self.assertEqual(self.remote.session_wait_stats(), (0, 0.0))
+        self.assertEqual(os.listdir(self.session_path), [])
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import stat
+import subprocess
+
+import skonfig
+import skonfig.autil
+import skonfig.settings
+import skonfig.timing
+import tests as test
+
+from skonfig.exec import remote
+from skonfig.util import shquot
+
+
+class LocalRemoteTestCase(test.SkonfigTestCase):
+    """Test that LocalRemote behaves like a Remote with a remote_exec
+    running the commands on this host."""
+
+    def setUp(self):
+        # Remote sets __remote_exec in os.environ
+        self.environ = test.patch.dict(os.environ)
+        self.environ.start()
+        # skonfig runs with umask 077 (cf. Local.create_files_dirs())
+        self.umask = os.umask(0o077)
+        self.temp_dir = self.mkdtemp()
+        # like ssh, the remote_exec stub runs the commands with the login
+        # umask of the target
+        remote_exec = os.path.join(self.temp_dir, "remote-exec")
+        self.write_file(remote_exec, (
+            "#!/bin/sh -e\n"
+            "shift\n"
+            "umask 022\n"
+            "exec /bin/sh -c \"$*\"\n"), 0o755)
+        std_path = os.path.join(self.temp_dir, "std")
+        os.makedirs(std_path)
+        self.source_path = os.path.join(self.temp_dir, "source")
+        self.settings = skonfig.settings.SettingsContainer()
+        session_path = os.path.join(self.temp_dir, "session")
+        os.makedirs(session_path)
+
+        self.remotes = {}
+        for (name, cls, args) in [
+                ("exec", remote.Remote, (remote_exec,)),
+                ("local", remote.LocalRemote, ())]:
+            self.remotes[name] = cls(
+                self.target_host, *args,
+                base_path=os.path.join(self.temp_dir, name),
+                settings=self.settings,
+                stdout_base_path=std_path,
+                stderr_base_path=std_path,
+                session_path=session_path)
+            self.remotes[name].create_files_dirs()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        os.umask(self.umask)
+        self.environ.stop()
+
+    def write_file(self, path, content, mode=0o644):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        os.chmod(path, mode)
+
+    def tree(self, path):
+        """Return a dict of the files and directories below path with their
+        modes and contents."""
+        result = {}
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            for name in dirnames + filenames:
+                full_path = os.path.join(dirpath, name)
+                content = None
+                if name in filenames:
+                    with open(full_path) as f:
+                        content = f.read()
+                result[os.path.relpath(full_path, path)] = (
+                    stat.S_IMODE(os.stat(full_path).st_mode), content)
+        return result
+
+    def assertSameResult(self, func):
+        results = {
+            name: func(r, r.base_path) for (name, r) in self.remotes.items()}
+        self.assertEqual(results["local"], results["exec"])
+        return results["local"]
+
+    def test_run(self):
+        for command in [
+                ["echo", "a b", "c'd", "$HOME"],
+                "echo *",
+                "printf '%s\\n' \"${__target_host:?}\""]:
+            self.assertSameResult(
+                lambda r, base: r.run(command, return_output=True))
+
+    def test_run_env(self):
+        env = {
+            "__object": "__file/etc/motd",
+            "quoted": "a 'b' \"c\" $d `e`\nf",
+            "empty": "",
+            }
+        self.assertEqual(
+            self.assertSameResult(
+                lambda r, base: r.run(
+                    "printf '%s|' \"$__object\" \"$quoted\" \"${empty-x}\"",
+                    env=env, return_output=True)),
+            "__file/etc/motd|a 'b' \"c\" $d `e`\nf||")
+
+    def test_run_fail(self):
+        for r in self.remotes.values():
+            with self.assertRaises(skonfig.Error):
+                r.run("exit 3")
+
+    def test_run_script(self):
+        script = os.path.join(self.temp_dir, "script")
+        self.write_file(script, "echo \"$0 $__object\"\nfalse\necho no\n")
+        with self.assertRaises(skonfig.Error):
+            self.remotes["local"].run_script(script)
+        self.write_file(script, "echo \"$__object\" \"$*\"\n")
+        self.assertEqual(
+            self.assertSameResult(
+                lambda r, base: r.run_script(
+                    script, env={"__object": "o"}, return_output=True)),
+            "o \n")
+
+    def test_mkdir_rmdir(self):
+        def mkdir(r, base):
+            r.mkdir(os.path.join(base, "a", "b"), umask=0o027)
+            r.mkdir(os.path.join(base, "a", "b", "c"))
+            r.mkdir(os.path.join(base, "a", "b"), umask=0o077)
+            self.write_file(os.path.join(base, "a", "f"), "f")
+            return self.tree(os.path.join(base, "a"))
+        self.assertEqual(
+            self.assertSameResult(mkdir)[os.path.join("b")][0], 0o700)
+
+        def rmdir(r, base):
+            r.rmdir(os.path.join(base, "a", "b"))
+            r.rmdir(os.path.join(base, "a", "f"))
+            r.rmdir(os.path.join(base, "a", "missing"))
+            r.rmfile(os.path.join(base, "a", "missing"))
+            return self.tree(base)
+        self.assertSameResult(rmdir)
+
+    def test_umask(self):
+        script = os.path.join(self.temp_dir, "script")
+        self.write_file(script, "umask\n")
+        self.assertEqual(
+            self.assertSameResult(
+                lambda r, base: r.run("umask", return_output=True)),
+            "0022\n")
+        self.assertSameResult(
+            lambda r, base: r.run_script(script, return_output=True))
+        self.assertEqual(
+            self.assertSameResult(
+                lambda r, base: subprocess.check_output(
+                    shquot.join(r._exec) + " localhost umask",
+                    shell=True).decode()),
+            "0022\n")
+
+        self.write_file(os.path.join(self.source_path, "f"), "f", 0o666)
+
+        def create(r, base):
+            r.mkdir(os.path.join(base, "a", "b"))
+            r.transfer(os.path.join(self.source_path, "f"),
+                       os.path.join(base, "a", "f"))
+            r.run(["touch", os.path.join(base, "a", "g")])
+            return self.tree(os.path.join(base, "a"))
+        self.assertEqual(self.assertSameResult(create), {
+            "b": (0o755, None),
+            "f": (0o644, "f"),
+            "g": (0o644, ""),
+            })
+
+    def test_transfer(self):
+        self.write_file(os.path.join(self.source_path, "run"), "a", 0o755)
+        self.write_file(os.path.join(self.source_path, "d", "conf"), "b")
+
+        def transfer(r, base):
+            r.rmdir(os.path.join(base, "dir"))
+            r.transfer(self.source_path, os.path.join(base, "dir"),
+                       umask=umask)
+            r.transfer(os.path.join(self.source_path, "run"),
+                       os.path.join(base, "file"), umask=umask)
+            return self.tree(base)
+        for archiving_mode in (self.settings.archiving_mode, None):
+            for r in self.remotes.values():
+                r.archiving_mode = archiving_mode
+            for umask in (None, 0o077):
+                self.assertSameResult(transfer)
+
+    def test_transfer_archive(self):
+        for i in range(skonfig.autil.FILES_LIMIT + 1):
+            self.write_file(
+                os.path.join(self.source_path, "e%u" % (i)), str(i), 0o755)
+
+        def transfer(r, base):
+            r.transfer(self.source_path, os.path.join(base, "dir"))
+            (tarpath, _) = skonfig.autil.tar(
+                self.source_path, skonfig.autil.mode_from_str("tgz"))
+            r.transfer_archive(tarpath, base)
+            self.assertFalse(os.path.exists(tarpath))
+            return self.tree(base)
+        self.assertSameResult(transfer)
+
+    def test_remote_exec_env(self):
+        # scripts run commands on the target with $__remote_exec
+        with test.patch.dict(os.environ):
+            r = remote.LocalRemote(
+                self.target_host,
+                base_path=os.path.join(self.temp_dir, "env"),
+                settings=self.settings,
+                session_path=self.temp_dir)
+            self.assertEqual(
+                subprocess.check_output(
+                    "$__remote_exec localhost 'echo \"$0\" a  b'",
+                    shell=True).decode(),
+                "/bin/sh a b\n")
+            self.assertEqual(
+                os.environ["__remote_exec"], shquot.join(r._exec))
+
+    def test_no_processes(self):
+        r = self.remotes["local"]
+        r.recorder = skonfig.timing.Recorder(
+            os.path.join(self.temp_dir, "records"))
+        self.write_file(os.path.join(self.source_path, "f"), "f")
+        r.transfer(self.source_path, os.path.join(r.base_path, "dir"))
+        r.mkdir(os.path.join(r.base_path, "d"), umask=0o077)
+        r.rmdir(os.path.join(r.base_path, "d"))
+        r.run("true")
+        self.assertEqual(
+            skonfig.timing.account(r.recorder.records())["total"],
+            {"remote": {"count": 1, "seconds": r.recorder.records()[0][
+                "duration"], "bytes": 0}})
+
+
+if __name__ == "__main__":
+    import unittest
+
+    unittest.main()
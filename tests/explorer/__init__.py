@@ -25,6 +25,9 @@ import logging
 import os
 import shlex
 import shutil
+import stat
+import subprocess
+import time
 
 import skonfig
 import skonfig.settings
@@ -35,6 +38,7 @@ import tests as test
 from skonfig import core
 from skonfig.core import explorer
 from skonfig.exec import (local, remote)
+from skonfig.mputil import mp_pool_run
 
 ilistdir = skonfig.util.ilistdir
 
@@ -116,6 +120,83 @@ class ExplorerClassTestCase(test.SkonfigTestCase):
         self.assertEqual(names, output)
         shutil.rmtree(out_path)
 
+    def test_lazy_global_explorers(self):
+        """Ensure only eager global explorers are run upfront"""
+        out_path = self.local.global_explorer_out_path
+        self.settings.eager_global_explorers = ["foobar"]
+
+        self.explorer.run_global_explorers(out_path)
+        self.assertEqual(os.listdir(out_path), ["foobar"])
+        self.assertTrue(os.path.exists(self.explorer.state_path))
+
+        # the other explorers are run on first access
+        output = self.explorer.global_explorer_output('global', out_path)
+        self.assertEqual(output, 'global\n')
+        with open(os.path.join(out_path, 'global')) as fd:
+            self.assertEqual(fd.read(), 'global\n')
+
+        with self.assertRaises(skonfig.Error):
+            self.explorer.global_explorer_output('nonexistent', out_path)
+
+    @test.patch.dict("os.environ")
+    def test_global_explorer_helper(self):
+        out_path = self.local.global_explorer_out_path
+        self.settings.eager_global_explorers = []
+        self.explorer.run_global_explorers(out_path)
+
+        os.environ['__global'] = self.local.base_path
+        output = subprocess.check_output(
+            [os.path.join(self.local.bin_path, "skonfig-global-explorer"),
+             "global", "foobar"],
+            stdin=subprocess.DEVNULL)
+        self.assertEqual(output, b'global\nfoobar\n')
+
+        # once run, the output is available without the state
+        self.explorer.remove_state()
+        output = subprocess.check_output(
+            [os.path.join(self.local.bin_path, "skonfig-global-explorer"),
+             "global"],
+            stdin=subprocess.DEVNULL)
+        self.assertEqual(output, b'global\n')
+
+    def test_cached_global_explorers(self):
+        out_path = self.local.global_explorer_out_path
+        self.local.cache_path = os.path.join(self.temp_dir, "cache")
+        cached_out_path = os.path.join(
+            self.local.previous_cache_path, "explorer")
+        os.makedirs(cached_out_path)
+        for name in ('foobar', 'global'):
+            with open(os.path.join(cached_out_path, name), 'w') as fd:
+                fd.write('cached\n')
+        # global is cached, but expired
+        old = time.time() - 7200
+        os.utime(os.path.join(cached_out_path, 'global'), (old, old))
+
+        self.settings.cached_global_explorers = ["foobar", "global:3600"]
+        expl = explorer.Explorer(self.target_host, self.local, self.remote)
+        with self.assertLogs(expl.log, logging.INFO) as cm:
+            expl.run_global_explorers(out_path)
+        self.assertIn("foobar", "\n".join(cm.output))
+
+        with open(os.path.join(out_path, 'foobar')) as fd:
+            self.assertEqual(fd.read(), 'cached\n')
+        with open(os.path.join(out_path, 'global')) as fd:
+            self.assertEqual(fd.read(), 'global\n')
+        self.assertEqual(
+            [n for n in os.listdir(out_path) if n.endswith('.tmp')], [])
+
+        # refresh
+        expl = explorer.Explorer(self.target_host, self.local, self.remote,
+                                 refresh=True)
+        expl.run_global_explorers(out_path)
+        with open(os.path.join(out_path, 'foobar')) as fd:
+            self.assertEqual(fd.read(), 'foobar\n')
+
+    def test_cached_global_explorers_invalid_ttl(self):
+        self.settings.cached_global_explorers = ["foobar:x"]
+        with self.assertRaises(skonfig.Error):
+            explorer.Explorer(self.target_host, self.local, self.remote)
+
     def test_list_type_explorer_names(self):
         cdist_type = core.CdistType(self.local.type_path, '__test_type')
         expected = cdist_type.explorers
@@ -150,6 +231,71 @@ class ExplorerClassTestCase(test.SkonfigTestCase):
         self.explorer.transfer_type_explorers(cdist_type)
         self.assertFalse(os.listdir(destination))
 
+    def test_transfer_type_explorers_only_once_parallel(self):
+        cdist_type = core.CdistType(self.local.type_path, '__test_type')
+        # transfer in worker processes
+        mp_pool_run(self.explorer.transfer_type_explorers,
+                    [(cdist_type,), (cdist_type,)], jobs=2)
+        destination = os.path.join(self.remote.type_path,
+                                   cdist_type.explorer_path)
+        self.assertTrue(os.listdir(destination))
+        shutil.rmtree(destination)
+        os.makedirs(destination)
+        # the transfer is known to the parent process (and other explorers
+        # of this run)
+        expl = explorer.Explorer(self.target_host, self.local, self.remote)
+        expl.transfer_type_explorers(cdist_type)
+        self.assertFalse(os.listdir(destination))
+
+    def test_prefetch_type_explorers(self):
+        cdist_types = [
+            core.CdistType(self.local.type_path, type_name)
+            for type_name in ('__test_type', '__test_type_hidden_explorer')]
+        self.explorer.prefetch_type_explorers(cdist_types)
+        for cdist_type in cdist_types:
+            source = os.path.join(self.local.type_path,
+                                  cdist_type.explorer_path)
+            destination = os.path.join(self.remote.type_path,
+                                       cdist_type.explorer_path)
+            self.assertEqual(
+                sorted(ilistdir(source, recursive=False)),
+                sorted(os.listdir(destination)))
+            # explorers are not transferred again
+            shutil.rmtree(destination)
+            os.makedirs(destination)
+            self.explorer.transfer_type_explorers(cdist_type)
+            self.assertFalse(os.listdir(destination))
+
+    def test_prefetch_type_explorers_modes(self):
+        cdist_types = [
+            core.CdistType(self.local.type_path, type_name)
+            for type_name in ('__test_type', '__test_type_hidden_explorer')]
+
+        def modes():
+            return {
+                os.path.relpath(os.path.join(dirpath, name),
+                                self.remote.type_path):
+                stat.S_IMODE(os.stat(os.path.join(dirpath, name)).st_mode)
+                for (dirpath, dirnames, filenames) in os.walk(
+                    self.remote.type_path)
+                for name in dirnames + filenames}
+
+        # the usual umask on a target
+        umask = os.umask(0o022)
+        try:
+            self.explorer.prefetch_type_explorers(cdist_types)
+            prefetched = modes()
+
+            self.remote.create_files_dirs()
+            expl = explorer.Explorer(
+                self.target_host, self.local, self.remote)
+            shutil.rmtree(expl._type_explorers_transferred)
+            for cdist_type in cdist_types:
+                expl.transfer_type_explorers(cdist_type)
+        finally:
+            os.umask(umask)
+        self.assertEqual(prefetched, modes())
+
     def test_transfer_object_parameters(self):
         cdist_type = core.CdistType(self.local.type_path, '__test_type')
         cdist_object = core.CdistObject(cdist_type, self.local.object_path,
@@ -187,6 +333,53 @@ class ExplorerClassTestCase(test.SkonfigTestCase):
         self.explorer.run_type_explorers(cdist_object)
         self.assertEqual(cdist_object.explorers, {'world': 'hello'})
 
+    def test_run_object_independent_type_explorers(self):
+        cdist_type = core.CdistType(
+            self.local.type_path, '__test_type_object_independent')
+        self.assertEqual(cdist_type.object_independent_explorers,
+                         ['independent'])
+        for object_id in ('first', 'second'):
+            cdist_object = core.CdistObject(cdist_type, self.local.object_path,
+                                            self.local.object_marker_name,
+                                            object_id)
+            cdist_object.create()
+            self.explorer.run_type_explorers(cdist_object)
+            # object independent explorers are only run for the first object
+            self.assertEqual(cdist_object.explorers, {
+                'dependent': object_id,
+                'independent': 'first',
+                })
+
+    def test_run_type_explorers_concurrently(self):
+        self.settings.type_explorer_jobs = 4
+        cdist_type = core.CdistType(
+            self.local.type_path, '__test_type_object_independent')
+        cdist_object = core.CdistObject(cdist_type, self.local.object_path,
+                                        self.local.object_marker_name,
+                                        'whatever')
+        cdist_object.create()
+        self.explorer.run_type_explorers(cdist_object)
+        self.assertEqual(cdist_object.explorers, {
+            'dependent': 'whatever',
+            'independent': 'whatever',
+            })
+
+    def test_run_type_explorers_error(self):
+        cdist_type = core.CdistType(
+            self.local.type_path, '__test_type_failing_explorers')
+        for jobs in (1, 4):
+            self.settings.type_explorer_jobs = jobs
+            cdist_object = core.CdistObject(cdist_type, self.local.object_path,
+                                            self.local.object_marker_name,
+                                            'jobs%u' % (jobs))
+            cdist_object.create()
+            with self.assertRaises(skonfig.ObjectExplorerError) as cm:
+                self.explorer.run_type_explorers(cdist_object)
+            # the first failing explorer in name order is reported, even
+            # though explorer c fails first when run concurrently
+            self.assertIn("explorer 'b'", str(cm.exception))
+            self.assertEqual(cdist_object.explorers, {'a': 'a'})
+
     def test_jobs_parameter(self):
         self.assertIsNone(self.explorer.jobs)
         expl = explorer.Explorer(
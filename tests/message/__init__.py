@@ -20,7 +20,10 @@
 #
 
 import os
+import shutil
+import stat
 import tempfile
+import threading
 
 import tests as test
 
@@ -41,8 +44,8 @@ class MessageTestCase(test.SkonfigTestCase):
             prefix=self.prefix, messages=self.tempfile, temp_dir=self.tempdir)
 
     def tearDown(self):
-        os.remove(self.tempfile)
         self.message._cleanup()
+        shutil.rmtree(self.tempdir)
 
     def test_env(self):
         """Ensure environment contains __messages_{in,out}."""
@@ -54,18 +57,11 @@ class MessageTestCase(test.SkonfigTestCase):
         self.assertStartsWith(self.message.messages_in, expected_path)
         self.assertStartsWith(self.message.messages_out, expected_path)
 
-    def test_copy_content(self):
-        """Ensure content copying is working."""
-
-        with open(self.tempfile, "w") as f:
-            f.write(self.content)
-
-        self.message._copy_messages()
-
-        with open(self.tempfile, "r") as f:
-            testcontent = f.read()
-
-        self.assertEqual(self.content, testcontent)
+    def test_messages_in_read_only(self):
+        """Ensure the snapshot of the messages is read-only."""
+        self.assertEqual(
+            stat.S_IMODE(os.stat(self.message.messages_in).st_mode),
+            skonfig.message.Message.snapshot_mode)
 
     def test_message_merge_prefix(self):
         """Ensure messages are merged and are prefixed."""
@@ -84,6 +80,74 @@ class MessageTestCase(test.SkonfigTestCase):
 
         self.assertEqual(expectedcontent, testcontent)
 
+    def test_messages_in_snapshot(self):
+        """Ensure __messages_in excludes messages merged later."""
+
+        with open(self.message.messages_out, "w") as fd:
+            fd.write("first\n")
+        self.message.merge_messages()
+
+        message = skonfig.message.Message(
+            prefix="other", messages=self.tempfile, temp_dir=self.tempdir)
+        self.message = skonfig.message.Message(
+            prefix=self.prefix, messages=self.tempfile, temp_dir=self.tempdir)
+        with open(self.message.messages_out, "w") as fd:
+            fd.write("second\n")
+        self.message._merge_messages()
+
+        with open(message.messages_in, "r") as f:
+            self.assertEqual("%s:first\n" % (self.prefix), f.read())
+        # scripts started while no messages were merged share the snapshot
+        self.assertEqual(message.messages_in, self.message.messages_in)
+        with open(self.tempfile, "r") as f:
+            self.assertEqual(
+                "{0}:first\n{0}:second\n".format(self.prefix), f.read())
+        message._cleanup()
+
+    def test_merge_append(self):
+        """Ensure merging appends to the global file in place."""
+
+        inode = os.stat(self.tempfile).st_ino
+        with open(self.message.messages_out, "w") as fd:
+            fd.write("a\nb")
+        self.message._merge_messages()
+        self.assertEqual(inode, os.stat(self.tempfile).st_ino)
+        with open(self.tempfile, "r") as f:
+            self.assertEqual(
+                "{0}:a\n{0}:b".format(self.prefix), f.read())
+
+    def test_merge_nothing(self):
+        """Ensure the global file is left alone if there are no messages."""
+
+        inode = os.stat(self.tempfile).st_ino
+        self.message._merge_messages()
+        self.assertEqual(inode, os.stat(self.tempfile).st_ino)
+
+    def test_parallel_merge(self):
+        """Ensure messages of parallel scripts are not lost."""
+
+        messages = [
+            skonfig.message.Message(
+                prefix="p%u" % (i), messages=self.tempfile,
+                temp_dir=self.tempdir)
+            for i in range(16)]
+        for message in messages:
+            with open(message.messages_out, "w") as fd:
+                fd.write("a\nb\n")
+
+        threads = [
+            threading.Thread(target=message.merge_messages)
+            for message in messages]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with open(self.tempfile, "r") as f:
+            self.assertCountEqual(
+                f.read().splitlines(),
+                ["p%u:%s" % (i, x) for i in range(16) for x in "ab"])
+
 
 if __name__ == '__main__':
     import unittest
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import subprocess
+import time
+
+import skonfig.mputil
+import skonfig.profiling
+import tests as test
+
+
+class MpPoolRunTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_fail_fast(self):
+        """Ensure the remaining jobs are terminated after a failure."""
+        start_time = time.time()
+        with self.assertRaises(subprocess.CalledProcessError):
+            skonfig.mputil.mp_pool_run(
+                subprocess.check_call,
+                [(["sh", "-c", "sleep 0.2; exit 1"],)]
+                + [(["sleep", "30"],)] * 5,
+                jobs=3, grace_period=1)
+        self.assertLess(time.time() - start_time, 10)
+
+    def test_fail_fast_children(self):
+        """Ensure the child processes of the jobs terminated after a
+        failure are killed, too."""
+        pid_path = os.path.join(self.temp_dir, "pid")
+        with self.assertRaises(subprocess.CalledProcessError):
+            skonfig.mputil.mp_pool_run(
+                subprocess.check_call,
+                # exec, so that the pid written is the one of sleep
+                [(["sh", "-c", "echo $$ >%s; exec sleep 30" % (pid_path)],),
+                 (["sh", "-c", "sleep 0.5; exit 1"],)],
+                jobs=2, grace_period=1)
+        with open(pid_path) as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+    def test_profiled(self):
+        """Ensure the jobs are profiled if a profile directory is set."""
+        profile_path = os.path.join(self.temp_dir, "profile")
+        os.makedirs(profile_path)
+        skonfig.profiling.set_profile_dir(profile_path)
+        try:
+            skonfig.mputil.mp_pool_run(
+                subprocess.check_call, [(["true"],)] * 4, jobs=2)
+        finally:
+            skonfig.profiling.set_profile_dir(None)
+        names = os.listdir(profile_path)
+        self.assertTrue(names)
+        self.assertTrue(all(
+            n.startswith("worker-") and n.endswith(".prof") for n in names))
+        self.assertEqual(skonfig.profiling.merge(profile_path),
+                         os.path.join(profile_path, "merged.prof"))
+
+
+class MpPoolRunBoundedTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_limits(self):
+        log_path = os.path.join(self.temp_dir, "log")
+        script = "echo start $0 >>{0}; sleep 0.2; echo end $0 >>{0}".format(
+            log_path)
+        groups = ["a", "a", "a", "b", "b", "c"]
+        skonfig.mputil.mp_pool_run_bounded(
+            subprocess.check_call,
+            [(["sh", "-c", script, g],) for g in groups],
+            groups, {"a": 1, "b": 2}, jobs=4)
+
+        (running, max_running) = ({}, {})
+        with open(log_path) as f:
+            for line in f:
+                (what, group) = line.split()
+                running[group] = running.get(group, 0) + (
+                    1 if what == "start" else -1)
+                max_running[group] = max(
+                    running[group], max_running.get(group, 0))
+        self.assertEqual(max_running["a"], 1)
+        self.assertLessEqual(max_running["b"], 2)
+        # objects of other groups are not held up by group a
+        self.assertEqual(max(max_running.values()), 2)
+
+
+if __name__ == "__main__":
+    import unittest
+
+    unittest.main()
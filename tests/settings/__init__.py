@@ -172,6 +172,54 @@ class JobsSettingTestCase(test.SkonfigTestCase):
             self.assertEqual(self.jobs_setting, 1)
 
 
+class MaxSessionsSettingTestCase(test.SkonfigTestCase):
+    max_sessions_setting = skonfig.settings.max_sessions_setting(
+        nullable=True)
+
+    def test_default(self):
+        self.assertIsNone(self.max_sessions_setting)
+
+    def test_assign_auto(self):
+        self.max_sessions_setting = "auto"
+        self.assertEqual(self.max_sessions_setting, "auto")
+
+    def test_assign_int(self):
+        for (value, expected) in [(0, 0), (10, 10), ("0", 0), ("4", 4)]:
+            self.max_sessions_setting = value
+            self.assertEqual(self.max_sessions_setting, expected)
+
+    def test_assign_invalid(self):
+        for value in [-1, "-1", "many", 1.5, True]:
+            with self.assertRaises(ValueError):
+                self.max_sessions_setting = value
+
+
+class NameListSettingTestCase(test.SkonfigTestCase):
+    names_setting = skonfig.settings.name_list_setting(nullable=True)
+
+    def test_default(self):
+        self.assertIsNone(self.names_setting)
+
+    def test_assign_string(self):
+        self.names_setting = "os"
+        self.assertEqual(self.names_setting, ["os"])
+
+        self.names_setting = "os, os_version  machine"
+        self.assertEqual(self.names_setting, ["os", "os_version", "machine"])
+
+        self.names_setting = ""
+        self.assertEqual(self.names_setting, [])
+
+    def test_assign_list(self):
+        self.names_setting = ("os", "machine")
+        self.assertEqual(self.names_setting, ["os", "machine"])
+
+    def test_assign_other_types(self):
+        for value in [0, 42, 1.414, True]:
+            with self.assertRaises(ValueError):
+                self.names_setting = value
+
+
 class SearchPathSettingTestCase(test.SkonfigTestCase):
     path_setting = skonfig.settings.search_path_setting()
 
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of skonfig.
+#
+# skonfig is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# skonfig is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with skonfig. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+
+import tests as test
+
+from skonfig.util import ipaddr
+
+
+class ResolveTargetAddressesTestCase(test.SkonfigTestCase):
+
+    def setUp(self):
+        self.temp_dir = self.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, "addresses")
+        self.lookups = []
+        ipaddr._resolved.clear()
+
+    def tearDown(self):
+        ipaddr._resolved.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def host_name(self, host):
+        self.lookups.append(("host_name", host))
+        return "name." + host
+
+    def host_fqdn(self, host):
+        self.lookups.append(("fqdn", host))
+        return host + ".example.com"
+
+    def resolve(self, host, **kwargs):
+        with test.patch.object(ipaddr, "resolve_target_host_name",
+                               self.host_name), \
+                test.patch.object(ipaddr, "resolve_target_fqdn",
+                                  self.host_fqdn):
+            return ipaddr.resolve_target_addresses(host, **kwargs)
+
+    def test_resolve(self):
+        self.assertEqual(self.resolve("foo"),
+                         ("foo", "name.foo", "foo.example.com"))
+        self.assertEqual(sorted(self.lookups),
+                         [("fqdn", "foo"), ("host_name", "foo")])
+
+    def test_memoized(self):
+        self.resolve("foo")
+        self.resolve("foo")
+        self.assertEqual(len(self.lookups), 2)
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_cached(self):
+        expected = ("foo", "name.foo", "foo.example.com")
+        self.assertEqual(
+            self.resolve("foo", cache_path=self.cache_path, ttl=60), expected)
+        ipaddr._resolved.clear()
+        self.assertEqual(
+            self.resolve("foo", cache_path=self.cache_path, ttl=60), expected)
+        self.assertEqual(len(self.lookups), 2)
+
+    def test_cache_expired(self):
+        self.resolve("foo", cache_path=self.cache_path, ttl=60)
+        for name in os.listdir(self.cache_path):
+            os.utime(os.path.join(self.cache_path, name), (0, 0))
+        ipaddr._resolved.clear()
+        self.resolve("foo", cache_path=self.cache_path, ttl=60)
+        self.assertEqual(len(self.lookups), 4)